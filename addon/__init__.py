@@ -1,25 +1,68 @@
-from aqt import mw
-from aqt.qt import *
-from anki.hooks import addHook
-from .gui import show_dialog
+import sys
+
+# Only the menu actions are registered at startup. The dialog, the workflow engine and its
+# dependencies (yaml, requests, the scrapers, libs/) are imported the first time they are used.
+
+def running_in_anki():
+    """Anki imports aqt before loading add-ons; the command-line entry point (cli.py) never does."""
+    return 'aqt' in sys.modules and getattr(sys.modules['aqt'], 'mw', None) is not None
 
 def on_notes2flash():
+    from aqt import mw
+    from .config_service import get_config
+    from .gui import show_dialog
+    get_config()  # Loaded here on the main thread; worker threads only read the snapshot
     show_dialog(mw)
 
-action = QAction("Notes2Flash", mw)
-action.triggered.connect(on_notes2flash)
-mw.form.menuTools.addAction(action)
+def on_job_queue():
+    from aqt import mw
+    from .gui import show_job_queue
+    show_job_queue(mw)
+
+def on_profile_did_open():
+    # Resume jobs left in the queue by the last session; this only reads the state database
+    from .job_queue import has_unfinished_jobs
+    if has_unfinished_jobs():
+        from .gui import get_job_runner
+        get_job_runner()
+
+def on_config_updated(config):
+    # Saved in Anki's add-on config dialog: replace the config snapshot the pipeline reads
+    from .config_service import on_addon_config_updated
+    on_addon_config_updated(config)
+
+def init_addon():
+    from aqt import mw, gui_hooks
+    from aqt.qt import QAction
+
+    action = QAction("Notes2Flash", mw)
+    action.triggered.connect(on_notes2flash)
+    mw.form.menuTools.addAction(action)
+
+    queue_action = QAction("Notes2Flash Job Queue", mw)
+    queue_action.triggered.connect(on_job_queue)
+    mw.form.menuTools.addAction(queue_action)
+
+    gui_hooks.profile_did_open.append(on_profile_did_open)
+    mw.addonManager.setConfigUpdatedAction(__name__, on_config_updated)
+    init_config()
 
 # Config handling
 def update_config(new_config):
+    from aqt import mw
     mw.addonManager.writeConfig(__name__, new_config)
 
 def init_config():
+    from aqt import mw
     config = mw.addonManager.getConfig(__name__)
     if config is None:
         config = {}
     if 'openrouter_api_key' not in config:
         config['openrouter_api_key'] = ""
         update_config(config)
+    if 'max_concurrent_jobs' not in config:
+        config['max_concurrent_jobs'] = 2
+        update_config(config)
 
-init_config()
+if running_in_anki():
+    init_addon()
@@ -1,76 +1,77 @@
 import json
-import os
-import yaml
-from aqt import mw
+import threading
+import time
 from anki.notes import Note
+try:
+    from aqt import mw
+except ImportError:
+    mw = None  # Headless runs (see anki_output.py) only have the anki library
 from .logger import get_logger
+from .note_type_templates import get_note_type_template
+from .duplicate_index import content_hash, available_note_guids, load_deck_index, record_added_notes
+from .tracing import span
+from .cancellation import POLL_INTERVAL, CancelledError
 
 logger = get_logger()
 
+UNDO_LABEL = "Notes2Flash: Add Cards"
+
+# Concurrent workflows (job queue, parallel add stages) commit their cards one at a time
+commit_lock = threading.Lock()
+
+def get_collection(col=None):
+    """Return the given collection, or the collection of the open Anki profile."""
+    if col is not None:
+        return col
+    if mw is None or mw.col is None:
+        raise RuntimeError("No Anki collection is open. Pass a collection or open a profile in Anki.")
+    return mw.col
+
 def load_note_type_template(note_type_name):
-    """Load a note type template from the included_note_types directory."""
+    """Look up a note type template from the included_note_types directory."""
     logger.info(f"Looking for note type template: {note_type_name}")
-    
-    # Get the addon directory path
-    addon_dir = os.path.dirname(os.path.abspath(__file__))
-    templates_dir = os.path.join(addon_dir, "included_note_types")
-    
-    # Convert note type name to lowercase for case-insensitive comparison
-    note_type_name_lower = note_type_name.lower()
-    
-    # Search through all YAML files in the templates directory
-    for filename in os.listdir(templates_dir):
-        if filename.endswith('.yml'):
-            template_path = os.path.join(templates_dir, filename)
-            try:
-                with open(template_path, 'r', encoding='utf-8') as f:
-                    template = yaml.safe_load(f)
-                    # Compare note type names case-insensitively
-                    if template.get('note_type', '').lower() == note_type_name_lower:
-                        logger.info(f"Found matching template in {filename}")
-                        return template
-            except Exception as e:
-                logger.error(f"Error reading template file {filename}: {e}")
-                continue
-    
-    logger.warning(f"No template found for note type: {note_type_name}")
-    return None
+    template = get_note_type_template(note_type_name)
+    if template is None:
+        logger.warning(f"No template found for note type: {note_type_name}")
+    return template
 
-def initialize_note_type_from_template(template):
+def initialize_note_type_from_template(template, col=None):
     """Create a new note type in Anki from a template."""
+    col = get_collection(col)
     logger.info(f"Initializing note type: {template['note_type']}")
     
     # Create a new note type
-    model = mw.col.models.new(template['note_type'])
+    model = col.models.new(template['note_type'])
     
     # Add fields
     for field_name in template['fields']:
-        field = mw.col.models.new_field(field_name)
-        mw.col.models.add_field(model, field)
+        field = col.models.new_field(field_name)
+        col.models.add_field(model, field)
     
     # Add template
-    template_dict = mw.col.models.new_template("Card 1")
+    template_dict = col.models.new_template("Card 1")
     template_dict['qfmt'] = template['template']['front']
     template_dict['afmt'] = template['template']['back']
-    mw.col.models.add_template(model, template_dict)
+    col.models.add_template(model, template_dict)
     
     # Add styling
     model['css'] = template['styling']
     
     # Add the model to the collection
-    mw.col.models.add(model)
-    mw.col.models.save(model)
+    col.models.add(model)
+    col.models.save(model)
     
     logger.info(f"Successfully created note type: {template['note_type']}")
     return model
 
-def check_or_create_deck(deck_name):
+def check_or_create_deck(deck_name, col=None):
     """Check if the deck exists in Anki, if not, create it."""
+    col = get_collection(col)
     logger.info(f"Checking if deck '{deck_name}' exists...")
 
     # Get the deck ID, or create the deck if it doesn't exist
-    deck_id = mw.col.decks.id(deck_name)  # Creates the deck if not found
-    mw.col.decks.select(deck_id)
+    deck_id = col.decks.id(deck_name)  # Creates the deck if not found
+    col.decks.select(deck_id)
     
     if deck_id:
         logger.info(f"Deck '{deck_name}' exists with ID: {deck_id}")
@@ -79,58 +80,197 @@ def check_or_create_deck(deck_name):
 
     return deck_id
 
-def add_note_to_deck(deck_name, note_type_name, fields):
-    """Add a new note (flashcard) to the specified deck."""
-    logger.info(f"Adding note to deck '{deck_name}': Fields - {fields}")
-
-    # Get the deck ID and note type for the note
-    deck_id = check_or_create_deck(deck_name)
-    note_type = mw.col.models.by_name(note_type_name)
+def resolve_note_type(note_type_name, col=None):
+    """Return the Anki note type with the given name, creating it from a template if needed."""
+    col = get_collection(col)
+    note_type = col.models.by_name(note_type_name)
 
     # If note type doesn't exist, try to create it from template
     if not note_type:
         logger.info(f"Note type '{note_type_name}' not found. Attempting to create from template...")
         template = load_note_type_template(note_type_name)
         if template:
-            note_type = initialize_note_type_from_template(template)
+            note_type = initialize_note_type_from_template(template, col)
         else:
             raise ValueError(f"Note type '{note_type_name}' not found in Anki and no template available.")
+    return note_type
+
+def build_note(note_type, fields, guid=None, col=None):
+    """Create an unsaved note of the given type with its fields filled in order."""
+    col = get_collection(col)
+    note = Note(col, note_type)
+    if guid:
+        note.guid = guid
 
-    # Create a new note
-    note = Note(mw.col, note_type)
-    
     # Set the fields of the note
     for i, (field_name, field_value) in enumerate(fields.items()):
         if i < len(note.fields):
             note.fields[i] = field_value
         else:
             logger.warning(f"Field '{field_name}' not found in the note type.")
-    
-    # Set the deck ID for the note
-    note.note_type()['did'] = deck_id
+    return note
+
+def add_note_to_deck(deck_name, note_type_name, fields, col=None, known_hashes=None):
+    """
+    Add a new note (flashcard) to the specified deck.
+
+    Callers adding several notes pass the deck's content hashes as known_hashes; the hash of
+    an added note is then added to that set and the caller records it with record_added_notes.
+    Without it, the deck index is loaded and updated for this one note.
+    """
+    col = get_collection(col)
+    logger.info(f"Adding note to deck '{deck_name}': Fields - {fields}")
+
+    # Get the deck ID and note type for the note
+    deck_id = check_or_create_deck(deck_name, col)
+    note_type = resolve_note_type(note_type_name, col)
 
     # Check if a note with the same fields already exists in this deck
-    search_query = [f'deck:"{deck_name}"']  # Limit search to specific deck
-    for i, (field_name, field_value) in enumerate(fields.items()):
-        if field_value.strip():  # Only include non-empty fields in the search
-            search_query.append(f'"{field_name}:{field_value}"')
-    
-    if search_query:
-        existing_notes = mw.col.find_notes(" AND ".join(search_query))
-        if existing_notes:
-            logger.warning(f"Note already exists in deck '{deck_name}' with fields: {fields}")
-            return "duplicate"
+    record = known_hashes is None
+    if record:
+        known_hashes = load_deck_index(col, deck_id)
+    fields_hash = content_hash(fields)
+    if fields_hash in known_hashes:
+        logger.warning(f"Note already exists in deck '{deck_name}' with fields: {fields}")
+        return "duplicate"
+
+    # Create a new note
+    guid = available_note_guids(col, deck_name, note_type_name, [fields])[0]
+    note = build_note(note_type, fields, guid, col)
+
+    # Set the deck ID for the note
+    note.note_type()['did'] = deck_id
 
     # Add the note to the collection if it doesn't exist
-    if mw.col.addNote(note):
+    if col.addNote(note):
+        known_hashes.add(fields_hash)
+        if record:
+            record_added_notes(col, deck_id, [fields_hash])
         logger.info(f"Note added to deck '{deck_name}': Fields - {fields}")
         return "success"
     else:
         logger.error(f"Failed to add note to deck '{deck_name}'.")
         return "error"
 
-def add_cards_to_anki(stage_data, stage_config):
-    """Process the stage data and add cards to Anki based on the configuration."""
+def run_on_main_thread(func, cancel_token=None):
+    """
+    Run func on Anki's main thread and return its result.
+
+    The collection is not thread-safe, so worker threads hand collection writes to
+    mw.taskman and block until they finish. Exceptions are re-raised in the caller.
+    If cancel_token is shut down (Anki is closing) before the main thread picks the task
+    up, the task is dropped and CancelledError is raised instead of waiting.
+    """
+    if threading.current_thread() is threading.main_thread():
+        return func()
+
+    done = threading.Event()
+    state_lock = threading.Lock()
+    state = {'started': False, 'dropped': False}
+    outcome = {}
+
+    def wrapper():
+        with state_lock:
+            if state['dropped']:
+                return
+            state['started'] = True
+        try:
+            outcome['result'] = func()
+        except Exception as e:
+            outcome['error'] = e
+        finally:
+            done.set()
+
+    mw.taskman.run_on_main(wrapper)
+    while not done.wait(POLL_INTERVAL):
+        if cancel_token is not None and cancel_token.shutting_down:
+            with state_lock:
+                if not state['started']:
+                    state['dropped'] = True
+                    raise CancelledError("Anki is closing; the cards were not added")
+    if 'error' in outcome:
+        raise outcome['error']
+    return outcome['result']
+
+def insert_notes(deck_id, notes, col=None):
+    """
+    Add notes to the collection in one operation with a single undo entry.
+
+    Uses col.add_notes where available and falls back to one addNote call per note
+    behind a single checkpoint on older Anki versions.
+    """
+    col = get_collection(col)
+    if hasattr(col, 'add_notes'):
+        from anki.collection import AddNoteRequest
+        undo_entry = col.add_custom_undo_entry(UNDO_LABEL)
+        col.add_notes([AddNoteRequest(note=note, deck_id=deck_id) for note in notes])
+        col.merge_undo_entries(undo_entry)
+        added = len(notes)
+    else:
+        if mw is not None and col is mw.col:
+            mw.checkpoint(UNDO_LABEL)
+        added = 0
+        for note in notes:
+            note.note_type()['did'] = deck_id
+            if col.addNote(note):
+                added += 1
+
+    if mw is not None and col is mw.col and hasattr(mw, 'update_undo_actions'):
+        mw.update_undo_actions()
+    return added
+
+def add_notes_in_bulk(deck_name, note_type_name, cards_fields, col=None, cancel_token=None):
+    """
+    Add all notes to a deck in one collection operation.
+
+    Notes for the open Anki profile are added on the main thread; a standalone
+    collection is written from the calling thread. cancel_token is passed to run_on_main_thread.
+
+    The deck and note type are resolved once. Notes already in the deck, or repeated
+    within this batch, are counted as duplicates using the deck's content hash index.
+
+    Returns:
+        Tuple of (number of notes added, list of duplicate field dicts)
+    """
+    col = get_collection(col)
+
+    def add_all():
+        deck_id = check_or_create_deck(deck_name, col)
+        note_type = resolve_note_type(note_type_name, col)
+
+        known_hashes = load_deck_index(col, deck_id)
+        new_fields = []
+        new_hashes = []
+        duplicates = []
+        for fields in cards_fields:
+            fields_hash = content_hash(fields)
+            if fields_hash in known_hashes:
+                logger.warning(f"Note already exists in deck '{deck_name}' with fields: {fields}")
+                duplicates.append(fields)
+                continue
+            known_hashes.add(fields_hash)
+            new_hashes.append(fields_hash)
+            new_fields.append(fields)
+
+        guids = available_note_guids(col, deck_name, note_type_name, new_fields)
+        notes = [build_note(note_type, fields, guid, col) for fields, guid in zip(new_fields, guids)]
+
+        added = insert_notes(deck_id, notes, col) if notes else 0
+        if added:
+            record_added_notes(col, deck_id, new_hashes)
+        return added, duplicates
+
+    if mw is not None and col is mw.col:
+        return run_on_main_thread(add_all, cancel_token)
+    return add_all()
+
+def add_cards_to_anki(stage_data, stage_config, col=None, cancel_token=None):
+    """
+    Process the stage data and add cards to Anki based on the configuration.
+
+    Cards go to the open Anki profile unless a standalone collection is passed as col.
+    With a cancel_token, a bulk insert stops waiting for the main thread once the token is shut down.
+    """
     logger.info("Starting to add cards to Anki...")
     logger.debug(f"Stage data: {stage_data}")
     logger.debug(f"Stage config: {stage_config}")
@@ -142,9 +282,7 @@ def add_cards_to_anki(stage_data, stage_config):
 
     card_template = stage_config.get('card_template', {})
     template_name = card_template.get('template_name', 'Notes2Flash Basic Note Type')
-
-    # Ensure the deck exists
-    check_or_create_deck(deck_name)
+    bulk_insert = stage_config.get('bulk_insert', True)
 
     # Get the flashcards data using the flashcards_data key from the configuration
     flashcards_key = stage_config.get('flashcards_data', 'flashcards')
@@ -163,31 +301,60 @@ def add_cards_to_anki(stage_data, stage_config):
 
     cards_added = 0
     errors = []
-
-    # Process each flashcard and add it to the deck
     duplicates = []
+    start_time = time.perf_counter()
+
+    # Fill in the card template for each flashcard up front
+    cards_fields = []
     for card_data in flashcards:
-        fields = {}
         try:
-            for field, template in card_template.items():
-                if field != 'template_name':
-                    fields[field] = template.format(**card_data)
-            
-            result = add_note_to_deck(deck_name, template_name, fields)
-            if result == "success":
-                cards_added += 1
-            elif result == "duplicate":
-                duplicates.append(card_data)
-            else:  # result == "error"
-                errors.append(f"Failed to add card: {card_data}")
+            cards_fields.append({
+                field: template.format(**card_data)
+                for field, template in card_template.items()
+                if field != 'template_name'
+            })
         except KeyError as e:
             logger.error(f"Missing key in card data: {e}")
             errors.append(f"Missing key in card data: {e}")
-        except ValueError as e:
-            logger.error(f"Error adding card: {e}")
-            errors.append(f"Error adding card: {e}")
 
+    with commit_lock, span("insert cards", 'anki', deck=deck_name, cards=len(cards_fields)) as insert_span:
+        if bulk_insert:
+            try:
+                cards_added, duplicates = add_notes_in_bulk(deck_name, template_name, cards_fields, col, cancel_token)
+            except ValueError as e:
+                logger.error(f"Error adding cards: {e}")
+                errors.append(f"Error adding cards: {e}")
+        else:
+            # Ensure the deck exists and load its duplicate index once for all cards
+            target_col = get_collection(col)
+            deck_id = check_or_create_deck(deck_name, target_col)
+            known_hashes = load_deck_index(target_col, deck_id)
+            new_hashes = []
+
+            # Add each flashcard to the deck separately
+            for fields in cards_fields:
+                try:
+                    result = add_note_to_deck(deck_name, template_name, fields, target_col, known_hashes)
+                    if result == "success":
+                        cards_added += 1
+                        new_hashes.append(content_hash(fields))
+                    elif result == "duplicate":
+                        duplicates.append(fields)
+                    else:  # result == "error"
+                        errors.append(f"Failed to add card: {fields}")
+                except ValueError as e:
+                    logger.error(f"Error adding card: {e}")
+                    errors.append(f"Error adding card: {e}")
+            if new_hashes:
+                record_added_notes(target_col, deck_id, new_hashes)
+
+        insert_span.set(added=cards_added, duplicates=len(duplicates))
+
+    elapsed = time.perf_counter() - start_time
+    mode = "bulk" if bulk_insert else "per-card"
+    ms_per_card = elapsed * 1000 / len(cards_fields) if cards_fields else 0.0
     logger.info(f"Finished adding cards to Anki. {cards_added} cards added.")
+    logger.info(f"Inserted {len(cards_fields)} cards ({mode}) in {elapsed * 1000:.1f} ms ({ms_per_card:.2f} ms per card)")
     if duplicates:
         logger.warning(f"Found {len(duplicates)} duplicate notes already in deck '{deck_name}'")
     if errors:
@@ -196,5 +363,11 @@ def add_cards_to_anki(stage_data, stage_config):
     return {
         "cards_added": cards_added,
         "duplicates": len(duplicates),
-        "errors": errors if errors else None
+        "errors": errors if errors else None,
+        "insert_timings": {
+            "mode": mode,
+            "cards": len(cards_fields),
+            "total_ms": round(elapsed * 1000, 1),
+            "ms_per_card": round(ms_per_card, 2)
+        }
     }
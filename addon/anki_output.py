@@ -0,0 +1,126 @@
+"""Headless output backend: write cards to a standalone collection, an .apkg package or JSON without the Anki GUI."""
+import json
+import os
+import sys
+import tempfile
+import threading
+from typing import Any, Dict
+from .duplicate_index import forget_collection
+from .logger import get_logger
+
+logger = get_logger()
+
+OUTPUT_KEYS = ('output_collection', 'output_apkg', 'output_json')
+
+# Several add stages can append to the same JSON output
+json_output_lock = threading.Lock()
+
+
+def uses_headless_output(stage_config: Dict[str, Any]) -> bool:
+    """Check whether an add_cards_to_anki config writes to a file instead of the open profile."""
+    return any(stage_config.get(key) for key in OUTPUT_KEYS)
+
+
+def open_collection(collection_path: str):
+    """Open (or create) a standalone collection file with the anki library."""
+    from anki.collection import Collection
+    directory = os.path.dirname(os.path.abspath(collection_path))
+    os.makedirs(directory, exist_ok=True)
+    return Collection(collection_path)
+
+
+def export_deck_package(col, deck_id: int, apkg_path: str) -> None:
+    """Export one deck, without scheduling information, as an .apkg package."""
+    if hasattr(col, 'export_anki_package'):
+        from anki.collection import DeckIdLimit, ExportAnkiPackageOptions
+        col.export_anki_package(
+            out_path=apkg_path,
+            options=ExportAnkiPackageOptions(with_scheduling=False, with_media=False, legacy=True),
+            limit=DeckIdLimit(deck_id)
+        )
+    else:
+        # Anki versions before the Rust exporter
+        from anki.exporting import AnkiPackageExporter
+        exporter = AnkiPackageExporter(col)
+        exporter.did = deck_id
+        exporter.includeSched = False
+        exporter.includeMedia = False
+        exporter.exportInto(apkg_path)
+
+
+def write_cards_to_collection(collection_path: str, stage_data: Dict[str, Any], stage_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the cards to a standalone collection file, creating it if needed."""
+    from .add_cards_to_anki import add_cards_to_anki
+    logger.info(f"Writing cards to collection {collection_path}")
+    col = open_collection(collection_path)
+    try:
+        result = add_cards_to_anki(stage_data, stage_config, col)
+    finally:
+        col.close()
+    result['output'] = collection_path
+    return result
+
+
+def write_cards_to_apkg(apkg_path: str, stage_data: Dict[str, Any], stage_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the cards in a temporary collection and export the deck as an .apkg package."""
+    from .add_cards_to_anki import add_cards_to_anki
+    logger.info(f"Writing cards to package {apkg_path}")
+    with tempfile.TemporaryDirectory() as tmp:
+        collection_path = os.path.join(tmp, "collection.anki2")
+        col = open_collection(collection_path)
+        try:
+            result = add_cards_to_anki(stage_data, stage_config, col)
+            if result.get('cards_added'):
+                export_deck_package(col, col.decks.id(stage_config['deck_name']), os.path.abspath(apkg_path))
+        finally:
+            col.close()
+            # The temporary collection's duplicate index is never needed again
+            forget_collection(collection_path)
+    result['output'] = apkg_path
+    return result
+
+
+def write_cards_to_json(json_path: str, stage_data: Dict[str, Any], stage_config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Append the filled-in cards to a JSON Lines file ('-' for stdout), one note per line.
+
+    Needs neither Anki nor the anki library. Each line holds the deck name, note type and fields.
+    """
+    flashcards = stage_data.get(stage_config.get('flashcards_data', 'flashcards'), [])
+    if isinstance(flashcards, str):
+        try:
+            flashcards = json.loads(flashcards)
+        except json.JSONDecodeError:
+            return {"cards_added": 0, "error": "Invalid JSON data in flashcards"}
+    card_template = stage_config.get('card_template', {})
+    note_type_name = card_template.get('template_name', 'Notes2Flash Basic Note Type')
+
+    lines = []
+    errors = []
+    for card_data in flashcards:
+        try:
+            fields = {field: template.format(**card_data) for field, template in card_template.items() if field != 'template_name'}
+        except KeyError as e:
+            errors.append(f"Missing key in card data: {e}")
+            continue
+        lines.append(json.dumps({"deck_name": stage_config.get('deck_name'), "note_type": note_type_name, "fields": fields},
+                                ensure_ascii=False))
+
+    with json_output_lock:
+        if json_path == '-':
+            sys.stdout.write(''.join(line + '\n' for line in lines))
+            sys.stdout.flush()
+        else:
+            with open(json_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(line + '\n' for line in lines))
+    logger.info(f"Wrote {len(lines)} cards to {json_path}")
+    return {"cards_added": len(lines), "duplicates": 0, "errors": errors if errors else None, "output": json_path}
+
+
+def write_cards_to_output(stage_data: Dict[str, Any], stage_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Write the cards to the file configured by output_json, output_apkg or output_collection."""
+    if stage_config.get('output_json'):
+        return write_cards_to_json(stage_config['output_json'], stage_data, stage_config)
+    if stage_config.get('output_apkg'):
+        return write_cards_to_apkg(stage_config['output_apkg'], stage_data, stage_config)
+    return write_cards_to_collection(stage_config['output_collection'], stage_data, stage_config)
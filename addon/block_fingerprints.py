@@ -0,0 +1,110 @@
+"""Content-defined block fingerprints for whitespace- and move-insensitive change detection."""
+import hashlib
+import re
+import unicodedata
+from typing import Any, Dict, List
+from .change_detection import compare_hashed_items, line_hash
+from .document_model import Document, HEADING
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+HASH_MASK = (1 << 64) - 1
+
+# Blocks longer than this are cut into content-defined segments so that an edit in a
+# very long paragraph only invalidates the segment around it.
+MAX_BLOCK_CHARS = 2000
+MIN_SEGMENT_WORDS = 32
+MAX_SEGMENT_WORDS = 512
+SEGMENT_BOUNDARY_MASK = 0x7F << 57  # Top bits of the rolling hash; ~1 boundary every 128 words
+
+
+class Block:
+    """A paragraph-sized unit of content identified by the fingerprint of its normalized text."""
+
+    __slots__ = ('fingerprint', 'text', 'lines')
+
+    def __init__(self, fingerprint: int, text: str, lines: List[str]):
+        self.fingerprint = fingerprint
+        self.text = text
+        self.lines = lines
+
+    @property
+    def block_id(self) -> str:
+        """Stable hexadecimal ID that later stages can key on."""
+        return f"{self.fingerprint & HASH_MASK:016x}"
+
+
+def normalize_text(text: str) -> str:
+    """Normalize Unicode and collapse all whitespace, so re-indenting and reflowing don't change it."""
+    return WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFKC', text)).strip()
+
+
+def fingerprint_text(normalized_text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(normalized_text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def block_id_for_text(text: str) -> str:
+    """Return the block ID for a piece of block text."""
+    return f"{fingerprint_text(normalize_text(text)) & HASH_MASK:016x}"
+
+
+def word_gear_value(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def split_long_text(normalized_text: str) -> List[str]:
+    """
+    Cut long normalized text into segments at content-defined word boundaries.
+
+    A gear rolling hash runs over the words, and a boundary is placed wherever its top bits are zero.
+    The cut points depend only on nearby words, so inserting text early in the block does not
+    shift the boundaries (or fingerprints) of the segments after it.
+    """
+    words = normalized_text.split(' ')
+    segments = []
+    segment_start = 0
+    rolling_hash = 0
+    for index, word in enumerate(words):
+        rolling_hash = ((rolling_hash << 1) + word_gear_value(word)) & HASH_MASK
+        length = index + 1 - segment_start
+        if (length >= MIN_SEGMENT_WORDS and not rolling_hash & SEGMENT_BOUNDARY_MASK) or length >= MAX_SEGMENT_WORDS:
+            segments.append(' '.join(words[segment_start:index + 1]))
+            segment_start = index + 1
+    if segment_start < len(words):
+        segments.append(' '.join(words[segment_start:]))
+    return segments
+
+
+def make_blocks(lines: List[str]) -> List[Block]:
+    normalized = normalize_text(' '.join(lines))
+    if not normalized:
+        return []
+    if len(normalized) <= MAX_BLOCK_CHARS:
+        return [Block(fingerprint_text(normalized), '\n'.join(lines), lines)]
+    return [Block(fingerprint_text(segment), segment, [segment]) for segment in split_long_text(normalized)]
+
+
+def split_into_blocks(document: Document) -> List[Block]:
+    """Group a document's lines into blocks by source block ID; headings always stand alone."""
+    blocks = []
+    current_lines = []
+    current_block_id = None
+    for line in document:
+        if current_lines and (line.block_id is None or line.block_id != current_block_id or line.kind == HEADING):
+            blocks.extend(make_blocks(current_lines))
+            current_lines = []
+        current_lines.append(line.text)
+        current_block_id = line.block_id
+    if current_lines:
+        blocks.extend(make_blocks(current_lines))
+    return blocks
+
+
+def compare_block_fingerprints(old_fingerprints: List[int], blocks: List[Block]) -> Dict[str, Any]:
+    """Compare stored block fingerprints with the current blocks; moved or reflowed blocks are not changes."""
+    return compare_hashed_items(old_fingerprints, [block.fingerprint for block in blocks], blocks)
+
+
+def blocks_not_in_line_hashes(line_hashes: List[int], blocks: List[Block]) -> List[Block]:
+    """Return blocks containing any line not covered by legacy per-line hashes."""
+    known_hashes = set(line_hashes)
+    return [block for block in blocks if any(line_hash(line) not in known_hashes for line in block.lines)]
@@ -1,19 +1,82 @@
+"""
+Build notes2flash.ankiaddon.
+
+    python addon/bundle_addon.py           # the add-on plus everything pip installs into libs/
+    python addon/bundle_addon.py --slim    # tree-shaken libs/ with precompiled bytecode
+
+The slim bundle keeps only the packages in libs/ that the add-on actually imports, and
+only the Google API discovery documents it uses. It ships bytecode compiled by this
+interpreter, so build it with the Python version of the target Anki (PYTHON_VERSION in
+docker-compose.yml). Both modes write bundle_report.json next to the bundle and append it to
+bundle_history.jsonl. The report holds bundle size, the largest packages and cold-import
+times, so regressions show up between builds.
+"""
+import argparse
+import compileall
+import json
 import os
+import py_compile
+import re
 import shutil
+import statistics
 import subprocess
+import sys
+import tempfile
+import time
 import zipfile
 
-def bundle_addon():
-    addon_dir = "/app/addon"
-    libs_dir = os.path.join(addon_dir, "libs")
-    output_file = "/app/notes2flash.ankiaddon"
-    requirements_file = "/app/requirements.txt"
+ADDON_PACKAGE = "notes2flash"
+
+# Files the add-on creates at runtime; they must never end up in a bundle
+RUNTIME_FILES = {"service_account.json", "notes2flash.log", "user_inputs.json", "vault_index.json", "tracked_docs.json"}
+RUNTIME_FILE_PREFIXES = ("notes2flash.db",)  # Database plus its -wal/-shm files
+RUNTIME_DIRS = {"traces", "__pycache__"}
+BUILD_FILES = {"installed_packages.txt", ".requirements_hash"}  # Bookkeeping of the libs/ install
+# config.json is rewritten with the user's API keys when the config is saved, so this ships instead
+DEFAULT_CONFIG = {"openrouter_api_key": "", "notion_api_key": "", "max_concurrent_jobs": 2}
+
+# The only Google API the add-on builds a client for (scrape_googledoc.py)
+DISCOVERY_DOCUMENTS = {"docs.v1.json"}
+DISCOVERY_DOCUMENTS_DIR = os.path.join("googleapiclient", "discovery_cache", "documents")
+
+# Runs in a fresh interpreter against libs/ and reports every module file the add-on's lazy
+# imports load, including the ones only imported when a client is built
+PROBE = """
+import json, sys
+sys.path.insert(0, {libs_dir!r})
+import yaml, requests
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+build('docs', 'v1', developerKey='bundle-probe', static_discovery=True)
+from notion_client import Client
+Client(auth='bundle-probe')
+print(json.dumps(sorted(getattr(module, '__file__', None) or '' for module in list(sys.modules.values()))))
+"""
+
+# Cold-import scenarios measured against the unpacked bundle
+IMPORT_SCENARIOS = {
+    "pipeline": [f"{ADDON_PACKAGE}.notes2flash"],
+    "source_clients": ["googleapiclient.discovery", "google.oauth2.service_account", "notion_client"],
+}
+
+MEASURE = """
+import json, sys, time
+sys.path.insert(0, {parent_dir!r})
+sys.path.insert(0, {libs_dir!r})
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+print(json.dumps({{"ms": (time.perf_counter() - start) * 1000}}))
+"""
+
+
+def install_dependencies(libs_dir, requirements_file):
     installed_packages_file = os.path.join(libs_dir, "installed_packages.txt")
 
     # Step 1: Check if the libs directory needs updating
     if not os.path.exists(libs_dir):
         os.makedirs(libs_dir)
-        install_dependencies = True
+        needs_install = True
     else:
         # Compare installed packages with the requirements file
         try:
@@ -25,13 +88,13 @@ def bundle_addon():
             ).decode("utf-8").splitlines()
 
             # Check if there's a difference between required and installed packages
-            install_dependencies = set(required_packages) != set(installed_packages)
+            needs_install = set(required_packages) != set(installed_packages)
         except Exception as e:
             print(f"Error checking installed packages: {e}")
-            install_dependencies = True  # Install if comparison fails
+            needs_install = True  # Install if comparison fails
 
     # Step 2: Install or update dependencies only if needed
-    if install_dependencies:
+    if needs_install:
         print("Installing or updating dependencies...")
         subprocess.run(["pip", "install", "--target", libs_dir, "-r", requirements_file], check=True)
         with open(installed_packages_file, 'w') as f:
@@ -41,32 +104,241 @@ def bundle_addon():
     else:
         print("Dependencies are already up to date. Skipping installation.")
 
-    # Step 3: Clean up any existing __pycache__ folders
-    print("Removing __pycache__ folders...")
-    for root, dirs, _ in os.walk(addon_dir):
-        for dir_name in dirs:
-            if dir_name == "__pycache__":
-                shutil.rmtree(os.path.join(root, dir_name))
-
-    # Step 4: Create the zip archive for the add-on (.ankiaddon file)
-    if os.path.exists(output_file):
-        os.remove(output_file)
-
-    print("Creating addon package...")
-    with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(addon_dir):
-            for file in files:
-                # Exclude service_account.json from the bundle
-                if file == "service_account.json":
-                    continue
-                file_path = os.path.join(root, file)
-                arcname = os.path.relpath(file_path, addon_dir)
-                zipf.write(file_path, arcname)
-
-        # Include the empty config.json in the bundle
-        zipf.write(os.path.join(addon_dir, "config.json"), "config.json")
+
+def is_runtime_file(name):
+    return name in RUNTIME_FILES or name.startswith(RUNTIME_FILE_PREFIXES)
+
+
+def ignore_runtime_files(directory, names):
+    return [name for name in names if name in RUNTIME_DIRS or is_runtime_file(name)]
+
+
+def lib_units(libs_dir):
+    """
+    Return the removable units of libs/: top-level packages and modules, and the subpackages
+    of namespace packages (e.g. google/auth and google/protobuf are separate units).
+    """
+    units = []
+    for name in sorted(os.listdir(libs_dir)):
+        path = os.path.join(libs_dir, name)
+        if name.endswith(('.dist-info', '.egg-info', '.libs')) or name in RUNTIME_DIRS or name in BUILD_FILES:
+            continue
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path, "__init__.py")) and name != "bin":
+            units.extend(os.path.join(path, child) for child in sorted(os.listdir(path)) if child not in RUNTIME_DIRS)
+        else:
+            units.append(path)
+    return units
+
+
+def probe_used_files(libs_dir):
+    output = subprocess.run([sys.executable, "-c", PROBE.format(libs_dir=libs_dir)],
+                            capture_output=True, text=True, check=True).stdout
+    return [os.path.abspath(path) for path in json.loads(output) if path]
+
+
+def tree_shake(libs_dir):
+    """Remove packages the add-on never imports, their metadata, test suites and unused discovery documents."""
+    used_files = probe_used_files(libs_dir)
+
+    def is_used(path):
+        prefix = os.path.abspath(path)
+        return any(file == prefix or file.startswith(prefix + os.sep) for file in used_files)
+
+    removed = []
+    for unit in lib_units(libs_dir):
+        if not is_used(unit):
+            removed.append(os.path.relpath(unit, libs_dir))
+            if os.path.isdir(unit):
+                shutil.rmtree(unit)
+            else:
+                os.remove(unit)
+
+    # Test suites inside kept packages
+    for root, dirs, _ in os.walk(libs_dir):
+        for dir_name in list(dirs):
+            path = os.path.join(root, dir_name)
+            if dir_name in ("tests", "test") and not is_used(path):
+                removed.append(os.path.relpath(path, libs_dir))
+                shutil.rmtree(path)
+                dirs.remove(dir_name)
+
+    # Metadata of distributions whose files are all gone
+    for name in os.listdir(libs_dir):
+        record_file = os.path.join(libs_dir, name, "RECORD")
+        if not name.endswith('.dist-info') or not os.path.exists(record_file):
+            continue
+        with open(record_file, 'r', encoding='utf-8') as f:
+            files = [line.split(',')[0] for line in f if line.strip()]
+        owned = [path for path in files if not path.startswith(name) and path.endswith('.py')]
+        if owned and not any(os.path.exists(os.path.join(libs_dir, path)) for path in owned):
+            shutil.rmtree(os.path.join(libs_dir, name))
+
+    documents_dir = os.path.join(libs_dir, DISCOVERY_DOCUMENTS_DIR)
+    if os.path.isdir(documents_dir):
+        unused = [name for name in os.listdir(documents_dir) if name.endswith('.json') and name not in DISCOVERY_DOCUMENTS]
+        for name in unused:
+            os.remove(os.path.join(documents_dir, name))
+        print(f"Removed {len(unused)} unused discovery documents")
+
+    print(f"Removed {len(removed)} unused packages and test suites from libs/")
+    return sorted(removed)
+
+
+def compile_bytecode(staging_dir):
+    """
+    Precompile all modules for this interpreter, so the first launch does not compile from source.
+
+    The modules in libs/ are compiled with unchecked hashes. Anki does not keep the mtimes of
+    files it unpacks, so timestamp-based .pyc files would be stale and compiled again. The add-on's
+    own modules use checked hashes, so edited files are still recompiled. Anki does not run
+    Python with -O, so the bytecode is built at the default optimization level that it loads.
+    """
+    libs_dir = os.path.join(staging_dir, "libs")
+    compileall.compile_dir(libs_dir, quiet=1, workers=0,
+                           invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+    compileall.compile_dir(staging_dir, quiet=1, workers=0, rx=re.compile(re.escape(os.sep + "libs" + os.sep)),
+                           invalidation_mode=py_compile.PycInvalidationMode.CHECKED_HASH)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+    return total
+
+
+def measure_cold_imports(bundle_file, runs):
+    """Unpack the bundle and time its imports in fresh interpreters; the first run includes any compiling."""
+    timings = {}
+    with tempfile.TemporaryDirectory() as parent_dir:
+        package_dir = os.path.join(parent_dir, ADDON_PACKAGE)
+        with zipfile.ZipFile(bundle_file) as zipf:
+            zipf.extractall(package_dir)
+        libs_dir = os.path.join(package_dir, "libs")
+        # Like Anki, write bytecode on the first import, even if the build environment disables it
+        env = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+        for scenario, modules in IMPORT_SCENARIOS.items():
+            results = []
+            for _ in range(runs):
+                completed = subprocess.run(
+                    [sys.executable, "-c", MEASURE.format(parent_dir=parent_dir, libs_dir=libs_dir, modules=modules)],
+                    capture_output=True, text=True, env=env
+                )
+                if completed.returncode != 0:
+                    print(f"Could not import {scenario}: {completed.stderr.strip().splitlines()[-1:]}")
+                    break
+                results.append(json.loads(completed.stdout)["ms"])
+            if results:
+                timings[scenario] = {
+                    "first_ms": round(results[0], 1),
+                    "median_ms": round(statistics.median(results[1:] or results), 1)
+                }
+    return timings
+
+
+def write_report(report, output_file):
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    with open(os.path.join(output_dir, "bundle_report.json"), 'w') as f:
+        json.dump(report, f, indent=2)
+
+    history_file = os.path.join(output_dir, "bundle_history.jsonl")
+    previous = None
+    if os.path.exists(history_file):
+        with open(history_file, 'r') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        previous = next((entry for entry in reversed(entries) if entry.get("mode") == report["mode"]), None)
+    with open(history_file, 'a') as f:
+        f.write(json.dumps(report) + "\n")
+
+    print(f"Bundle: {report['bundle_bytes'] / 1e6:.1f} MB zipped, {report['unpacked_bytes'] / 1e6:.1f} MB unpacked, "
+          f"{report['files']} files")
+    for scenario, timing in report["cold_import"].items():
+        print(f"Cold import of {scenario}: first {timing['first_ms']:.0f} ms, then {timing['median_ms']:.0f} ms")
+    if previous:
+        print(f"Compared with the previous {report['mode']} bundle: "
+              f"{(report['bundle_bytes'] - previous['bundle_bytes']) / 1e6:+.1f} MB zipped")
+        for scenario, timing in report["cold_import"].items():
+            if scenario in previous.get("cold_import", {}):
+                print(f"  {scenario}: {timing['first_ms'] - previous['cold_import'][scenario]['first_ms']:+.0f} ms on first import")
+
+
+def bundle_addon(slim=False, addon_dir="/app/addon", output_file="/app/notes2flash.ankiaddon",
+                 requirements_file="/app/requirements.txt", import_runs=5):
+    libs_dir = os.path.join(addon_dir, "libs")
+    install_dependencies(libs_dir, requirements_file)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Step 3: Copy the add-on without caches and runtime files (database, logs, traces, inputs, config)
+        staging_dir = os.path.join(temp_dir, ADDON_PACKAGE)
+        shutil.copytree(addon_dir, staging_dir, ignore=ignore_runtime_files)
+        staged_config = os.path.join(staging_dir, "config.json")
+        if os.path.exists(staged_config):
+            os.remove(staged_config)
+
+        removed = []
+        if slim:
+            print("Tree-shaking libs/...")
+            removed = tree_shake(os.path.join(staging_dir, "libs"))
+            print(f"Compiling bytecode for Python {sys.version_info.major}.{sys.version_info.minor}...")
+            compile_bytecode(staging_dir)
+
+        # Step 4: Create the zip archive for the add-on (.ankiaddon file)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+        print("Creating addon package...")
+        files = 0
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for root, _, file_names in os.walk(staging_dir):
+                for file in file_names:
+                    if os.path.basename(root) == "libs" and file in BUILD_FILES and slim:
+                        continue
+                    file_path = os.path.join(root, file)
+                    zipf.write(file_path, os.path.relpath(file_path, staging_dir))
+                    files += 1
+
+            # Include the default config without any keys in the bundle
+            zipf.writestr("config.json", json.dumps(DEFAULT_CONFIG, indent=4))
+            files += 1
+
+        staged_libs = os.path.join(staging_dir, "libs")
+        package_sizes = {}
+        if os.path.isdir(staged_libs):
+            for unit in lib_units(staged_libs):
+                size = directory_size(unit) if os.path.isdir(unit) else os.path.getsize(unit)
+                package_sizes[os.path.relpath(unit, staged_libs)] = size
+        unpacked_bytes = directory_size(staging_dir)
 
     print(f"Addon packaged successfully as {output_file}!")
 
+    print("Measuring cold-import time...")
+    report = {
+        "mode": "slim" if slim else "full",
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": f"{sys.version_info.major}.{sys.version_info.minor}",
+        "cache_tag": sys.implementation.cache_tag,
+        "bundle_bytes": os.path.getsize(output_file),
+        "unpacked_bytes": unpacked_bytes,
+        "files": files,
+        "largest_packages": dict(sorted(package_sizes.items(), key=lambda item: -item[1])[:15]),
+        "removed": removed,
+        "cold_import": measure_cold_imports(output_file, import_runs)
+    }
+    write_report(report, output_file)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bundle the add-on as an .ankiaddon file.")
+    parser.add_argument("--slim", action="store_true",
+                        help="Drop unused packages and discovery documents and ship precompiled bytecode")
+    parser.add_argument("--addon-dir", default="/app/addon")
+    parser.add_argument("--output", default="/app/notes2flash.ankiaddon")
+    parser.add_argument("--requirements", default="/app/requirements.txt")
+    parser.add_argument("--import-runs", type=int, default=5, help="Fresh interpreters per cold-import measurement")
+    args = parser.parse_args()
+    bundle_addon(args.slim, args.addon_dir, args.output, args.requirements, args.import_runs)
+
+
 if __name__ == "__main__":
-    bundle_addon()
+    main()
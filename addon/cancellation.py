@@ -0,0 +1,89 @@
+"""Cooperative cancellation of workflow runs."""
+import threading
+import time
+from typing import Any, Callable, Optional
+
+POLL_INTERVAL = 0.1  # Seconds between cancellation checks while waiting on a blocking call
+
+
+class CancelledError(Exception):
+    """Raised inside a run once its cancellation token is cancelled."""
+
+
+class CancellationToken:
+    """
+    Shared flag that asks a running workflow to stop.
+
+    The run checks it between chunks and stages, waits on it instead of sleeping between
+    retries, and stops waiting for HTTP requests when it is set, so a cancel takes effect
+    within a fraction of a second without killing the thread.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.shutting_down = False  # Set by shut_down(): the run must not wait for Anki's main thread
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self) -> None:
+        self.event.set()
+
+    def shut_down(self) -> None:
+        """Cancel because Anki is closing: nothing is committed to the collection on the way out."""
+        self.shutting_down = True
+        self.event.set()
+
+    def raise_if_cancelled(self) -> None:
+        if self.event.is_set():
+            raise CancelledError("Cancelled by user")
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep for the given time, or raise CancelledError as soon as the token is cancelled."""
+        if self.event.wait(seconds):
+            raise CancelledError("Cancelled by user")
+
+    def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run a blocking call (e.g. an HTTP request) and return its result, or raise CancelledError
+        as soon as the token is cancelled.
+
+        The call runs in a daemon thread. When the run is cancelled, that thread is abandoned:
+        its request finishes in the background (bounded by the request's timeout) and the
+        response is discarded. Use run_cancellable where a run may have no token.
+        """
+        self.raise_if_cancelled()
+        done = threading.Event()
+        outcome = {}
+
+        def target():
+            try:
+                outcome['result'] = func(*args, **kwargs)
+            except BaseException as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=target, name="notes2flash-call", daemon=True).start()
+        while not done.wait(POLL_INTERVAL):
+            if self.event.is_set():
+                raise CancelledError("Cancelled by user")
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+
+def run_cancellable(cancel_token: Optional[CancellationToken], func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call through cancel_token, or directly (without an extra thread) if there is no token."""
+    if cancel_token is None:
+        return func(*args, **kwargs)
+    return cancel_token.run(func, *args, **kwargs)
+
+
+def sleep_cancellable(cancel_token: Optional[CancellationToken], seconds: float) -> None:
+    """Sleep through cancel_token, or plainly if there is no token."""
+    if cancel_token is None:
+        time.sleep(seconds)
+    else:
+        cancel_token.sleep(seconds)
@@ -0,0 +1,116 @@
+"""Streams generated cards into Anki in small batches while later chunks are still being processed."""
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from .add_cards_to_anki import add_cards_to_anki
+from .cancellation import CancellationToken
+from .tracing import in_context
+from .progress import current_progress
+from .logger import get_logger
+
+logger = get_logger()
+
+STREAM_BATCH_SIZE = 25  # Maximum cards committed to the collection in one operation
+_FINISHED = object()
+
+
+class CardInsertionStream:
+    """
+    Consumer thread that commits each chunk's cards as soon as they are generated.
+
+    The processing stage calls submit() with every chunk's results. Cards are added with
+    add_cards_to_anki in batches of up to STREAM_BATCH_SIZE, so a failure late in a run
+    keeps the cards already committed and the first cards appear within one chunk.
+    """
+
+    def __init__(self, stage_config: Dict[str, Any], progress_callback: Optional[Callable[[str], None]] = None,
+                 start_time: Optional[float] = None, cancel_token: Optional[CancellationToken] = None):
+        self.stage_config = stage_config
+        self.cancel_token = cancel_token  # Once shut down, remaining batches are dropped
+        self.flashcards_key = stage_config.get('flashcards_data', 'flashcards')
+        self.progress_callback = progress_callback
+        self.start_time = start_time if start_time is not None else time.perf_counter()
+        self.cards_generated = 0
+        self.cards_committed = 0
+        self.cards_added = 0
+        self.duplicates = 0
+        self.errors: List[str] = []
+        self.time_to_first_card = None
+        self.progress = current_progress()
+        self.queue: "queue.Queue" = queue.Queue()
+        self.thread = threading.Thread(target=in_context(self.run), name="notes2flash-card-stream", daemon=True)
+        self.thread.start()
+
+    def submit(self, chunk_results: Dict[str, Any]) -> None:
+        """Queue the validated cards of one processed chunk for insertion."""
+        cards = chunk_results.get(self.flashcards_key)
+        if not isinstance(cards, list) or not cards:
+            return
+        self.cards_generated += len(cards)
+        self.queue.put(cards)
+
+    def run(self) -> None:
+        finished = False
+        while not finished:
+            # Wait for the next chunk, then take everything else that is already waiting
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            batch = []
+            for item in items:
+                if item is _FINISHED:
+                    finished = True
+                else:
+                    batch.extend(item)
+            for start in range(0, len(batch), STREAM_BATCH_SIZE):
+                self.commit(batch[start:start + STREAM_BATCH_SIZE])
+
+    def commit(self, cards: List[Dict[str, Any]]) -> None:
+        if self.cancel_token is not None and self.cancel_token.shutting_down:
+            logger.info(f"Dropped {len(cards)} streamed cards: Anki is closing")
+            return
+        try:
+            result = add_cards_to_anki({self.flashcards_key: cards}, self.stage_config, cancel_token=self.cancel_token)
+        except Exception as e:
+            logger.error(f"Error committing {len(cards)} streamed cards: {e}")
+            self.errors.append(f"Error adding cards: {e}")
+            return
+
+        if result.get('error'):
+            self.errors.append(result['error'])
+        self.errors.extend(result.get('errors') or [])
+        self.cards_added += result.get('cards_added', 0)
+        self.duplicates += result.get('duplicates', 0)
+        self.cards_committed += len(cards)
+        if self.progress:
+            self.progress.cards_added(len(cards))
+
+        if self.time_to_first_card is None and result.get('cards_added', 0) > 0:
+            self.time_to_first_card = time.perf_counter() - self.start_time
+            logger.info(f"Time to first card: {self.time_to_first_card:.1f} s")
+        self.report_progress()
+
+    def report_progress(self) -> None:
+        message = f"Cards committed: {self.cards_committed}/{self.cards_generated}"
+        logger.info(message)
+        if self.progress_callback:
+            self.progress_callback(message)
+
+    def finish(self) -> Dict[str, Any]:
+        """Wait for all queued cards to be committed and return the combined insertion result."""
+        self.queue.put(_FINISHED)
+        self.thread.join()
+        logger.info(f"Streamed {self.cards_committed} cards into Anki: {self.cards_added} added, "
+                    f"{self.duplicates} duplicates")
+        return {
+            "cards_added": self.cards_added,
+            "duplicates": self.duplicates,
+            "errors": self.errors if self.errors else None,
+            "cards_generated": self.cards_generated,
+            "time_to_first_card": round(self.time_to_first_card, 2) if self.time_to_first_card is not None else None
+        }
@@ -0,0 +1,323 @@
+"""
+Record and replay the HTTP traffic of a run, for reproducible offline benchmarks.
+
+While a Cassette is active, every HTTP exchange of the pipeline goes through it: requests
+(OpenRouter completions and model list, Obsius, public Google Docs), httpx (Notion) and
+httplib2 (the Google Docs API). In record mode the exchanges are sent and saved with their
+timing; in replay mode nothing is sent and the recorded responses are served back after the
+recorded duration multiplied by speed (0 serves them at once).
+
+Requests are matched on method, URL and body. Request IDs, nonces and timestamps that
+call_openrouter_api adds to every request are masked first, so a replayed run matches the
+recording; requests that still don't match get the next unused exchange for the same URL.
+
+The HTTP clients are patched process-wide, so a cassette only starts while no other workflow
+run is active, and no run starts while it is (see run_scope). A run with a cassette also starts
+from empty document tracking, vault index and step cache in a temporary directory: otherwise a
+replay after the recording would find no changes (or cached step outputs) and never read the
+cassette. Cards still go to the configured output.
+
+Cassettes hold the fetched notes and generated cards in plain text. Request headers and bodies
+are not saved, and API keys in URLs and tokens in responses (e.g. the access_token of the Google
+token exchange) are redacted, but review a cassette before sharing it.
+"""
+import base64
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from .logger import get_logger
+
+logger = get_logger()
+
+CASSETTE_VERSION = 1
+RECORD = 'record'
+REPLAY = 'replay'
+# Per-request values that would keep a replayed request from matching its recording
+VOLATILE_PATTERNS = (
+    re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'),
+    re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?')
+)
+SKIPPED_RESPONSE_HEADERS = ('set-cookie', 'content-encoding', 'transfer-encoding', 'content-length')
+# Credentials that must not be written to a cassette
+SECRET_QUERY_PATTERN = re.compile(r'([?&](?:key|access_token|api_key)=)[^&#]*')
+SECRET_JSON_PATTERN = re.compile(r'("(?:access_token|refresh_token|id_token)"\s*:\s*")[^"]*(")')
+REDACTED = 'REDACTED'
+
+_runs_lock = threading.Lock()
+_active_cassette: Optional['Cassette'] = None
+_active_runs = 0  # Workflow runs in progress, with or without a cassette
+
+
+class CassetteError(Exception):
+    """A replayed run made a request the cassette has no response for."""
+
+
+def body_text(body: Any) -> str:
+    if body is None:
+        return ""
+    if isinstance(body, bytes):
+        return body.decode('utf-8', errors='replace')
+    return str(body)
+
+
+def redact_url(url: str) -> str:
+    return SECRET_QUERY_PATTERN.sub(rf'\g<1>{REDACTED}', url)
+
+
+def redact_text(text: str) -> str:
+    return SECRET_JSON_PATTERN.sub(rf'\g<1>{REDACTED}\g<2>', text)
+
+
+def request_fingerprint(method: str, url: str, body: Any) -> str:
+    """Hash a request with its volatile values and credentials masked."""
+    text = body_text(body)
+    for pattern in VOLATILE_PATTERNS:
+        text = pattern.sub('*', text)
+    return hashlib.blake2b(f"{method.upper()} {redact_url(url)}\n{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+
+def encode_content(content: bytes) -> Dict[str, str]:
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def redact_content(content: bytes) -> bytes:
+    try:
+        return redact_text(content.decode('utf-8')).encode('utf-8')
+    except UnicodeDecodeError:
+        return content
+
+
+def decode_content(exchange: Dict[str, Any]) -> bytes:
+    if 'base64' in exchange:
+        return base64.b64decode(exchange['base64'])
+    return exchange.get('text', '').encode('utf-8')
+
+
+class Cassette:
+    """Records HTTP exchanges to a JSON file or replays them from it while used as a context manager."""
+
+    def __init__(self, path: str, mode: str = REPLAY, speed: float = 1.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode '{mode}', expected '{RECORD}' or '{REPLAY}'")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.started = None
+        self.exchanges: List[Dict[str, Any]] = []
+        self.used = set()
+        self.patches: List[Tuple[Any, str, Any]] = []
+        if mode == REPLAY:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CASSETTE_VERSION:
+                raise CassetteError(f"Unsupported cassette version {data.get('version')} in {path}")
+            self.exchanges = data['exchanges']
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.install()
+        logger.info(f"{'Recording' if self.mode == RECORD else 'Replaying'} HTTP exchanges: {self.path}")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.uninstall()
+        if self.mode == RECORD:
+            self.save()
+        else:
+            unused = len(self.exchanges) - len(self.used)
+            if unused:
+                logger.info(f"{unused} recorded exchanges were not requested during replay")
+        return False
+
+    def save(self) -> None:
+        with self.lock:
+            exchanges = sorted(self.exchanges, key=lambda exchange: exchange['offset'])
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CASSETTE_VERSION, 'recorded_at': datetime.now().isoformat(),
+                       'exchanges': exchanges}, f, ensure_ascii=False, indent=1)
+        logger.info(f"Saved {len(exchanges)} HTTP exchanges to {self.path}")
+
+    def record(self, method: str, url: str, body: Any, started: float, status: int,
+               headers: Dict[str, str], content: bytes) -> None:
+        exchange = {
+            'method': method.upper(),
+            'url': redact_url(url),
+            'fingerprint': request_fingerprint(method, url, body),
+            'offset': round(started - self.started, 4),
+            'seconds': round(time.perf_counter() - started, 4),
+            'status': status,
+            'headers': {name: value for name, value in headers.items() if name.lower() not in SKIPPED_RESPONSE_HEADERS}
+        }
+        exchange.update(encode_content(redact_content(content)))
+        with self.lock:
+            self.exchanges.append(exchange)
+
+    def replay(self, method: str, url: str, body: Any) -> Tuple[int, Dict[str, str], bytes]:
+        """Find the recorded response for a request and wait for its (scaled) recorded duration."""
+        fingerprint = request_fingerprint(method, url, body)
+        with self.lock:
+            match = None
+            for index, exchange in enumerate(self.exchanges):
+                if index not in self.used and exchange['fingerprint'] == fingerprint:
+                    match = index
+                    break
+            if match is None:
+                for index, exchange in enumerate(self.exchanges):
+                    if index not in self.used and exchange['method'] == method.upper() and exchange['url'] == redact_url(url):
+                        match = index
+                        break
+            if match is None:
+                raise CassetteError(f"No recorded response for {method.upper()} {url} in {self.path}")
+            self.used.add(match)
+            exchange = self.exchanges[match]
+        if self.speed > 0:
+            time.sleep(exchange['seconds'] * self.speed)
+        return exchange['status'], exchange['headers'], decode_content(exchange)
+
+    def patch(self, owner: Any, name: str, replacement: Any) -> None:
+        self.patches.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, replacement)
+
+    def uninstall(self) -> None:
+        for owner, name, original in reversed(self.patches):
+            setattr(owner, name, original)
+        self.patches = []
+
+    def install(self) -> None:
+        """Route the HTTP clients the pipeline uses through this cassette. Missing clients are skipped."""
+        cassette = self
+        try:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from requests.structures import CaseInsensitiveDict
+            from requests.utils import get_encoding_from_headers
+        except ImportError:
+            pass
+        else:
+            send = HTTPAdapter.send
+
+            def requests_send(adapter, request, **kwargs):
+                if cassette.mode == RECORD:
+                    started = time.perf_counter()
+                    response = send(adapter, request, **kwargs)
+                    cassette.record(request.method, request.url, request.body, started, response.status_code,
+                                    dict(response.headers), response.content)
+                    return response
+                status, headers, content = cassette.replay(request.method, request.url, request.body)
+                response = requests.Response()
+                response.status_code = status
+                response.headers = CaseInsensitiveDict(headers)
+                response._content = content
+                response.encoding = get_encoding_from_headers(response.headers)
+                response.url = request.url
+                response.request = request
+                response.connection = adapter
+                return response
+
+            self.patch(HTTPAdapter, 'send', requests_send)
+
+        try:
+            import httpx
+        except ImportError:
+            pass
+        else:
+            handle_request = httpx.HTTPTransport.handle_request
+
+            def httpx_handle_request(transport, request):
+                if cassette.mode == RECORD:
+                    started = time.perf_counter()
+                    response = handle_request(transport, request)
+                    content = response.read()
+                    cassette.record(request.method, str(request.url), request.content, started, response.status_code,
+                                    dict(response.headers), content)
+                    return response
+                status, headers, content = cassette.replay(request.method, str(request.url), request.content)
+                return httpx.Response(status, headers=headers, content=content, request=request)
+
+            self.patch(httpx.HTTPTransport, 'handle_request', httpx_handle_request)
+
+        try:
+            import httplib2
+        except ImportError:
+            pass
+        else:
+            http_request = httplib2.Http.request
+
+            def httplib2_request(http, uri, method="GET", body=None, headers=None, *args, **kwargs):
+                if cassette.mode == RECORD:
+                    started = time.perf_counter()
+                    response, content = http_request(http, uri, method, body, headers, *args, **kwargs)
+                    cassette.record(method, uri, body, started, response.status,
+                                    {name: value for name, value in response.items() if name != 'status'}, content)
+                    return response, content
+                status, headers, content = cassette.replay(method, uri, body)
+                return httplib2.Response(dict(headers, status=str(status))), content
+
+            self.patch(httplib2.Http, 'request', httplib2_request)
+
+
+@contextmanager
+def isolated_state():
+    """Point the document store (with the step cache) and the vault index at a temporary directory."""
+    from . import document_store, scrape_local
+    saved = (document_store.STORE_FILE, scrape_local.VAULT_INDEX_FILE)
+    with tempfile.TemporaryDirectory(prefix="notes2flash-cassette-") as state_dir:
+        document_store.STORE_FILE = os.path.join(state_dir, "notes2flash.db")
+        scrape_local.VAULT_INDEX_FILE = os.path.join(state_dir, "vault_index.json")
+        try:
+            yield state_dir
+        finally:
+            document_store.close_connection()
+            document_store.STORE_FILE, scrape_local.VAULT_INDEX_FILE = saved
+
+
+@contextmanager
+def run_scope(cassette: Optional[Cassette] = None):
+    """
+    Enter a workflow run, with the cassette active if one is given.
+
+    Raises CassetteError instead of letting a cassette record or replay the traffic of other
+    runs: a cassette can't start while other runs are active, and no run starts while one is.
+    A run with a cassette uses isolated_state, so recording and replay start from the same state.
+    """
+    global _active_cassette, _active_runs
+    with _runs_lock:
+        if _active_cassette is not None:
+            raise CassetteError(f"Another run is using the cassette {_active_cassette.path}; wait for it to finish")
+        if cassette is not None and _active_runs:
+            raise CassetteError(f"Cannot use the cassette {cassette.path} while other runs are active")
+        _active_runs += 1
+        _active_cassette = cassette
+    try:
+        if cassette is None:
+            yield None
+        else:
+            with isolated_state(), cassette:
+                yield cassette
+    finally:
+        with _runs_lock:
+            _active_runs -= 1
+            if cassette is not None:
+                _active_cassette = None
+
+
+def open_cassette(record: Optional[str] = None, replay: Optional[str] = None, speed: float = 1.0) -> Optional[Cassette]:
+    """Return a cassette for --record/--replay style options, or None if neither is given."""
+    if record and replay:
+        raise ValueError("Use either record or replay, not both")
+    if record:
+        return Cassette(record, RECORD)
+    if replay:
+        return Cassette(replay, REPLAY, speed)
+    return None
@@ -0,0 +1,212 @@
+"""Hash-based change detection between two versions of a document."""
+import hashlib
+from bisect import bisect_left
+from typing import Any, Dict, List, Sequence, Tuple
+
+MAX_MYERS_EDIT_DISTANCE = 1000  # Gaps needing more edits than this are reported as a single replace hunk
+
+Hunk = Tuple[int, int, int, int]  # (old_start, old_end, new_start, new_end)
+
+
+def line_hash(text: str) -> int:
+    """Return a 64-bit content hash of a line that, unlike hash(), is stable across processes."""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+
+
+def patience_anchors(old: Sequence[int], new: Sequence[int], old_lo: int, old_hi: int,
+                     new_lo: int, new_hi: int) -> List[Tuple[int, int]]:
+    """Return the longest increasing run of lines that occur exactly once in both ranges."""
+    # Position of each line in the old range, or -1 if it occurs more than once
+    old_positions: Dict[int, int] = {}
+    for i in range(old_lo, old_hi):
+        key = old[i]
+        old_positions[key] = -1 if key in old_positions else i
+
+    new_positions: Dict[int, int] = {}
+    for j in range(new_lo, new_hi):
+        key = new[j]
+        if old_positions.get(key, -1) >= 0:
+            new_positions[key] = -1 if key in new_positions else j
+
+    # Unique-in-both lines in new-document order (dicts keep first-insertion order)
+    candidates = [(old_positions[key], j) for key, j in new_positions.items() if j >= 0]
+    if not candidates:
+        return []
+
+    # Longest increasing subsequence of old positions (patience sorting)
+    tails: List[int] = []
+    tail_indices: List[int] = []
+    predecessors = [-1] * len(candidates)
+    for index, (i, _) in enumerate(candidates):
+        pile = bisect_left(tails, i)
+        if pile == len(tails):
+            tails.append(i)
+            tail_indices.append(index)
+        else:
+            tails[pile] = i
+            tail_indices[pile] = index
+        predecessors[index] = tail_indices[pile - 1] if pile > 0 else -1
+
+    anchors = []
+    index = tail_indices[-1]
+    while index != -1:
+        anchors.append(candidates[index])
+        index = predecessors[index]
+    anchors.reverse()
+    return anchors
+
+
+def myers_matches(old: Sequence[int], new: Sequence[int], old_lo: int, old_hi: int,
+                  new_lo: int, new_hi: int, max_edits: int = MAX_MYERS_EDIT_DISTANCE):
+    """
+    Return matching (old_index, new_index) pairs using Myers' O((N+M)D) algorithm.
+
+    Returns None if the ranges differ by more than max_edits edits.
+    """
+    n = old_hi - old_lo
+    m = new_hi - new_lo
+    limit = min(n + m, max_edits)
+    offset = limit + 1
+    furthest = [0] * (2 * limit + 3)
+    trace = []
+
+    for d in range(limit + 1):
+        trace.append(furthest[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and furthest[offset + k - 1] < furthest[offset + k + 1]):
+                x = furthest[offset + k + 1]
+            else:
+                x = furthest[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and old[old_lo + x] == new[new_lo + y]:
+                x += 1
+                y += 1
+            furthest[offset + k] = x
+            if x >= n and y >= m:
+                return backtrack_myers(trace, offset, n, m, d, old_lo, new_lo)
+    return None
+
+
+def backtrack_myers(trace, offset, x, y, d, old_lo, new_lo):
+    matches = []
+    for depth in range(d, 0, -1):
+        furthest = trace[depth]
+        k = x - y
+        if k == -depth or (k != depth and furthest[offset + k - 1] < furthest[offset + k + 1]):
+            prev_k = k + 1
+        else:
+            prev_k = k - 1
+        prev_x = furthest[offset + prev_k]
+        prev_y = prev_x - prev_k
+        while x > prev_x and y > prev_y:
+            x -= 1
+            y -= 1
+            matches.append((old_lo + x, new_lo + y))
+        x, y = prev_x, prev_y
+    while x > 0 and y > 0:
+        x -= 1
+        y -= 1
+        matches.append((old_lo + x, new_lo + y))
+    matches.reverse()
+    return matches
+
+
+def diff_hashes(old: Sequence[int], new: Sequence[int]) -> List[Hunk]:
+    """
+    Diff two sequences of line hashes and return the ordered non-matching hunks.
+
+    Common prefixes and suffixes are trimmed, lines unique to both sides anchor the
+    alignment (patience diff), and the remaining gaps are aligned with Myers' algorithm.
+    """
+    matches: List[Tuple[int, int]] = []
+    stack = [(0, len(old), 0, len(new))]
+    while stack:
+        old_lo, old_hi, new_lo, new_hi = stack.pop()
+
+        while old_lo < old_hi and new_lo < new_hi and old[old_lo] == new[new_lo]:
+            matches.append((old_lo, new_lo))
+            old_lo += 1
+            new_lo += 1
+        while old_lo < old_hi and new_lo < new_hi and old[old_hi - 1] == new[new_hi - 1]:
+            old_hi -= 1
+            new_hi -= 1
+            matches.append((old_hi, new_hi))
+        if old_lo == old_hi or new_lo == new_hi:
+            continue
+
+        anchors = patience_anchors(old, new, old_lo, old_hi, new_lo, new_hi)
+        if anchors:
+            previous_old, previous_new = old_lo, new_lo
+            for anchor_old, anchor_new in anchors:
+                matches.append((anchor_old, anchor_new))
+                if anchor_old > previous_old or anchor_new > previous_new:
+                    stack.append((previous_old, anchor_old, previous_new, anchor_new))
+                previous_old, previous_new = anchor_old + 1, anchor_new + 1
+            if old_hi > previous_old or new_hi > previous_new:
+                stack.append((previous_old, old_hi, previous_new, new_hi))
+            continue
+
+        # A gap with no lines in common is a plain replacement, no alignment needed
+        if set(old[old_lo:old_hi]).isdisjoint(new[new_lo:new_hi]):
+            continue
+
+        gap_matches = myers_matches(old, new, old_lo, old_hi, new_lo, new_hi)
+        if gap_matches:
+            matches.extend(gap_matches)
+
+    # Turn the sorted matches into the hunks between them
+    matches.sort()
+    hunks = []
+    previous_old = previous_new = 0
+    for i, j in matches + [(len(old), len(new))]:
+        if i > previous_old or j > previous_new:
+            hunks.append((previous_old, i, previous_new, j))
+        previous_old, previous_new = i + 1, j + 1
+    return hunks
+
+
+def compare_document_versions(old_lines: List[str], new_lines: List[str]) -> Dict[str, Any]:
+    """Compare two versions of document text and return changes in document order."""
+    return compare_line_hashes([line_hash(line) for line in old_lines], new_lines)
+
+
+def compare_line_hashes(old_hashes: List[int], new_lines: List[str]) -> Dict[str, Any]:
+    """Compare the stored line hashes of a document with its current lines."""
+    return compare_hashed_items(old_hashes, [line_hash(line) for line in new_lines], new_lines)
+
+
+def compare_hashed_items(old_hashes: List[int], new_hashes: List[int], new_items: List[Any]) -> Dict[str, Any]:
+    """
+    Compare the stored hashes of a document's items (lines or blocks) with its current items.
+
+    Inserted items are 'added'; items that replace removed items are 'modified'. An item whose
+    content already existed elsewhere in the old version was moved or duplicated, not written,
+    so it is not reported.
+    """
+    old_hash_set = set(old_hashes)
+
+    added_items = []
+    modified_items = []
+    hunks = []
+    for old_start, old_end, new_start, new_end in diff_hashes(old_hashes, new_hashes):
+        kind = 'modified' if old_end > old_start else 'added'
+        items = [new_items[j] for j in range(new_start, new_end) if new_hashes[j] not in old_hash_set]
+        if new_end == new_start:
+            kind = 'removed'
+        elif kind == 'modified':
+            modified_items.extend(items)
+        else:
+            added_items.extend(items)
+        hunks.append({
+            'type': kind,
+            'old_range': (old_start, old_end),
+            'new_range': (new_start, new_end),
+            'lines': items
+        })
+
+    return {
+        'added': added_items,
+        'modified': modified_items,
+        'hunks': hunks,
+        'total_changes': len(added_items) + len(modified_items)
+    }
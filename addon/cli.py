@@ -0,0 +1,153 @@
+"""
+Command-line entry point: run a workflow outside Anki.
+
+    python -m notes2flash.cli my_workflow.yml --input notes_url=... --json cards.jsonl
+
+Cards are written as JSON Lines (the default, to stdout), to a standalone collection or
+to an .apkg package. With --dry-run, changes are only detected and the expected API calls,
+tokens, cost and duration are printed; nothing is sent to the LLM or recorded. --record saves
+every HTTP exchange of the run to a cassette file and --replay serves them back offline
+(see cassette.py). Configuration comes from config.json, the file named by
+NOTES2FLASH_CONFIG, or the OPENROUTER_API_KEY / NOTION_API_KEY environment variables.
+Pipeline modules are imported only after the arguments are parsed, and nothing here
+imports aqt.
+"""
+import argparse
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+WORKFLOW_CONFIGS_DIR = os.path.join(current_dir, "workflow_configs")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="notes2flash", description="Run a Notes2Flash workflow without Anki.")
+    parser.add_argument("workflow", help="Workflow YAML file, or the name of one in workflow_configs/")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="NAME=VALUE",
+                        help="Value for one of the workflow's user_inputs (repeatable)")
+    parser.add_argument("-c", "--config", help="JSON config file with API keys (default: config.json)")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--json", metavar="PATH", help="Write cards as JSON Lines to PATH, '-' for stdout (default)")
+    output.add_argument("--collection", metavar="PATH", help="Add cards to a standalone Anki collection file")
+    output.add_argument("--apkg", metavar="PATH", help="Export cards as an .apkg package")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only estimate the API calls, tokens, cost and duration of the run")
+    cassette = parser.add_mutually_exclusive_group()
+    cassette.add_argument("--record", metavar="CASSETTE", help="Record the run's HTTP exchanges to a cassette file")
+    cassette.add_argument("--replay", metavar="CASSETTE", help="Replay HTTP exchanges from a cassette instead of sending them")
+    parser.add_argument("--replay-speed", type=float, default=1.0, metavar="FACTOR",
+                        help="Scale recorded response times when replaying (1 = as recorded, 0 = no waiting)")
+    parser.add_argument("--debug", action="store_true", help="Enable debug logging in notes2flash.log")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print progress messages")
+    return parser
+
+
+def resolve_workflow_path(workflow: str) -> str:
+    if os.path.exists(workflow):
+        return os.path.abspath(workflow)
+    for candidate in (workflow, workflow + ".yml"):
+        path = os.path.join(WORKFLOW_CONFIGS_DIR, candidate)
+        if os.path.exists(path):
+            return path
+    raise FileNotFoundError(f"Workflow not found: {workflow}")
+
+
+def parse_inputs(values: List[str]) -> Dict[str, str]:
+    user_inputs = {}
+    for value in values:
+        name, separator, text = value.partition('=')
+        if not separator or not name:
+            raise ValueError(f"Inputs must look like NAME=VALUE, got '{value}'")
+        user_inputs[name] = text
+    return user_inputs
+
+
+def apply_output(workflow_config: Dict[str, Any], output_key: str, path: str) -> None:
+    """Point every add_cards_to_anki stage at the chosen output file."""
+    targets = workflow_config['add_cards_to_anki']
+    targets = targets if isinstance(targets, list) else [targets]
+    for index, target in enumerate(targets):
+        if len(targets) > 1 and output_key != 'output_json':
+            # Separate collections/packages per stage; JSON Lines outputs can share a file
+            stem, extension = os.path.splitext(path)
+            target[output_key] = f"{stem}.{index}{extension}"
+        else:
+            target[output_key] = path
+
+
+def plan_run(workflow_config: Dict[str, Any], user_inputs: Dict[str, str], args: argparse.Namespace) -> int:
+    from .workflow_engine import WorkflowEngine
+    from .dry_run import format_plan
+
+    def report(message):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    try:
+        plan = WorkflowEngine(workflow_config, user_inputs, debug=args.debug).plan_workflow(report)
+    except Exception as e:
+        print(f"notes2flash: {e}", file=sys.stderr)
+        return 1
+    print(format_plan(plan))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.config:
+        os.environ["NOTES2FLASH_CONFIG"] = os.path.abspath(args.config)
+
+    # The pipeline is imported only now, so --help and argument errors return immediately
+    from .notes2flash import notes2flash
+    from .workflow_engine import WorkflowEngine
+    from .cassette import CassetteError, open_cassette
+
+    try:
+        workflow_path = resolve_workflow_path(args.workflow)
+        user_inputs = parse_inputs(args.input)
+        workflow_config = WorkflowEngine.load_workflow_config(workflow_path)
+        cassette = open_cassette(args.record, args.replay, args.replay_speed)
+    except (OSError, ValueError, CassetteError) as e:
+        print(f"notes2flash: {e}", file=sys.stderr)
+        return 2
+
+    missing = [name for name in workflow_config['user_inputs'] if not user_inputs.get(name)]
+    if missing:
+        print(f"notes2flash: missing inputs: {', '.join(missing)} (pass them with --input NAME=VALUE)", file=sys.stderr)
+        return 2
+
+    if args.dry_run:
+        return plan_run(workflow_config, user_inputs, args)
+
+    if args.collection:
+        apply_output(workflow_config, 'output_collection', os.path.abspath(args.collection))
+    elif args.apkg:
+        apply_output(workflow_config, 'output_apkg', os.path.abspath(args.apkg))
+    else:
+        json_path = args.json or '-'
+        if json_path != '-':
+            json_path = os.path.abspath(json_path)
+            open(json_path, 'w').close()  # Stages append to it
+        apply_output(workflow_config, 'output_json', json_path)
+
+    def report(message):
+        if not args.quiet:
+            print(message, file=sys.stderr)
+
+    try:
+        result = notes2flash(workflow_path, user_inputs, progress_callback=report, debug=args.debug,
+                             workflow_config=workflow_config, cassette=cassette)
+    except RuntimeError as e:
+        if "No changes detected" in str(e):
+            report("No changes detected, nothing to do")
+            return 0
+        print(f"notes2flash: {e}", file=sys.stderr)
+        return 1
+
+    report(f"{result.get('cards_added', 0)} cards written, {result.get('duplicates', 0)} duplicates skipped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+In-memory add-on configuration.
+
+The config is loaded once (from Anki's add-on manager, or from config.json and environment
+variables outside Anki) and handed out as an immutable snapshot, so worker threads read it
+without disk I/O and without touching Qt-owned state. Inside Anki, saving the add-on config
+dialog replaces the snapshot through the add-on manager's config-updated hook; runs already
+going keep the snapshot they started with.
+"""
+import threading
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
+from .logger import get_logger
+
+logger = get_logger()
+
+_lock = threading.Lock()
+_snapshot: Optional[Mapping[str, Any]] = None
+
+
+def freeze(value: Any) -> Any:
+    """Return a read-only copy: dicts become mapping proxies and lists become tuples."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def unwrap(config: Any) -> Dict[str, Any]:
+    """Accept both the plain config and the meta.json structure that nests it under 'config'."""
+    if not isinstance(config, dict):
+        return {}
+    if isinstance(config.get('config'), dict):
+        return config['config']
+    return config
+
+
+def get_config() -> Mapping[str, Any]:
+    """Return the current config snapshot, loading it on first use."""
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is not None:
+        return snapshot
+    with _lock:
+        if _snapshot is None:
+            from .scrape_utils import load_config
+            _snapshot = freeze(unwrap(load_config()))
+        return _snapshot
+
+
+def set_config(config: Dict[str, Any]) -> Mapping[str, Any]:
+    """Replace the snapshot with a new config."""
+    global _snapshot
+    snapshot = freeze(unwrap(config))
+    with _lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def on_addon_config_updated(config: Dict[str, Any]) -> None:
+    """
+    Config-updated hook of Anki's add-on manager: runs on the main thread after the user saves the config.
+
+    The add-on manager keeps the saved config in meta.json, so nothing is written here; config.json
+    holds only the defaults and never the user's keys.
+    """
+    set_config(config)
+    logger.info("Add-on config updated")
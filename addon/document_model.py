@@ -0,0 +1,125 @@
+"""Lightweight document model shared by all scrapers."""
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+PARAGRAPH = 'paragraph'
+HEADING = 'heading'
+LIST_ITEM = 'list_item'
+CODE = 'code'
+QUOTE = 'quote'
+TABLE = 'table'
+
+MARKDOWN_HEADING_PATTERN = re.compile(r'^(#{1,6})\s')
+GOOGLE_HEADING_STYLES = {'HEADING_1': 1, 'HEADING_2': 2, 'HEADING_3': 3}
+
+
+class Line:
+    """A single line of scraped text together with its structural metadata."""
+
+    __slots__ = ('text', 'kind', 'level', 'block_id')
+
+    def __init__(self, text: str, kind: str = PARAGRAPH, level: int = 0, block_id: Optional[str] = None):
+        self.text = text
+        self.kind = kind
+        self.level = level
+        self.block_id = block_id
+
+    def __repr__(self):
+        return f"Line({self.text!r}, kind={self.kind!r}, level={self.level}, block_id={self.block_id!r})"
+
+
+class Document:
+    """An ordered list of non-empty lines plus the source revision identifier."""
+
+    __slots__ = ('lines', 'revision_id')
+
+    def __init__(self, lines: Optional[List[Line]] = None, revision_id: Optional[str] = None):
+        self.lines = lines if lines is not None else []
+        self.revision_id = revision_id
+
+    def append(self, text: str, kind: str = PARAGRAPH, level: int = 0, block_id: Optional[str] = None) -> None:
+        """Append a line, skipping text that is empty once stripped."""
+        text = text.strip()
+        if text:
+            self.lines.append(Line(text, kind, level, block_id))
+
+    def texts(self) -> List[str]:
+        """Return the plain text of every line, in document order."""
+        return [line.text for line in self.lines]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self) -> Iterator[Line]:
+        return iter(self.lines)
+
+
+def document_from_text(text: str, revision_id: Optional[str] = None, paragraph_per_line: bool = False) -> Document:
+    """
+    Build a Document from plain text or Markdown.
+
+    Blank lines separate blocks, so consecutive lines of the same paragraph share a block ID.
+    Set paragraph_per_line for exports where every line is already a paragraph (e.g. Google Docs text).
+    Markdown headings keep their '#' prefix in the text and are tagged with their level.
+    """
+    document = Document(revision_id=revision_id)
+    lines = document.lines
+    block_index = 0
+    in_block = False
+
+    for raw_line in text.split('\n'):
+        stripped = raw_line.strip()
+        if not stripped:
+            if in_block:
+                block_index += 1
+                in_block = False
+            continue
+
+        heading = MARKDOWN_HEADING_PATTERN.match(stripped)
+        if heading:
+            # Headings always form their own block
+            if in_block:
+                block_index += 1
+            lines.append(Line(stripped, HEADING, len(heading.group(1)), str(block_index)))
+            block_index += 1
+            in_block = False
+            continue
+
+        lines.append(Line(stripped, PARAGRAPH, 0, str(block_index)))
+        if paragraph_per_line:
+            block_index += 1
+        else:
+            in_block = True
+
+    return document
+
+
+def document_from_google_doc(doc: Dict[str, Any]) -> Document:
+    """Build a Document from a Google Docs API JSON response."""
+    document = Document(revision_id=doc.get('revisionId'))
+    lines = document.lines
+
+    for index, element in enumerate(doc.get('body', {}).get('content', [])):
+        block_id = str(index)
+        if 'paragraph' in element:
+            paragraph = element['paragraph']
+            style = paragraph.get('paragraphStyle', {}).get('namedStyleType')
+            level = GOOGLE_HEADING_STYLES.get(style, 0)
+
+            # Only non-empty text runs contribute to the line
+            runs = []
+            for elem in paragraph.get('elements', []):
+                if 'textRun' in elem:
+                    run_text = elem['textRun'].get('content', '')
+                    if run_text.strip():
+                        runs.append(run_text)
+
+            text = ''.join(runs).strip()
+            if text:
+                lines.append(Line(text, HEADING if level else PARAGRAPH, level, block_id))
+
+        elif 'table' in element:
+            # Tables are represented by a placeholder line (simplified)
+            lines.append(Line('\n[Table Content]\n', TABLE, 0, block_id))
+
+    return document
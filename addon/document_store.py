@@ -0,0 +1,254 @@
+"""SQLite-backed store for tracked document state."""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .change_detection import line_hash
+from .logger import get_logger
+
+logger = get_logger()
+
+current_dir = os.path.dirname(__file__)
+STORE_FILE = os.path.join(current_dir, "notes2flash.db")
+LEGACY_TRACKED_DOCS_FILE = os.path.join(current_dir, "tracked_docs.json")
+
+SCHEMA_VERSION = 5
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    last_updated TEXT,
+    version TEXT,
+    successfully_added_to_anki INTEGER NOT NULL DEFAULT 0,
+    pending_changes TEXT NOT NULL DEFAULT '[]',
+    source_url TEXT,
+    source_type TEXT
+);
+CREATE TABLE IF NOT EXISTS block_fingerprints (
+    doc_id TEXT NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    fingerprint INTEGER NOT NULL,
+    PRIMARY KEY (doc_id, position)
+) WITHOUT ROWID;
+-- Per-line hashes from before block fingerprints; read once to carry tracking over, then dropped per document
+CREATE TABLE IF NOT EXISTS line_hashes (
+    doc_id TEXT NOT NULL REFERENCES documents(doc_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    hash INTEGER NOT NULL,
+    PRIMARY KEY (doc_id, position)
+) WITHOUT ROWID;
+-- Content hashes of the notes in each target deck, used by duplicate_index.py
+CREATE TABLE IF NOT EXISTS deck_note_index (
+    collection TEXT NOT NULL,
+    deck_id INTEGER NOT NULL,
+    content_hash INTEGER NOT NULL,
+    PRIMARY KEY (collection, deck_id, content_hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS deck_index_state (
+    collection TEXT NOT NULL,
+    deck_id INTEGER NOT NULL,
+    note_count INTEGER NOT NULL,
+    max_mod INTEGER NOT NULL,
+    PRIMARY KEY (collection, deck_id)
+);
+-- Queued workflow runs, see job_queue.py
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    workflow_path TEXT NOT NULL,
+    user_inputs TEXT NOT NULL,
+    debug INTEGER NOT NULL DEFAULT 0,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, priority DESC, id);
+-- Memoized outputs of processing steps, see step_cache.py
+CREATE TABLE IF NOT EXISTS step_cache (
+    key TEXT PRIMARY KEY,
+    step TEXT,
+    model TEXT,
+    output TEXT NOT NULL,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    last_used TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_path = None
+
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection to the store, creating and migrating it on first use."""
+    global _initialized_path
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and _local.path == STORE_FILE:
+        return connection
+
+    connection = sqlite3.connect(STORE_FILE, timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    _local.connection = connection
+    _local.path = STORE_FILE
+
+    with _init_lock:
+        if _initialized_path != STORE_FILE:
+            initialize_store(connection)
+            _initialized_path = STORE_FILE
+    return connection
+
+
+def close_connection() -> None:
+    """Close this thread's connection, e.g. before the store file is deleted."""
+    connection = getattr(_local, 'connection', None)
+    if connection is not None:
+        connection.close()
+        _local.connection = None
+
+
+@contextmanager
+def transaction(connection: Optional[sqlite3.Connection] = None):
+    """Run a block in a write transaction that is committed atomically or rolled back."""
+    connection = connection or get_connection()
+    # IMMEDIATE takes the write lock up front so concurrent runs wait instead of failing mid-update
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield connection
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def initialize_store(connection: sqlite3.Connection) -> None:
+    """Create the schema and import tracked_docs.json once if it exists."""
+    connection.executescript(SCHEMA)
+    if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    migrate_legacy_json(connection)
+
+
+def migrate_legacy_json(connection: sqlite3.Connection) -> None:
+    """Import documents from the old tracked_docs.json file, then rename it so this runs only once."""
+    if not os.path.exists(LEGACY_TRACKED_DOCS_FILE):
+        return
+
+    with open(LEGACY_TRACKED_DOCS_FILE, 'r') as f:
+        tracked_docs = json.load(f)
+
+    with transaction(connection):
+        for doc_id, state in tracked_docs.items():
+            exists = connection.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if not exists:
+                write_document(connection, doc_id, None, state)
+                connection.executemany(
+                    "INSERT INTO line_hashes (doc_id, position, hash) VALUES (?, ?, ?)",
+                    ((doc_id, position, line_hash(line)) for position, line in enumerate(state.get('lines', [])))
+                )
+
+    os.replace(LEGACY_TRACKED_DOCS_FILE, LEGACY_TRACKED_DOCS_FILE + ".migrated")
+    logger.info(f"Migrated {len(tracked_docs)} tracked documents from {LEGACY_TRACKED_DOCS_FILE} to {STORE_FILE}")
+
+
+def write_document(connection: sqlite3.Connection, doc_id: str, fingerprints: Optional[List[int]], state: Dict[str, Any]) -> None:
+    """Upsert a document row and, if fingerprints are given, replace its block fingerprints."""
+    connection.execute(
+        """
+        INSERT INTO documents (doc_id, last_updated, version, successfully_added_to_anki, pending_changes, source_url, source_type)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(doc_id) DO UPDATE SET
+            last_updated = excluded.last_updated,
+            version = excluded.version,
+            successfully_added_to_anki = excluded.successfully_added_to_anki,
+            pending_changes = excluded.pending_changes,
+            source_url = COALESCE(excluded.source_url, documents.source_url),
+            source_type = COALESCE(excluded.source_type, documents.source_type)
+        """,
+        (
+            doc_id,
+            state.get('last_updated') or datetime.now().isoformat(),
+            state.get('version'),
+            1 if state.get('successfully_added_to_anki') else 0,
+            json.dumps(state.get('pending_changes') or []),
+            state.get('source_url'),
+            state.get('source_type'),
+        )
+    )
+    if fingerprints is not None:
+        connection.execute("DELETE FROM block_fingerprints WHERE doc_id = ?", (doc_id,))
+        connection.execute("DELETE FROM line_hashes WHERE doc_id = ?", (doc_id,))
+        connection.executemany(
+            "INSERT INTO block_fingerprints (doc_id, position, fingerprint) VALUES (?, ?, ?)",
+            ((doc_id, position, fingerprint) for position, fingerprint in enumerate(fingerprints))
+        )
+
+
+def row_to_state(row: tuple, block_fingerprints: List[int], line_hashes: List[int]) -> Dict[str, Any]:
+    return {
+        'block_fingerprints': block_fingerprints,
+        'line_hashes': line_hashes,
+        'last_updated': row[0],
+        'version': row[1],
+        'successfully_added_to_anki': bool(row[2]),
+        'pending_changes': json.loads(row[3]),
+        'source_url': row[4],
+        'source_type': row[5]
+    }
+
+
+def load_document(doc_id: str) -> Optional[Dict[str, Any]]:
+    """Load the stored state of a document, or None if it is not tracked."""
+    connection = get_connection()
+    row = connection.execute(
+        "SELECT last_updated, version, successfully_added_to_anki, pending_changes, source_url, source_type "
+        "FROM documents WHERE doc_id = ?", (doc_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    block_fingerprints = [fingerprint for (fingerprint,) in connection.execute(
+        "SELECT fingerprint FROM block_fingerprints WHERE doc_id = ? ORDER BY position", (doc_id,))]
+    line_hashes = [hash_value for (hash_value,) in connection.execute(
+        "SELECT hash FROM line_hashes WHERE doc_id = ? ORDER BY position", (doc_id,))]
+    return row_to_state(row, block_fingerprints, line_hashes)
+
+
+def save_document(doc_id: str, fingerprints: Optional[List[int]], state: Dict[str, Any]) -> None:
+    """Atomically write a document's state (and its block fingerprints when fingerprints is not None)."""
+    with transaction() as connection:
+        write_document(connection, doc_id, fingerprints, state)
+
+
+def set_document_processed(doc_id: str) -> bool:
+    """Mark a document as added to Anki and clear its pending changes. Returns False if it is not tracked."""
+    with transaction() as connection:
+        cursor = connection.execute(
+            "UPDATE documents SET successfully_added_to_anki = 1, pending_changes = '[]' WHERE doc_id = ?",
+            (doc_id,)
+        )
+    return cursor.rowcount > 0
+
+
+def delete_documents(doc_ids: List[str]) -> int:
+    """Forget the state of documents that no longer exist. Returns how many were tracked."""
+    with transaction() as connection:
+        return sum(connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount
+                   for doc_id in doc_ids)
+
+
+def find_documents_with_pending_changes(doc_id_prefix: str) -> Dict[str, List[str]]:
+    """Return {doc_id: pending_changes} for unprocessed documents whose ID starts with the prefix."""
+    connection = get_connection()
+    rows = connection.execute(
+        "SELECT doc_id, pending_changes FROM documents "
+        "WHERE substr(doc_id, 1, ?) = ? AND successfully_added_to_anki = 0 AND pending_changes != '[]'",
+        (len(doc_id_prefix), doc_id_prefix)
+    )
+    return {doc_id: json.loads(pending_changes) for doc_id, pending_changes in rows}
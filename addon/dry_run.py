@@ -0,0 +1,274 @@
+"""
+Dry-run planning: predict the API calls, tokens, cost and duration of a workflow run.
+
+The planner chunks the scraped changes exactly like process_notes_to_cards and compiles
+each step's prompt to estimate its prompt tokens. Completion tokens and latency come from
+the per-model statistics of earlier runs in traces/ (see tracing.py), with conservative
+defaults for models that have no history yet. Steps whose output is already in the step
+cache (see step_cache.py) are counted as cached, with no calls or tokens. No completions are
+requested.
+"""
+import json
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Union
+from .processing_utils import (
+    split_content_into_chunks,
+    format_prompt_safely,
+    get_content_key_from_previous_step,
+    get_nested_value,
+    get_openrouter_models,
+    validate_step_config
+)
+from .step_cache import step_cache_key, load_step_output
+from .tracing import TRACES_DIR
+from .logger import get_logger
+
+logger = get_logger()
+
+CHARS_PER_TOKEN = 4  # Rough average for English text; no tokenizer is bundled
+MESSAGE_OVERHEAD_TOKENS = 40  # System message with the request ID plus chat formatting
+DEFAULT_OUTPUT_RATIO = 0.5  # Completion tokens per prompt token for models without history
+DEFAULT_MS_PER_COMPLETION_TOKEN = 25.0
+DEFAULT_MS_PER_CALL = 8000.0
+MAX_RETRY_RATE = 0.8
+FIRST_RETRY_DELAY = 10  # Seconds, as in call_openrouter_api
+
+# Content whose text is not known yet (the output of an earlier chain) is planned by its length
+Content = Union[str, int]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def load_model_history(traces_dir: str = TRACES_DIR) -> Dict[str, Dict[str, float]]:
+    """Sum the per-model statistics stored in the summaries of the trace files."""
+    history: Dict[str, Dict[str, float]] = {}
+    try:
+        names = sorted(name for name in os.listdir(traces_dir) if name.endswith('.json'))
+    except FileNotFoundError:
+        return history
+    for name in names:
+        try:
+            with open(os.path.join(traces_dir, name), 'r', encoding='utf-8') as f:
+                models = json.load(f)['otherData']['summary']['models']
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.debug(f"Skipping trace {name} for model history: {str(e)}")
+            continue
+        for model, stats in models.items():
+            totals = history.setdefault(model, {})
+            for key in ('attempts', 'failed', 'total_ms', 'prompt_tokens', 'completion_tokens'):
+                totals[key] = totals.get(key, 0) + (stats.get(key) or 0)
+    return history
+
+
+def model_profile(model: str, history: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    """Return the output ratio, latency and retry rate to plan with for a model."""
+    stats = history.get(model)
+    if not stats or not stats.get('attempts'):
+        return {'output_ratio': DEFAULT_OUTPUT_RATIO, 'ms_per_completion_token': DEFAULT_MS_PER_COMPLETION_TOKEN,
+                'ms_per_call': DEFAULT_MS_PER_CALL, 'retry_rate': 0.0, 'from_history': False}
+    succeeded = stats['attempts'] - stats.get('failed', 0)
+    prompt_tokens, completion_tokens = stats.get('prompt_tokens', 0), stats.get('completion_tokens', 0)
+    return {
+        'output_ratio': completion_tokens / prompt_tokens if prompt_tokens and completion_tokens else DEFAULT_OUTPUT_RATIO,
+        # Failed attempts take time too, so latency is spread over the tokens of successful ones
+        'ms_per_completion_token': stats['total_ms'] / completion_tokens if completion_tokens else None,
+        'ms_per_call': stats['total_ms'] / max(succeeded, 1),
+        'retry_rate': min(stats.get('failed', 0) / stats['attempts'], MAX_RETRY_RATE),
+        'from_history': True
+    }
+
+
+def load_model_prices(models: List[str], config: Optional[Dict[str, Any]] = None,
+                      fetch: bool = True) -> Dict[str, Optional[Dict[str, float]]]:
+    """
+    Return {model: {'prompt': USD per token, 'completion': USD per token}} or None where unknown.
+
+    Free models (':free') cost nothing. Prices in the add-on config's model_prices (USD per
+    million tokens) win; otherwise they are looked up in OpenRouter's public model list.
+    """
+    configured = (config or {}).get('model_prices') or {}
+    prices: Dict[str, Optional[Dict[str, float]]] = {}
+    for model in models:
+        if model.endswith(':free'):
+            prices[model] = {'prompt': 0.0, 'completion': 0.0}
+        elif model in configured:
+            prices[model] = {kind: float(configured[model].get(kind, 0)) / 1_000_000 for kind in ('prompt', 'completion')}
+
+    missing = [model for model in models if model not in prices]
+    if missing and fetch:
+        listed = get_openrouter_models()
+        for model in missing:
+            if model in listed:
+                pricing = listed[model].get('pricing') or {}
+                prices[model] = {kind: float(pricing.get(kind) or 0) for kind in ('prompt', 'completion')}
+    for model in models:
+        prices.setdefault(model, None)
+    return prices
+
+
+def plan_chunks(content: Content, chunk_size: int) -> List[Content]:
+    """Chunk content as process_notes_to_cards would; estimated content is split by length."""
+    if not content:
+        return []  # The engine skips chains without new content
+    if isinstance(content, str):
+        return split_content_into_chunks(content, chunk_size)
+    return [chunk_size] * (content // chunk_size) + ([content % chunk_size] if content % chunk_size else [])
+
+
+def planned_input(data: Dict[str, Any], key: str) -> Content:
+    root = data.get(key.split('.')[0], "")
+    if '.' not in key or not isinstance(root, dict):
+        return root
+    try:
+        return get_nested_value(data, key)
+    except KeyError:
+        return ""
+
+
+def compile_prompt_tokens(prompt: str, step_input: Dict[str, Content]) -> int:
+    """Estimate the prompt tokens of a step, counting estimated inputs only where the prompt uses them."""
+    markers = {key: f"\x00{index}\x00" for index, (key, value) in enumerate(step_input.items()) if not isinstance(value, str)}
+    compiled = format_prompt_safely(prompt, {key: markers.get(key, value) for key, value in step_input.items()})
+    estimated_chars = sum(compiled.count(marker) * step_input[key] for key, marker in markers.items())
+    compiled = re.sub(r"\x00\d+\x00", "", compiled)
+    return estimate_tokens(compiled) + math.ceil(estimated_chars / CHARS_PER_TOKEN) + MESSAGE_OVERHEAD_TOKENS
+
+
+def plan_chain(steps: List[Dict[str, Any]], data: Dict[str, Content], workflow_config: Dict[str, Any],
+               content_key: Optional[str], history: Dict[str, Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Plan one processing chain: its chunks, and the calls, tokens and time of every step.
+
+    Returns the chain plan with 'outputs' mapping each step's output key to its estimated length
+    in characters, so chains reading those outputs can be planned in turn.
+    """
+    if not content_key:
+        content_key, _ = get_content_key_from_previous_step(0, steps, workflow_config)
+    chunk_size = int(steps[0].get('chunk_size', 4000))
+    chunks = plan_chunks(data.get(content_key) or "", chunk_size)
+
+    step_plans = []
+    for step_index, step_config in enumerate(steps):
+        validated = validate_step_config(step_config, step_index, steps)
+        profile = model_profile(validated['model'], history)
+        step_plans.append({
+            'step': step_config.get('step', f"step {step_index + 1}"),
+            'model': validated['model'],
+            'output': validated['output_name'],
+            'calls': 0, 'cached': 0, 'attempts': 0.0, 'prompt_tokens': 0, 'completion_tokens': 0, 'seconds': 0.0,
+            'cached_chars': 0,
+            'from_history': profile['from_history'],
+            'validated': validated,
+            'profile': profile
+        })
+
+    for chunk in chunks:
+        previous_output = None
+        chunk_outputs: Dict[str, Content] = {}  # Earlier steps' outputs for this chunk, by length
+        # Real outputs of the earlier steps while all of them came from the step cache
+        cached_outputs: Optional[Dict[str, Any]] = {} if isinstance(chunk, str) else None
+        for step_index, step_plan in enumerate(step_plans):
+            validated, profile = step_plan['validated'], step_plan['profile']
+            if step_index == 0:
+                chunk_key, chunk_value = content_key, chunk
+            else:
+                chunk_key, _ = get_content_key_from_previous_step(step_index, steps, workflow_config)
+                chunk_value = previous_output
+            step_data = dict(data, **chunk_outputs) if chunk_outputs else data
+            step_input = {key.split('.')[-1]: planned_input(step_data, key) for key in validated['input_keys']}
+            step_input[chunk_key] = chunk_value
+
+            # The cache key needs the real inputs, which are known until a step would call the API
+            cached = None
+            if validated['cache'] and cached_outputs is not None and all(isinstance(value, str) for value in step_input.values()):
+                cached = load_step_output(step_cache_key(chunk, validated, step_input, cached_outputs), touch=False)
+            if cached is not None:
+                value = cached['value']
+                output = value if step_index == len(step_plans) - 1 else json.dumps(value) if value else ""
+                step_plan['cached'] += 1
+                step_plan['cached_chars'] += len(output) if isinstance(output, str) else len(json.dumps(output))
+                cached_outputs[step_plan['output']] = output
+                previous_output = output
+                chunk_outputs[step_plan['output']] = output
+                continue
+            cached_outputs = None
+
+            prompt_tokens = compile_prompt_tokens(validated['prompt'], step_input)
+            completion_tokens = math.ceil(prompt_tokens * profile['output_ratio'])
+            if profile['ms_per_completion_token']:
+                call_ms = completion_tokens * profile['ms_per_completion_token']
+            else:
+                call_ms = profile['ms_per_call']
+            # Each failed attempt costs another call plus the retry delay
+            attempts = 1 / (1 - profile['retry_rate'])
+            step_plan['calls'] += 1
+            step_plan['attempts'] += attempts
+            step_plan['prompt_tokens'] += math.ceil(prompt_tokens * attempts)
+            step_plan['completion_tokens'] += math.ceil(completion_tokens * attempts)
+            step_plan['seconds'] += call_ms / 1000 * attempts + (attempts - 1) * FIRST_RETRY_DELAY
+            previous_output = completion_tokens * CHARS_PER_TOKEN
+            chunk_outputs[step_plan['output']] = previous_output
+
+    outputs = {}
+    for step_plan in step_plans:
+        del step_plan['validated'], step_plan['profile']
+        step_plan['attempts'] = round(step_plan['attempts'], 1)
+        step_plan['seconds'] = round(step_plan['seconds'], 1)
+        outputs[step_plan['output']] = step_plan['completion_tokens'] * CHARS_PER_TOKEN + step_plan.pop('cached_chars')
+    return {
+        'chunks': len(chunks),
+        'chunk_size': chunk_size,
+        'steps': step_plans,
+        'seconds': round(sum(step_plan['seconds'] for step_plan in step_plans), 1),
+        'outputs': outputs
+    }
+
+
+def add_costs(plan: Dict[str, Any], prices: Dict[str, Optional[Dict[str, float]]]) -> None:
+    """Fill in the cost of every step and the total; unknown prices leave the cost as None."""
+    total = 0.0
+    for chain in plan['chains']:
+        for step_plan in chain['steps']:
+            price = prices.get(step_plan['model'])
+            if price is None:
+                step_plan['cost'] = None
+                total = None
+            else:
+                step_plan['cost'] = round(step_plan['prompt_tokens'] * price['prompt']
+                                          + step_plan['completion_tokens'] * price['completion'], 6)
+                if total is not None:
+                    total += step_plan['cost']
+    plan['cost'] = round(total, 6) if total is not None else None
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Render a plan as a short plain-text report."""
+    cost = 'unknown' if plan['cost'] is None else f"${plan['cost']:.4f}"
+    lines = [
+        f"Dry run of '{plan['workflow']}': {plan['changed_blocks']} changed blocks in {plan['documents']} documents",
+        f"Expected: {plan['calls']} API calls, ~{plan['prompt_tokens']:,} prompt + ~{plan['completion_tokens']:,} completion tokens, "
+        f"cost {cost}, about {format_duration(plan['seconds'])}"
+    ]
+    for chain in plan['chains']:
+        lines.append(f"  {chain['name']}: {chain['chunks']} chunks of up to {chain['chunk_size']} chars, "
+                     f"{format_duration(chain['seconds'])}")
+        for step_plan in chain['steps']:
+            cost = 'cost unknown' if step_plan['cost'] is None else f"${step_plan['cost']:.4f}"
+            source = 'history' if step_plan['from_history'] else 'defaults, no history yet'
+            cached = f" ({step_plan['cached']} cached)" if step_plan['cached'] else ""
+            lines.append(f"    {step_plan['step']} ({step_plan['model']}): {step_plan['calls']} calls{cached}, "
+                         f"~{step_plan['prompt_tokens']:,} + ~{step_plan['completion_tokens']:,} tokens, {cost} ({source})")
+    lines.append("Token counts are estimated at ~4 characters per token; durations assume no queueing at the API.")
+    return "\n".join(lines)
@@ -0,0 +1,142 @@
+"""Persistent per-deck index of note content hashes for constant-time duplicate checks."""
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from .document_store import get_connection, transaction
+from .logger import get_logger
+
+logger = get_logger()
+
+FIELD_SEPARATOR = '\x1f'  # Anki's own separator in the notes.flds column
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Cards of a deck include cards temporarily moved into a filtered deck (odid)
+DECK_NOTES_QUERY = (
+    "SELECT DISTINCT n.id, n.mid, n.flds FROM notes n JOIN cards c ON c.nid = n.id "
+    "WHERE c.did = ? OR c.odid = ?"
+)
+DECK_STATE_QUERY = (
+    "SELECT COUNT(DISTINCT n.id), COALESCE(MAX(n.mod), 0) FROM notes n JOIN cards c ON c.nid = n.id "
+    "WHERE c.did = ? OR c.odid = ?"
+)
+
+
+def normalize_field_value(value: str) -> str:
+    """Normalize a field value the way Anki's field search compares it: Unicode, whitespace and case."""
+    return WHITESPACE_PATTERN.sub(' ', unicodedata.normalize('NFC', value)).strip().casefold()
+
+
+def content_hash(fields: Dict[str, str]) -> int:
+    """Return a 64-bit hash of a note's non-empty fields, independent of field order."""
+    pairs = sorted(
+        f"{name.casefold()}{FIELD_SEPARATOR}{normalize_field_value(value)}"
+        for name, value in fields.items() if value.strip()
+    )
+    digest = hashlib.blake2b('\x1e'.join(pairs).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def note_guid(deck_name: str, note_type_name: str, fields: Dict[str, str]) -> str:
+    """
+    Derive a deterministic note GUID from the target deck, note type and card content.
+
+    Regenerating the same card produces the same GUID, so re-imports and syncs recognize it.
+    """
+    key = f"{deck_name.casefold()}{FIELD_SEPARATOR}{note_type_name.casefold()}{FIELD_SEPARATOR}{content_hash(fields)}"
+    return "n2f" + hashlib.blake2b(key.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def available_note_guids(col, deck_name: str, note_type_name: str,
+                         cards_fields: List[Dict[str, str]]) -> List[Optional[str]]:
+    """
+    Return the deterministic GUID of each new note, or None where a note in the collection
+    already has it (e.g. the card was moved to another deck or edited) so the note keeps the
+    random GUID Anki assigns.
+    """
+    guids = [note_guid(deck_name, note_type_name, fields) for fields in cards_fields]
+    taken = set()
+    for start in range(0, len(guids), 500):  # Stay below SQLite's bound parameter limit
+        batch = guids[start:start + 500]
+        placeholders = ', '.join('?' * len(batch))
+        taken.update(col.db.list(f"SELECT guid FROM notes WHERE guid IN ({placeholders})", *batch))
+    return [None if guid in taken else guid for guid in guids]
+
+
+def deck_state(col, deck_id: int) -> Tuple[int, int]:
+    """Return (note count, latest note modification time) for a deck, used to detect stale indexes."""
+    note_count, max_mod = col.db.first(DECK_STATE_QUERY, deck_id, deck_id)
+    return note_count or 0, max_mod or 0
+
+
+def iter_deck_note_hashes(col, deck_id: int) -> Iterable[int]:
+    """Yield the content hash of every note in a deck, read straight from the collection."""
+    field_names: Dict[int, List[str]] = {}
+    for _, model_id, flds in col.db.execute(DECK_NOTES_QUERY, deck_id, deck_id):
+        names = field_names.get(model_id)
+        if names is None:
+            model = col.models.get(model_id)
+            names = [field['name'] for field in model['flds']] if model else []
+            field_names[model_id] = names
+        yield content_hash(dict(zip(names, flds.split(FIELD_SEPARATOR))))
+
+
+def rebuild_deck_index(col, deck_id: int, state: Tuple[int, int]) -> Set[int]:
+    """Rebuild the stored index of a deck from the collection."""
+    hashes = set(iter_deck_note_hashes(col, deck_id))
+    with transaction() as connection:
+        connection.execute("DELETE FROM deck_note_index WHERE collection = ? AND deck_id = ?", (col.path, deck_id))
+        connection.executemany(
+            "INSERT INTO deck_note_index (collection, deck_id, content_hash) VALUES (?, ?, ?)",
+            ((col.path, deck_id, hash_value) for hash_value in hashes)
+        )
+        save_deck_state(connection, col.path, deck_id, state)
+    logger.info(f"Rebuilt duplicate index for deck {deck_id}: {len(hashes)} notes")
+    return hashes
+
+
+def save_deck_state(connection, collection_path: str, deck_id: int, state: Tuple[int, int]) -> None:
+    connection.execute(
+        "INSERT INTO deck_index_state (collection, deck_id, note_count, max_mod) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(collection, deck_id) DO UPDATE SET note_count = excluded.note_count, max_mod = excluded.max_mod",
+        (collection_path, deck_id, state[0], state[1])
+    )
+
+
+def load_deck_index(col, deck_id: int) -> Set[int]:
+    """
+    Return the set of content hashes of the notes in a deck.
+
+    The stored index is reused while the deck's note count and latest modification time
+    match what was recorded, and rebuilt from the collection otherwise (e.g. after the user
+    edited or deleted notes).
+    """
+    state = deck_state(col, deck_id)
+    connection = get_connection()
+    stored = connection.execute(
+        "SELECT note_count, max_mod FROM deck_index_state WHERE collection = ? AND deck_id = ?",
+        (col.path, deck_id)
+    ).fetchone()
+    if stored is None or tuple(stored) != state:
+        return rebuild_deck_index(col, deck_id, state)
+
+    return {hash_value for (hash_value,) in connection.execute(
+        "SELECT content_hash FROM deck_note_index WHERE collection = ? AND deck_id = ?", (col.path, deck_id))}
+
+
+def record_added_notes(col, deck_id: int, hashes: Iterable[int]) -> None:
+    """Add the hashes of newly inserted notes to a deck's index and mark it current."""
+    state = deck_state(col, deck_id)
+    with transaction() as connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO deck_note_index (collection, deck_id, content_hash) VALUES (?, ?, ?)",
+            ((col.path, deck_id, hash_value) for hash_value in hashes)
+        )
+        save_deck_state(connection, col.path, deck_id, state)
+
+
+def forget_collection(collection_path: str) -> None:
+    """Drop every stored index of a collection, e.g. a temporary one used for an export."""
+    with transaction() as connection:
+        connection.execute("DELETE FROM deck_note_index WHERE collection = ?", (collection_path,))
+        connection.execute("DELETE FROM deck_index_state WHERE collection = ?", (collection_path,))
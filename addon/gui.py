@@ -1,38 +1,60 @@
-from aqt.qt import (QDialog, QVBoxLayout, QLabel, QLineEdit, QPushButton, 
-                         QApplication, QComboBox, QMessageBox, QCheckBox, 
-                         QTextEdit, QWidget, QThread, pyqtSignal, QTimer)
-from aqt import mw
-from aqt.utils import showInfo
-from .notes2flash import notes2flash
+from aqt.qt import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton, 
+                         QApplication, QComboBox, QMessageBox, QCheckBox, QSpinBox,
+                         QTextEdit, QWidget, QThread, QObject, pyqtSignal, QTimer,
+                         QTableWidget, QTableWidgetItem, QAbstractItemView, QProgressBar, QListWidget)
+from aqt import mw, gui_hooks
+from aqt.utils import showInfo, tooltip
 from .workflow_engine import WorkflowEngine
+from .scrape_utils import parse_url
+from .config_service import get_config
+from .watch_notes import NoteWatcher
+from .cancellation import CancellationToken, CancelledError
+from .dry_run import format_duration
+from .job_queue import (JobRunner, DEFAULT_MAX_CONCURRENT_JOBS, QUEUED, RUNNING, FAILED,
+                        enqueue_job, list_jobs, retry_job, cancel_job, clear_finished_jobs)
 from aqt.deckbrowser import DeckBrowser
 import os
 import yaml
 import json
+import threading
 from .logger import get_logger
 
 logger = get_logger()
 
+# The watch mode and the job runner outlive the dialog, so they are kept at module level
+active_watch = None
+job_runner = None
+
 class Notes2FlashWorker(QThread):
     finished = pyqtSignal(dict)
     error = pyqtSignal(str)
     progress = pyqtSignal(str)
+    progress_event = pyqtSignal(object)  # ProgressSnapshot, already throttled by the run
+    cancelled = pyqtSignal(str)
 
-    def __init__(self, workflow_config_path, user_inputs, debug_mode):
+    def __init__(self, workflow_config_path, user_inputs, debug_mode, changed_paths=None):
         super().__init__()
         self.workflow_config_path = workflow_config_path
         self.user_inputs = user_inputs
         self.debug_mode = debug_mode
+        self.changed_paths = changed_paths
+        self.cancel_token = CancellationToken()
 
     def run(self):
+        from .notes2flash import notes2flash
         try:
             result = notes2flash(
                 self.workflow_config_path, 
                 self.user_inputs, 
                 progress_callback=lambda msg: self.progress.emit(msg),
-                debug=self.debug_mode
+                debug=self.debug_mode,
+                changed_paths=self.changed_paths,
+                cancel_token=self.cancel_token,
+                progress_listener=self.progress_event.emit
             )
             self.finished.emit(result)
+        except CancelledError as e:
+            self.cancelled.emit(str(e))
         except Exception as e:
             error_message = f"An error occurred: {str(e)}"
             if self.debug_mode:
@@ -44,6 +66,231 @@ class Notes2FlashWorker(QThread):
                     error_message += "\n\nCould not read debug log."
             self.error.emit(error_message)
 
+class PlanWorker(QThread):
+    """Runs a dry run of a workflow in the background and emits the plan as a report."""
+    finished = pyqtSignal(str)
+    error = pyqtSignal(str)
+
+    def __init__(self, workflow_config_path, user_inputs, debug_mode):
+        super().__init__()
+        self.workflow_config_path = workflow_config_path
+        self.user_inputs = user_inputs
+        self.debug_mode = debug_mode
+
+    def run(self):
+        from .dry_run import format_plan
+        try:
+            workflow_config = WorkflowEngine.load_workflow_config(self.workflow_config_path)
+            plan = WorkflowEngine(workflow_config, self.user_inputs, debug=self.debug_mode).plan_workflow()
+            self.finished.emit(format_plan(plan))
+        except Exception as e:
+            self.error.emit(f"Could not estimate the run: {str(e)}")
+
+class WatchModeController(QObject):
+    """Re-runs a workflow whenever notes in a watched local folder change."""
+    batch_ready = pyqtSignal(list, bool)
+
+    def __init__(self, workflow_config_path, user_inputs, vault_path, debug_mode):
+        super().__init__(mw)
+        self.workflow_config_path = workflow_config_path
+        self.user_inputs = user_inputs
+        self.vault_path = vault_path
+        self.debug_mode = debug_mode
+        self.worker = None
+        self.batch_done = threading.Event()
+        self.watcher = NoteWatcher(vault_path, self.wait_for_batch_run)
+        self.batch_ready.connect(self.run_batch)
+
+    def start(self):
+        self.watcher.start()
+
+    def stop(self):
+        self.watcher.stopped.set()
+        if self.worker and self.worker.isRunning():
+            self.worker.cancel_token.cancel()
+        self.batch_done.set()
+        self.watcher.stop()
+
+    def wait_for_batch_run(self, changed_paths, full_rescan):
+        # Runs on the watcher thread. Blocking here until the run finishes lets
+        # saves made in the meantime coalesce into the next batch.
+        self.batch_done.clear()
+        self.batch_ready.emit(changed_paths, full_rescan)
+        self.batch_done.wait()
+
+    def run_batch(self, changed_paths, full_rescan):
+        logger.info(f"Watch mode run for {len(changed_paths)} changed files" + (" (full rescan)" if full_rescan else ""))
+        self.worker = Notes2FlashWorker(
+            self.workflow_config_path,
+            self.user_inputs,
+            self.debug_mode,
+            changed_paths=None if full_rescan else changed_paths
+        )
+        self.worker.finished.connect(self.on_batch_finished)
+        self.worker.error.connect(self.on_batch_error)
+        self.worker.cancelled.connect(lambda message: self.batch_done.set())
+        self.worker.start()
+
+    def on_batch_finished(self, result):
+        tooltip(f"Notes2Flash: {result.get('cards_added', 0)} cards added from changed notes")
+        mw.reset()
+        self.batch_done.set()
+
+    def on_batch_error(self, error_message):
+        if "No changes detected" in error_message:
+            logger.info("Watch mode: saved files had no new content")
+        else:
+            tooltip("Notes2Flash watch mode: run failed, see notes2flash.log")
+        self.batch_done.set()
+
+def start_watch_mode(workflow_config_path, user_inputs, vault_path, debug_mode):
+    global active_watch
+    stop_watch_mode()
+    active_watch = WatchModeController(workflow_config_path, user_inputs, vault_path, debug_mode)
+    active_watch.start()
+    tooltip(f"Notes2Flash: watching {vault_path}")
+
+def stop_watch_mode():
+    global active_watch
+    if active_watch is not None:
+        active_watch.stop()
+        active_watch = None
+
+gui_hooks.profile_will_close.append(stop_watch_mode)
+
+def run_queued_job(job, progress_callback, before_stage, cancel_token):
+    from .notes2flash import notes2flash
+    try:
+        return notes2flash(
+            job['workflow_path'],
+            job['user_inputs'],
+            progress_callback=progress_callback,
+            debug=job['debug'],
+            before_stage=before_stage,
+            cancel_token=cancel_token
+        )
+    except RuntimeError as e:
+        # Notes without new content are not a failed job
+        if "No changes detected" in str(e):
+            return {'cards_added': 0}
+        raise
+
+def on_queued_job_finished(job):
+    # Runs on a worker thread
+    def notify():
+        name = os.path.basename(job['workflow_path'])
+        if job['status'] == FAILED:
+            tooltip(f"Notes2Flash: job {job['id']} ({name}) failed, see the job queue")
+        else:
+            tooltip(f"Notes2Flash: job {job['id']} ({name}) added {job['result'].get('cards_added', 0)} cards")
+            mw.reset()
+    mw.taskman.run_on_main(notify)
+
+def get_job_runner():
+    """Return the job runner, starting it on first use."""
+    global job_runner
+    if job_runner is None:
+        max_concurrent_jobs = int(get_config().get('max_concurrent_jobs', DEFAULT_MAX_CONCURRENT_JOBS))
+        job_runner = JobRunner(run_queued_job, max_concurrent_jobs, on_queued_job_finished)
+        job_runner.start()
+    return job_runner
+
+def stop_job_runner():
+    """Shut down running jobs before the profile's collection closes, without blocking the main thread."""
+    global job_runner
+    if job_runner is not None:
+        job_runner.stop()
+        job_runner = None
+
+gui_hooks.profile_will_close.append(stop_job_runner)
+
+class JobQueueDialog(QDialog):
+    """Lists queued, running and finished jobs and lets the user retry or remove them."""
+    COLUMNS = ["ID", "Workflow", "Priority", "Status", "Details", "Queued at"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Notes2Flash Job Queue")
+        self.resize(760, 360)
+
+        layout = QVBoxLayout()
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.retry_button = QPushButton("Retry Failed")
+        self.retry_button.clicked.connect(self.handle_retry)
+        buttons.addWidget(self.retry_button)
+        self.cancel_button = QPushButton("Remove Queued")
+        self.cancel_button.clicked.connect(self.handle_cancel)
+        buttons.addWidget(self.cancel_button)
+        self.clear_button = QPushButton("Clear Finished")
+        self.clear_button.clicked.connect(self.handle_clear)
+        buttons.addWidget(self.clear_button)
+        close_button = QPushButton("Close")
+        close_button.clicked.connect(self.accept)
+        buttons.addWidget(close_button)
+        layout.addLayout(buttons)
+        self.setLayout(layout)
+
+        self.jobs = []
+        self.refresh_timer = QTimer()
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+        self.finished.connect(self.refresh_timer.stop)
+        self.refresh()
+
+    def refresh(self):
+        self.jobs = list_jobs()
+        progress = job_runner.progress if job_runner is not None else {}
+        self.table.setRowCount(len(self.jobs))
+        for row, job in enumerate(self.jobs):
+            if job['status'] == RUNNING:
+                details = progress.get(job['id'], "")
+            elif job['status'] == FAILED:
+                details = job['error'] or ""
+            elif job['result']:
+                details = f"{job['result'].get('cards_added', 0)} cards added"
+            else:
+                details = ""
+            values = [str(job['id']), os.path.basename(job['workflow_path']), str(job['priority']),
+                      job['status'], details, (job['created_at'] or "")[:19].replace('T', ' ')]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                item.setToolTip(value)
+                self.table.setItem(row, column, item)
+
+    def selected_jobs(self):
+        rows = {index.row() for index in self.table.selectionModel().selectedRows()}
+        return [self.jobs[row] for row in sorted(rows) if row < len(self.jobs)]
+
+    def handle_retry(self):
+        retried = [job for job in self.selected_jobs() if retry_job(job['id'])]
+        if retried:
+            get_job_runner().notify()
+        self.refresh()
+
+    def handle_cancel(self):
+        for job in self.selected_jobs():
+            if job['status'] == QUEUED:
+                cancel_job(job['id'])
+        self.refresh()
+
+    def handle_clear(self):
+        clear_finished_jobs()
+        self.refresh()
+
+def show_job_queue(parent):
+    # Start the runner so jobs queued in an earlier session resume
+    get_job_runner()
+    dialog = JobQueueDialog(parent)
+    dialog.exec()
+
 class CustomInputDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -70,6 +317,15 @@ class CustomInputDialog(QDialog):
         self.debug_checkbox = QCheckBox("Enable Debug Mode")
         self.layout.addWidget(self.debug_checkbox)
 
+        # Watch mode (local folders only)
+        self.watch_checkbox = QCheckBox("Keep watching local folder and add cards when notes change")
+        self.layout.addWidget(self.watch_checkbox)
+        self.stop_watch_button = QPushButton("Stop Watching")
+        self.stop_watch_button.clicked.connect(self.handle_stop_watch)
+        self.stop_watch_button.setVisible(active_watch is not None)
+        self.layout.addWidget(self.stop_watch_button)
+        self.watch_vault_path = None
+
         # Progress label
         self.progress_label = QLabel("Status: Ready")
         self.layout.addWidget(self.progress_label)
@@ -79,12 +335,42 @@ class CustomInputDialog(QDialog):
         self.long_process_label.hide()
         self.layout.addWidget(self.long_process_label)
 
+        # Live progress of a run: chunks, throughput, ETA and the latest generated cards
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("Chunks %v/%m")
+        self.progress_bar.hide()
+        self.layout.addWidget(self.progress_bar)
+        self.progress_stats_label = QLabel()
+        self.progress_stats_label.hide()
+        self.layout.addWidget(self.progress_stats_label)
+        self.card_preview_list = QListWidget()
+        self.card_preview_list.setMaximumHeight(110)
+        self.card_preview_list.hide()
+        self.layout.addWidget(self.card_preview_list)
+
         # Submit/Cancel button
         self.submit_button = QPushButton("Submit")
         self.layout.addWidget(self.submit_button)
         self.submit_button.clicked.connect(self.handle_button_click)
         self.is_processing = False
 
+        # Queue the run instead of waiting for it
+        queue_row = QHBoxLayout()
+        queue_row.addWidget(QLabel("Queue priority:"))
+        self.priority_spinbox = QSpinBox()
+        self.priority_spinbox.setRange(-100, 100)
+        queue_row.addWidget(self.priority_spinbox)
+        self.queue_button = QPushButton("Add to Queue")
+        self.queue_button.clicked.connect(self.handle_add_to_queue)
+        queue_row.addWidget(self.queue_button)
+        self.layout.addLayout(queue_row)
+
+        # Dry run: predict calls, tokens, cost and duration without processing
+        self.estimate_button = QPushButton("Estimate Cost and Time")
+        self.estimate_button.clicked.connect(self.handle_estimate)
+        self.layout.addWidget(self.estimate_button)
+        self.plan_worker = None
+
         # Set layout to dialog
         self.setLayout(self.layout)
 
@@ -175,6 +461,16 @@ class CustomInputDialog(QDialog):
             QMessageBox.warning(self, "Input Error", "All fields are required.")
             return
 
+        workflow_config_path = os.path.join(os.path.dirname(__file__), "workflow_configs", workflow_config)
+
+        # Watch mode needs a local folder as the notes source
+        self.watch_vault_path = None
+        if self.watch_checkbox.isChecked():
+            self.watch_vault_path = self.resolve_local_vault(workflow_config_path, user_inputs)
+            if not self.watch_vault_path:
+                QMessageBox.warning(self, "Watch Mode", "Watch mode only works with a local notes folder.")
+                return
+
         # Save user inputs
         self.save_user_inputs(workflow_config, user_inputs)
 
@@ -182,14 +478,13 @@ class CustomInputDialog(QDialog):
         self.is_processing = True
         self.dots_timer.start()
         
-        # Hide the long process label (in case it was shown from a previous run)
+        # Hide the long process label and the progress panel (in case they were shown from a previous run)
         self.long_process_label.hide()
+        self.reset_progress_panel()
         
         # Start the timer for showing the long process message
         self.long_process_timer.start(5000)  # Show message after 5 seconds
 
-        workflow_config_path = os.path.join(os.path.dirname(__file__), "workflow_configs", workflow_config)
-        
         # Create and setup worker thread
         self.worker = Notes2FlashWorker(
             workflow_config_path,
@@ -197,10 +492,76 @@ class CustomInputDialog(QDialog):
             self.debug_checkbox.isChecked()
         )
         self.worker.progress.connect(self.update_progress)
+        self.worker.progress_event.connect(self.update_progress_panel)
         self.worker.finished.connect(self.on_processing_finished)
         self.worker.error.connect(self.on_processing_error)
+        self.worker.cancelled.connect(self.on_processing_cancelled)
         self.worker.start()
 
+    def handle_add_to_queue(self):
+        workflow_config = self.workflow_dropdown.currentText()
+        user_inputs = {name: field.text() for name, field in self.input_fields.items()}
+        if any(not value for value in user_inputs.values()):
+            QMessageBox.warning(self, "Input Error", "All fields are required.")
+            return
+
+        self.save_user_inputs(workflow_config, user_inputs)
+        workflow_config_path = os.path.join(os.path.dirname(__file__), "workflow_configs", workflow_config)
+        job_id = enqueue_job(workflow_config_path, user_inputs, self.priority_spinbox.value(), self.debug_checkbox.isChecked())
+        get_job_runner().notify()
+        self.update_progress(f"Queued as job {job_id}")
+        tooltip(f"Notes2Flash: queued job {job_id}, see Tools > Notes2Flash Job Queue")
+
+    def handle_estimate(self):
+        workflow_config = self.workflow_dropdown.currentText()
+        user_inputs = {name: field.text() for name, field in self.input_fields.items()}
+        if any(not value for value in user_inputs.values()):
+            QMessageBox.warning(self, "Input Error", "All fields are required.")
+            return
+
+        workflow_config_path = os.path.join(os.path.dirname(__file__), "workflow_configs", workflow_config)
+        self.estimate_button.setEnabled(False)
+        self.update_progress("Estimating...")
+        self.plan_worker = PlanWorker(workflow_config_path, user_inputs, self.debug_checkbox.isChecked())
+        self.plan_worker.finished.connect(self.on_estimate_finished)
+        self.plan_worker.error.connect(self.on_estimate_error)
+        self.plan_worker.start()
+
+    def on_estimate_finished(self, report):
+        self.estimate_button.setEnabled(True)
+        self.update_progress("Ready")
+        self.show_error_dialog("Estimate", report)
+
+    def on_estimate_error(self, error_message):
+        self.estimate_button.setEnabled(True)
+        self.update_progress("Ready")
+        self.show_error_dialog("Estimate", error_message)
+
+    def resolve_local_vault(self, workflow_config_path, user_inputs):
+        """Return the local folder the workflow scrapes, or None if its source is not local."""
+        try:
+            workflow_config = WorkflowEngine.load_workflow_config(workflow_config_path)
+            scrape_config = workflow_config['scrape_notes']
+            url_template = scrape_config[0].get('url') if isinstance(scrape_config, list) else scrape_config.get('url')
+            source_info = parse_url(url_template.format(**user_inputs))
+        except Exception as e:
+            logger.warning(f"Could not resolve notes source for watch mode: {str(e)}")
+            return None
+        return source_info['id'] if source_info['type'] == 'local_vault' else None
+
+    def start_watch_if_requested(self):
+        if self.watch_vault_path:
+            workflow_config_path = os.path.join(os.path.dirname(__file__), "workflow_configs", self.workflow_dropdown.currentText())
+            user_inputs = {name: field.text() for name, field in self.input_fields.items()}
+            start_watch_mode(workflow_config_path, user_inputs, self.watch_vault_path, self.debug_checkbox.isChecked())
+            self.stop_watch_button.setVisible(True)
+            self.watch_vault_path = None
+
+    def handle_stop_watch(self):
+        stop_watch_mode()
+        self.stop_watch_button.setVisible(False)
+        self.update_progress("Stopped watching")
+
     def on_processing_finished(self, result):
         # Stop timers
         self.dots_timer.stop()
@@ -209,11 +570,13 @@ class CustomInputDialog(QDialog):
         # Reset UI
         self.is_processing = False
         self.submit_button.setText("Submit")
+        self.submit_button.setEnabled(True)
         self.long_process_label.hide()
         self.update_progress("Complete")
         
         QMessageBox.information(self, "Success", 
             f"Flashcards generated successfully! {result.get('cards_added', 0)} cards added.")
+        self.start_watch_if_requested()
         self.refresh_anki_decks()
         self.accept()
 
@@ -225,10 +588,60 @@ class CustomInputDialog(QDialog):
         # Reset UI
         self.is_processing = False
         self.submit_button.setText("Submit")
+        self.submit_button.setEnabled(True)
         self.long_process_label.hide()
         
+        # An unchanged folder is fine for watch mode, later edits will be picked up
+        if "No changes detected" in error_message:
+            self.start_watch_if_requested()
         self.show_error_dialog("Error", error_message)
 
+    def on_processing_cancelled(self, message):
+        # Reset UI
+        self.is_processing = False
+        self.submit_button.setText("Submit")
+        self.submit_button.setEnabled(True)
+        self.long_process_label.hide()
+        self.long_process_timer.stop()
+
+        self.update_progress("Cancelled")
+        QMessageBox.information(self, "Cancelled", message)
+        self.refresh_anki_decks()
+
+    def reset_progress_panel(self):
+        for widget in (self.progress_bar, self.progress_stats_label, self.card_preview_list):
+            widget.hide()
+        self.card_preview_list.clear()
+
+    def update_progress_panel(self, snapshot):
+        # The panel shows the ETA, so the generic "can take a while" notice is no longer needed
+        self.long_process_timer.stop()
+        self.long_process_label.hide()
+
+        if snapshot.chunks_total:
+            self.progress_bar.setMaximum(snapshot.chunks_total)
+            self.progress_bar.setValue(snapshot.chunks_done)
+            self.progress_bar.show()
+
+        stats = []
+        if snapshot.step:
+            stats.append(f"Step: {snapshot.step}")
+        stats.append(f"Requests in flight: {snapshot.in_flight}")
+        stats.append(f"Cards: {snapshot.cards_committed} committed / {snapshot.cards_generated} generated")
+        if snapshot.completion_tokens:
+            stats.append(f"{snapshot.tokens_per_second:.0f} tokens/s")
+        if snapshot.retries:
+            stats.append(f"Retries: {snapshot.retries}")
+        if snapshot.eta_seconds is not None and not snapshot.final:
+            stats.append(f"ETA: {format_duration(snapshot.eta_seconds)}")
+        self.progress_stats_label.setText("\n".join(stats))
+        self.progress_stats_label.show()
+
+        if snapshot.preview:
+            self.card_preview_list.clear()
+            self.card_preview_list.addItems(snapshot.preview)
+            self.card_preview_list.show()
+
     def update_progress(self, status):
         self.progress_label.setText(f"Status: {status}")
 
@@ -260,18 +673,12 @@ class CustomInputDialog(QDialog):
     def handle_button_click(self):
         if self.is_processing:
             if self.worker and self.worker.isRunning():
-                self.worker.terminate()
-                self.worker.wait()
-                
-                # Reset UI
-                self.is_processing = False
-                self.submit_button.setText("Submit")
-                self.long_process_label.hide()
+                # The run stops at its next check and keeps finished chunks; on_processing_cancelled resets the UI
+                self.worker.cancel_token.cancel()
                 self.dots_timer.stop()
-                self.long_process_timer.stop()
-                
-                self.update_progress("Cancelled")
-                QMessageBox.information(self, "Cancelled", "Processing was cancelled.")
+                self.submit_button.setText("Cancelling...")
+                self.submit_button.setEnabled(False)
+                self.update_progress("Cancelling, keeping finished chunks")
         else:
             self.submit_data()
 
@@ -0,0 +1,246 @@
+"""Persistent queue of workflow runs and the worker pool that executes them."""
+import json
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from .cancellation import POLL_INTERVAL, CancellationToken, CancelledError
+from .document_store import get_connection, transaction
+from .workflow_graph import PROCESS
+from .logger import get_logger
+
+logger = get_logger()
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+DEFAULT_MAX_CONCURRENT_JOBS = 2
+IDLE_POLL_SECONDS = 2.0  # Fallback wake-up for jobs queued by another process
+JOB_COLUMNS = "id, workflow_path, user_inputs, debug, priority, status, created_at, started_at, finished_at, error, result"
+
+
+def row_to_job(row: tuple) -> Dict[str, Any]:
+    return {
+        'id': row[0],
+        'workflow_path': row[1],
+        'user_inputs': json.loads(row[2]),
+        'debug': bool(row[3]),
+        'priority': row[4],
+        'status': row[5],
+        'created_at': row[6],
+        'started_at': row[7],
+        'finished_at': row[8],
+        'error': row[9],
+        'result': json.loads(row[10]) if row[10] else None
+    }
+
+
+def enqueue_job(workflow_path: str, user_inputs: Dict[str, Any], priority: int = 0, debug: bool = False) -> int:
+    """Add a workflow run to the queue and return its job ID. Higher priorities run first."""
+    with transaction() as connection:
+        cursor = connection.execute(
+            "INSERT INTO jobs (workflow_path, user_inputs, debug, priority, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (workflow_path, json.dumps(user_inputs), 1 if debug else 0, priority, QUEUED, datetime.now().isoformat())
+        )
+    logger.info(f"Queued job {cursor.lastrowid}: {workflow_path} (priority {priority})")
+    return cursor.lastrowid
+
+
+def claim_next_job() -> Optional[Dict[str, Any]]:
+    """Atomically mark the highest-priority queued job as running and return it, or None if the queue is empty."""
+    with transaction() as connection:
+        row = connection.execute(
+            f"SELECT {JOB_COLUMNS} FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1", (QUEUED,)
+        ).fetchone()
+        if row is None:
+            return None
+        started_at = datetime.now().isoformat()
+        connection.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, started_at, row[0]))
+    job = row_to_job(row)
+    job['status'] = RUNNING
+    job['started_at'] = started_at
+    return job
+
+
+def finish_job(job_id: int, result: Dict[str, Any]) -> None:
+    summary = {key: result.get(key) for key in ('cards_added', 'duplicates') if key in result}
+    with transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, error = NULL, result = ? WHERE id = ?",
+            (DONE, datetime.now().isoformat(), json.dumps(summary), job_id)
+        )
+
+
+def fail_job(job_id: int, error: str) -> None:
+    with transaction() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+            (FAILED, datetime.now().isoformat(), error, job_id)
+        )
+
+
+def list_jobs(statuses: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Return jobs in the order they will run (running first), optionally limited to some statuses."""
+    query = f"SELECT {JOB_COLUMNS} FROM jobs"
+    params: List[Any] = []
+    if statuses:
+        query += f" WHERE status IN ({', '.join('?' for _ in statuses)})"
+        params.extend(statuses)
+    query += " ORDER BY CASE status WHEN 'running' THEN 0 WHEN 'queued' THEN 1 ELSE 2 END, priority DESC, id"
+    return [row_to_job(row) for row in get_connection().execute(query, params)]
+
+
+def has_unfinished_jobs() -> bool:
+    """Check whether any job is queued or was left running."""
+    row = get_connection().execute("SELECT 1 FROM jobs WHERE status IN (?, ?) LIMIT 1", (QUEUED, RUNNING)).fetchone()
+    return row is not None
+
+
+def retry_job(job_id: int) -> bool:
+    """Put a failed job back in the queue. Returns False if the job is not failed."""
+    with transaction() as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL, finished_at = NULL, error = NULL WHERE id = ? AND status = ?",
+            (QUEUED, job_id, FAILED)
+        )
+    return cursor.rowcount > 0
+
+
+def cancel_job(job_id: int) -> bool:
+    """Remove a job that has not started yet. Returns False if it is already running or finished."""
+    with transaction() as connection:
+        cursor = connection.execute("DELETE FROM jobs WHERE id = ? AND status = ?", (job_id, QUEUED))
+    return cursor.rowcount > 0
+
+
+def clear_finished_jobs() -> int:
+    """Delete done and failed jobs from the queue and return how many were removed."""
+    with transaction() as connection:
+        cursor = connection.execute("DELETE FROM jobs WHERE status IN (?, ?)", (DONE, FAILED))
+    return cursor.rowcount
+
+
+def requeue_interrupted_jobs() -> int:
+    """Return jobs left running by a previous session (e.g. Anki was closed mid-run) to the queue."""
+    with transaction() as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+        )
+    if cursor.rowcount:
+        logger.info(f"Re-queued {cursor.rowcount} interrupted jobs")
+    return cursor.rowcount
+
+
+class JobRunner:
+    """
+    Worker pool that runs queued jobs concurrently.
+
+    At most max_concurrent_jobs jobs are past scraping at a time: a job takes an LLM slot
+    before its first processing stage and keeps it until it finishes. One extra worker
+    lets the next job scrape its notes while every slot is busy, so its content is ready
+    the moment a slot frees up. Card insertion is serialized in add_cards_to_anki.
+
+    Each running job has a CancellationToken; stop() shuts them down without waiting, and the
+    interrupted jobs are re-queued the next time a runner starts.
+    """
+
+    def __init__(self, run_job: Callable[..., Dict[str, Any]], max_concurrent_jobs: int = DEFAULT_MAX_CONCURRENT_JOBS,
+                 on_job_finished: Optional[Callable[[Dict[str, Any]], None]] = None):
+        # run_job(job, progress_callback, before_stage, cancel_token) runs the workflow and returns its result
+        self.run_job = run_job
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.on_job_finished = on_job_finished
+        self.llm_slots = threading.Semaphore(self.max_concurrent_jobs)
+        self.wakeup = threading.Condition()
+        self.stopped = threading.Event()
+        self.progress: Dict[int, str] = {}  # Job ID -> latest progress message of running jobs
+        self.cancel_tokens: Dict[int, CancellationToken] = {}  # Job ID -> token of running jobs
+        self.threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        requeue_interrupted_jobs()
+        self.stopped.clear()
+        self.threads = [
+            threading.Thread(target=self.work, name=f"notes2flash-job-{index}", daemon=True)
+            for index in range(self.max_concurrent_jobs + 1)
+        ]
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Job runner started: {self.max_concurrent_jobs} concurrent jobs plus one prefetching scrape")
+
+    def stop(self) -> None:
+        """
+        Stop taking new jobs and shut down the running ones, e.g. before the collection closes.
+
+        Returns without waiting: it runs on the main thread, which jobs may need for their
+        last collection write. Shut-down jobs drop such writes instead of waiting for it.
+        """
+        self.stopped.set()
+        for token in list(self.cancel_tokens.values()):
+            token.shut_down()
+        self.notify()
+        logger.info("Job runner stopped")
+
+    def notify(self) -> None:
+        """Wake idle workers, e.g. after a job was queued."""
+        with self.wakeup:
+            self.wakeup.notify_all()
+
+    def work(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                job = claim_next_job()
+            except Exception as e:
+                logger.error(f"Could not read the job queue: {e}")
+                job = None
+            if job is None:
+                with self.wakeup:
+                    self.wakeup.wait(IDLE_POLL_SECONDS)
+                continue
+            self.execute(job)
+
+    def execute(self, job: Dict[str, Any]) -> None:
+        job_id = job['id']
+        holds_slot = threading.Event()
+        slot_lock = threading.Lock()
+        cancel_token = CancellationToken()
+        self.cancel_tokens[job_id] = cancel_token
+        if self.stopped.is_set():
+            cancel_token.shut_down()
+
+        def before_stage(node):
+            # Processing branches of one job share its slot
+            if node.kind == PROCESS:
+                with slot_lock:
+                    if not holds_slot.is_set():
+                        self.progress[job_id] = "Waiting for a free LLM slot"
+                        while not self.llm_slots.acquire(timeout=POLL_INTERVAL):
+                            cancel_token.raise_if_cancelled()
+                        holds_slot.set()
+
+        def progress_callback(message):
+            self.progress[job_id] = message
+
+        logger.info(f"Starting job {job_id}: {job['workflow_path']}")
+        try:
+            result = self.run_job(job, progress_callback, before_stage, cancel_token)
+            finish_job(job_id, result)
+            job.update(status=DONE, result=result)
+            logger.info(f"Job {job_id} finished: {result.get('cards_added', 0)} cards added")
+        except CancelledError:
+            # Left as running, so requeue_interrupted_jobs picks it up when a runner starts again
+            logger.info(f"Job {job_id} interrupted by stop; it will run again next time")
+            return
+        except Exception as e:
+            fail_job(job_id, str(e))
+            job.update(status=FAILED, error=str(e))
+            logger.error(f"Job {job_id} failed: {e}")
+        finally:
+            if holds_slot.is_set():
+                self.llm_slots.release()
+            self.progress.pop(job_id, None)
+            self.cancel_tokens.pop(job_id, None)
+
+        if self.on_job_finished:
+            self.on_job_finished(job)
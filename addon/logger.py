@@ -1,12 +1,18 @@
 import logging
 import os
+import threading
+from contextlib import contextmanager
 
-def setup_logger(debug=False):
+_run_lock = threading.Lock()
+_active_runs = []  # Debug flags of the workflow runs currently logging
+
+def setup_logger(debug=False, truncate=True):
     """
     Set up a custom logger for notes2flash.
     
     Args:
         debug (bool): Whether to enable debug logging level
+        truncate (bool): Whether to start a new log file instead of appending to it
         
     Returns:
         logging.Logger: Configured logger instance
@@ -19,15 +25,17 @@ def setup_logger(debug=False):
     logger.setLevel(logging.DEBUG if debug else logging.INFO)
     
     # Create file handler
-    file_handler = logging.FileHandler(log_file, mode='w')
+    file_handler = logging.FileHandler(log_file, mode='w' if truncate else 'a')
     file_handler.setLevel(logging.DEBUG if debug else logging.INFO)
     
     # Create formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(formatter)
     
-    # Remove existing handlers to prevent duplicates
-    logger.handlers.clear()
+    # Close and remove existing handlers to prevent duplicates
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
     
     # Add handler to logger
     logger.addHandler(file_handler)
@@ -57,7 +65,42 @@ def reinitialize_logger(debug=False):
         logging.Logger: Reinitialized logger instance
     """
     global logger
-    logger = setup_logger(debug=debug)
+    with _run_lock:
+        # Never truncate the log under a run that is still writing to it
+        logger = setup_logger(debug=debug or any(_active_runs), truncate=not _active_runs)
     if debug:
         logger.debug("Debug mode enabled")
     return logger
+
+def set_level(debug):
+    level = logging.DEBUG if debug else logging.INFO
+    logger.setLevel(level)
+    for handler in logger.handlers:
+        handler.setLevel(level)
+
+@contextmanager
+def run_logging(debug=False):
+    """
+    Configure logging for the duration of one workflow run.
+
+    The first run to start begins a new notes2flash.log; runs that overlap it (the job queue,
+    watch mode) append to the same file. Debug logging stays on while any debug run is active,
+    so one job finishing doesn't change the level under another.
+
+    Args:
+        debug (bool): Whether the run wants debug logging
+    """
+    global logger
+    with _run_lock:
+        if not _active_runs:
+            logger = setup_logger(debug=debug)
+        _active_runs.append(debug)
+        set_level(any(_active_runs))
+    if debug:
+        logger.debug("Debug mode enabled")
+    try:
+        yield logger
+    finally:
+        with _run_lock:
+            _active_runs.remove(debug)
+            set_level(any(_active_runs))
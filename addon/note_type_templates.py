@@ -0,0 +1,105 @@
+"""Registry of the note type templates shipped in included_note_types/."""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import yaml
+from .logger import get_logger
+
+logger = get_logger()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(current_dir, "included_note_types")
+TEMPLATE_FIELD_PATTERN = re.compile(r'\{\{([^}#^/]+)\}\}')
+# Fields Anki fills in itself and any card template may reference
+BUILTIN_FIELDS = frozenset({'FrontSide', 'Tags', 'Type', 'Deck', 'Subdeck', 'Card', 'CardFlag', 'CardID'})
+
+# Templates keyed by lowercase note_type, plus the directory signature they were loaded from
+_registry: Dict[str, Dict[str, Any]] = {}
+_registry_signature: Optional[Tuple] = None
+_registry_stale = True  # Set by reload_templates(); the directory is only checked when this is set
+
+
+def templates_signature(templates_dir: str) -> Tuple:
+    """Return the (filename, mtime) of every template file; a change means the registry is stale."""
+    try:
+        entries = os.scandir(templates_dir)
+    except FileNotFoundError:
+        return ()
+    with entries:
+        return tuple(sorted(
+            (entry.name, entry.stat().st_mtime_ns) for entry in entries if entry.name.endswith('.yml')
+        ))
+
+
+def validate_template(template: Any) -> List[str]:
+    """Return the problems that would stop a template from being turned into an Anki note type."""
+    if not isinstance(template, dict):
+        return ["template is not a mapping"]
+
+    problems = []
+    if not isinstance(template.get('note_type'), str) or not template['note_type'].strip():
+        problems.append("missing 'note_type'")
+    fields = template.get('fields')
+    if not isinstance(fields, list) or not fields or not all(isinstance(field, str) for field in fields):
+        problems.append("'fields' must be a non-empty list of names")
+        fields = []
+    card = template.get('template')
+    if not isinstance(card, dict) or not all(isinstance(card.get(side), str) for side in ('front', 'back')):
+        problems.append("'template' must have 'front' and 'back'")
+    else:
+        # Field references such as {{Front}} must name a declared field or one of Anki's built-in fields
+        known_fields = set(fields) | BUILTIN_FIELDS
+        for side in ('front', 'back'):
+            for reference in TEMPLATE_FIELD_PATTERN.findall(card[side]):
+                name = reference.split(':')[-1].strip()
+                if name not in known_fields:
+                    problems.append(f"{side} template references unknown field '{name}'")
+    if not isinstance(template.get('styling', ''), str):
+        problems.append("'styling' must be a string")
+    return problems
+
+
+def load_registry(templates_dir: str) -> Dict[str, Dict[str, Any]]:
+    """Parse and validate every template file, indexing them by lowercase note type name."""
+    registry = {}
+    for filename in sorted(os.listdir(templates_dir)):
+        if not filename.endswith('.yml'):
+            continue
+        try:
+            with open(os.path.join(templates_dir, filename), 'r', encoding='utf-8') as f:
+                template = yaml.safe_load(f)
+        except Exception as e:
+            logger.error(f"Error reading template file {filename}: {e}")
+            continue
+
+        problems = validate_template(template)
+        if problems:
+            logger.error(f"Skipping invalid template file {filename}: {'; '.join(problems)}")
+            continue
+        template.setdefault('styling', '')
+        registry[template['note_type'].lower()] = template
+    logger.info(f"Loaded {len(registry)} note type templates from {templates_dir}")
+    return registry
+
+
+def reload_templates() -> None:
+    """Have the next lookup check the template files again; called once at the start of each run."""
+    global _registry_stale
+    _registry_stale = True
+
+
+def get_note_type_template(note_type_name: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the template for a note type name (case-insensitive), or None if there is none.
+
+    The template directory is checked at most once per reload_templates() call, and the files
+    are only re-read when one was added, removed or modified since they were loaded.
+    """
+    global _registry, _registry_signature, _registry_stale
+    if _registry_stale:
+        signature = templates_signature(TEMPLATES_DIR)
+        if signature != _registry_signature:
+            _registry = load_registry(TEMPLATES_DIR) if signature else {}
+            _registry_signature = signature
+        _registry_stale = False
+    return _registry.get(note_type_name.lower())
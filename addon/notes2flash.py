@@ -1,10 +1,12 @@
 from .workflow_engine import WorkflowEngine
-from .logger import get_logger, reinitialize_logger
+from .cancellation import CancelledError
+from .logger import get_logger
 
 # Get logger instance
 logger = get_logger()
 
-def notes2flash(workflow_config_path, user_inputs, progress_callback=None, debug=False):
+def notes2flash(workflow_config_path, user_inputs, progress_callback=None, debug=False, changed_paths=None, before_stage=None, workflow_config=None, cancel_token=None,
+                progress_listener=None, cassette=None):
     """
     Execute the notes2flash workflow using the specified configuration and user inputs.
 
@@ -13,6 +15,12 @@ def notes2flash(workflow_config_path, user_inputs, progress_callback=None, debug
         user_inputs (dict): Dictionary containing user-provided inputs for the workflow.
         progress_callback (function, optional): Callback function to report progress.
         debug (bool, optional): Enable debug mode for more verbose logging.
+        changed_paths (list, optional): Note files known to have changed (from watch mode).
+        before_stage (function, optional): Called with each workflow stage before it starts (used by the job queue).
+        workflow_config (dict, optional): Already loaded (and possibly adjusted) workflow config to run instead of reading the file.
+        cancel_token (CancellationToken, optional): Token the caller can cancel to stop the run cooperatively.
+        progress_listener (callable, optional): Receives throttled ProgressSnapshot events (see progress.py).
+        cassette (Cassette, optional): Records the run's HTTP exchanges or replays them (see cassette.py).
 
     Returns:
         dict: The final result of the workflow execution.
@@ -20,11 +28,8 @@ def notes2flash(workflow_config_path, user_inputs, progress_callback=None, debug
     Raises:
         ValueError: If the input parameters are invalid.
         RuntimeError: If there's an error during workflow execution.
+        CancelledError: If the run was cancelled; finished work has been kept.
     """
-    # Reinitialize logger with debug settings if debug mode is enabled
-    global logger
-    logger = reinitialize_logger(debug=debug)
-
     logger.info("Starting notes2flash execution")
 
     if not workflow_config_path or not isinstance(workflow_config_path, str):
@@ -37,12 +42,14 @@ def notes2flash(workflow_config_path, user_inputs, progress_callback=None, debug
 
     try:
         # Load the YAML workflow config
-        logger.info("Loading workflow configuration")
-        workflow_config = WorkflowEngine.load_workflow_config(workflow_config_path)
+        if workflow_config is None:
+            logger.info("Loading workflow configuration")
+            workflow_config = WorkflowEngine.load_workflow_config(workflow_config_path)
 
         # Run the workflow engine
         logger.info("Initializing WorkflowEngine")
-        engine = WorkflowEngine(workflow_config, user_inputs, debug=debug)
+        engine = WorkflowEngine(workflow_config, user_inputs, debug=debug, changed_paths=changed_paths, before_stage=before_stage,
+                                cancel_token=cancel_token, progress_listener=progress_listener, cassette=cassette)
         
         logger.info("Running workflow")
         success = engine.run_workflow(progress_callback)
@@ -54,6 +61,8 @@ def notes2flash(workflow_config_path, user_inputs, progress_callback=None, debug
             logger.error("Workflow execution failed without raising an exception")
             raise RuntimeError("Workflow execution failed without raising an exception.")
 
+    except CancelledError:
+        raise
     except Exception as e:
         error_message = f"Error in notes2flash: {str(e)}"
         logger.exception(error_message)
@@ -1,7 +1,8 @@
 """Main module for processing notes into flashcards."""
 import json
+from collections import deque
 from .logger import get_logger
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional
 from .processing_utils import (
     split_content_into_chunks,
     format_prompt_safely,
@@ -11,32 +12,48 @@ from .processing_utils import (
     validate_step_config,
     prepare_step_input,
     validate_output,
-    call_openrouter_api
+    find_unprocessed_tail,
+    call_openrouter_api,
+    CardList
 )
+from .step_cache import step_cache_key, load_step_output, save_step_output, prune_step_cache
+from .tracing import span
+from .progress import current_progress
+from .cancellation import CancellationToken, CancelledError
 
 logger = get_logger()
 
 def process_chunk_through_steps(chunk: str, stage_config: List[Dict[str, Any]], stage_data: Dict[str, Any], 
-                              workflow_config: Dict[str, Any]) -> Dict[str, Any]:
+                              workflow_config: Dict[str, Any], initial_content_key: Optional[str] = None,
+                              cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
     """
     Process a single chunk through all workflow steps.
+
+    Each step's output is memoized (see step_cache.py) unless the step sets cache: false, so a
+    step is only sent to the API again when it, its inputs or an earlier step's output changed.
     
     Args:
         chunk: The content chunk to process
         stage_config: List of processing step configurations
         stage_data: Current stage data
         workflow_config: Complete workflow configuration
+        initial_content_key: Key the chunk was split from, if not the scrape_notes output
+        cancel_token: Token that stops the API calls when the run is cancelled
         
     Returns:
         Dictionary containing the results of processing the chunk through all steps
     """
     chunk_state = stage_data.copy()
     chunk_output = {}
+    progress = current_progress()
     
     for step_index, step_config in enumerate(stage_config):
         try:
             # Get content key from previous step
-            content_key, source = get_content_key_from_previous_step(step_index, stage_config, workflow_config)
+            if step_index == 0 and initial_content_key:
+                content_key, source = initial_content_key, 'workflow input'
+            else:
+                content_key, source = get_content_key_from_previous_step(step_index, stage_config, workflow_config)
             logger.debug(f"Using content key '{content_key}' from {source}")
             
             # Validate and extract step configuration
@@ -53,14 +70,41 @@ def process_chunk_through_steps(chunk: str, stage_config: List[Dict[str, Any]],
             # Determine if this is the final step as that will determine whether should extract json from api output
             is_final_step = step_index == len(stage_config) - 1
             
+            step_name = step_config.get('step', f"step {step_index + 1}")
+            if progress:
+                progress.step_started(step_name, validated_config['model'])
+
+            # Reuse the output of an unchanged step with unchanged inputs
+            cache_key = None
+            cached = None
+            if validated_config['cache']:
+                cache_key = step_cache_key(chunk, validated_config, step_input, chunk_output)
+                cached = load_step_output(cache_key)
+
             # Process the chunk with step information
-            result = call_openrouter_api(
-                validated_config['prompt'],
-                validated_config['model'],
-                step_input,
-                is_final_step,
-                validated_config['output_fields'] if is_final_step else None
-            )
+            with span(step_name, 'step', model=validated_config['model'], cached=cached is not None) as step_span:
+                if cached is not None:
+                    logger.info(f"Reusing the cached output of step '{step_name}'")
+                    result = cached['value']
+                    if is_final_step:
+                        result = CardList(result)
+                        result.truncated = cached['truncated']
+                else:
+                    result = call_openrouter_api(
+                        validated_config['prompt'],
+                        validated_config['model'],
+                        step_input,
+                        is_final_step,
+                        validated_config['output_fields'] if is_final_step else None,
+                        cancel_token,
+                        validated_config['structured_output'],
+                        validated_config['repair_attempts']
+                    )
+                    if cache_key:
+                        save_step_output(cache_key, step_name, validated_config['model'], result,
+                                         getattr(result, 'truncated', False))
+                if is_final_step:
+                    step_span.set(cards=len(result))
             
             # For final step, result is already parsed JSON list
             # For intermediate steps, result is raw string
@@ -78,15 +122,31 @@ def process_chunk_through_steps(chunk: str, stage_config: List[Dict[str, Any]],
             
     return chunk_output
 
-def process_notes_to_cards(stage_data: Dict[str, Any], stage_config: List[Dict[str, Any]], workflow_config: Dict[str, Any]) -> Dict[str, Any]:
-    """Process notes to cards using the provided configuration, processing each chunk through all steps."""
+def process_notes_to_cards(stage_data: Dict[str, Any], stage_config: List[Dict[str, Any]], workflow_config: Dict[str, Any],
+                           on_chunk_results: Optional[Callable[[Dict[str, Any]], None]] = None,
+                           content_key: Optional[str] = None,
+                           cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+    """
+    Process notes to cards using the provided configuration, processing each chunk through all steps.
+
+    If on_chunk_results is given, it is called with each chunk's results as soon as the chunk is done,
+    so its cards can be added to Anki while later chunks are still processing.
+    content_key selects the data to split into chunks; by default it is the scrape_notes output.
+
+    If the final step's response for a chunk was truncated, its valid cards are kept and the part of
+    the chunk the response did not reach is queued as the next chunk.
+
+    If cancel_token is cancelled, CancelledError is raised with the finished chunks (completed_chunks)
+    and their merged results (partial_results) attached, so the caller can keep that work.
+    """
     logger.info("Starting process_notes_to_cards")
     
     if not isinstance(stage_config, list) or len(stage_config) == 0:
         raise ValueError("Invalid stage_config. Expected a non-empty list.")
 
     # Get initial content key and chunk size from first step
-    content_key, _ = get_content_key_from_previous_step(0, stage_config, workflow_config)
+    if not content_key:
+        content_key, _ = get_content_key_from_previous_step(0, stage_config, workflow_config)
     chunk_size = int(stage_config[0].get('chunk_size', 4000))
     
     # Split the initial content into chunks
@@ -97,16 +157,47 @@ def process_notes_to_cards(stage_data: Dict[str, Any], stage_config: List[Dict[s
     chunks = split_content_into_chunks(initial_content, chunk_size)
     if len(chunks) > 1:
         logger.info(f"Processing content in {len(chunks)} chunks")
+    progress = current_progress()
+    if progress:
+        progress.add_chunks(len(chunks))
 
-    # Process each chunk through all steps
+    # Process each chunk through all steps; tails of truncated chunks are queued in front
+    queue = deque(chunks)
+    completed_chunks = []
     all_results = {}
-    for i, chunk in enumerate(chunks, 1):
-        if len(chunks) > 1:
-            logger.info(f"Processing chunk {i} of {len(chunks)}")
+    i = 0
+    while queue:
+        chunk = queue.popleft()
+        i += 1
+        total = i + len(queue)
+        if total > 1:
+            logger.info(f"Processing chunk {i} of {total}")
             
         try:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
             # Process this chunk through all steps
-            chunk_results = process_chunk_through_steps(chunk, stage_config, stage_data, workflow_config)
+            with span(f"chunk {i}/{total}", 'chunk', chars=len(chunk)) as chunk_span:
+                chunk_results = process_chunk_through_steps(chunk, stage_config, stage_data, workflow_config, content_key,
+                                                            cancel_token)
+                chunk_span.set(cards=sum(len(value) for value in chunk_results.values() if isinstance(value, list)))
+            if progress:
+                progress.chunk_done([card for value in chunk_results.values() if isinstance(value, list) for card in value])
+            if on_chunk_results:
+                on_chunk_results(chunk_results)
+
+            tail = ""
+            for value in chunk_results.values():
+                if getattr(value, 'truncated', False):
+                    tail = find_unprocessed_tail(chunk, value)
+            if tail:
+                logger.info(f"Response for chunk {i} was truncated, re-queueing its last {len(tail)} chars")
+                queue.appendleft(tail)
+                if progress:
+                    progress.add_chunks(1)
+                completed_chunks.append(chunk[:chunk.rfind(tail)])
+            else:
+                completed_chunks.append(chunk)
             
             # Merge chunk results with all results
             for key, value in chunk_results.items():
@@ -121,10 +212,16 @@ def process_notes_to_cards(stage_data: Dict[str, Any], stage_config: List[Dict[s
                     # For intermediate step results (strings), concatenate
                     all_results[key] += value
                 
+        except CancelledError as e:
+            logger.info(f"Processing cancelled after {i - 1} of {total} chunks")
+            e.completed_chunks = completed_chunks
+            e.partial_results = all_results
+            raise
         except Exception as e:
             logger.error(f"Error processing chunk {i}: {str(e)}")
             raise
 
+    prune_step_cache()
     logger.info("Completed process_notes_to_cards")
     logger.debug(f"Final output: {all_results}")
     return all_results
@@ -1,13 +1,89 @@
 """Utility functions for processing notes into flashcards."""
 import json
 import re
+import threading
 import requests
-from typing import List, Dict, Any, Tuple, Union
-from .scrape_utils import load_config
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from .cancellation import CancellationToken, run_cancellable, sleep_cancellable
+from .config_service import get_config
+from .tracing import span
+from .progress import current_progress
 from .logger import get_logger
 
 logger = get_logger()
 
+MODELS_URL = "https://openrouter.ai/api/v1/models"
+STRUCTURED_OUTPUT_KEY = "cards"  # Root key of the structured final-step output
+DEFAULT_REPAIR_ATTEMPTS = 2
+# Connect and read timeouts in seconds; also ends the abandoned request of a cancelled run
+COMPLETION_TIMEOUT = (10, 300)
+
+_openrouter_models: Optional[Dict[str, Dict[str, Any]]] = None
+_openrouter_models_lock = threading.Lock()
+_schema_rejected_models = set()  # Models whose provider refused a response_format this session
+
+class StructuredOutputRejected(Exception):
+    """The provider refused the JSON schema sent as response_format."""
+
+class InvalidCards(ValueError):
+    """Some items of a final-step response are not valid cards; the valid ones have been kept."""
+
+    def __init__(self, items: List[Any], message: str):
+        super().__init__(message)
+        self.items = items
+
+class CardList(list):
+    """Cards of a final step. truncated is set when the response was cut off before covering the whole chunk."""
+    truncated = False
+
+def find_json_value(text: str, opening: str, accept: Callable[[Any], bool]) -> Any:
+    """Return the first JSON value starting at an `opening` bracket in the text that accept() takes, or None."""
+    decoder = json.JSONDecoder()
+    index = text.find(opening)
+    while index != -1:
+        try:
+            value, _ = decoder.raw_decode(text, index)
+            if accept(value):
+                return value
+        except json.JSONDecodeError:
+            pass
+        index = text.find(opening, index + 1)
+    return None
+
+def is_card_array(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and isinstance(value[0], dict)
+
+def decode_complete_objects(text: str) -> List[Dict[str, Any]]:
+    """Decode the objects of the first JSON array in the text one by one, up to the first that doesn't parse."""
+    decoder = json.JSONDecoder()
+    index = text.find('[')
+    if index == -1:
+        return []
+    objects = []
+    index += 1
+    while True:
+        while index < len(text) and text[index] in ' \t\r\n,':
+            index += 1
+        if index >= len(text) or text[index] != '{':
+            return objects
+        try:
+            value, index = decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            return objects
+        objects.append(value)
+
+def ends_inside_json(text: str) -> bool:
+    """Whether the JSON starting at the first bracket runs into the end of the text, as in a cut-off reply."""
+    starts = [index for index in (text.find('['), text.find('{')) if index != -1]
+    if not starts:
+        return False
+    text = text.rstrip()
+    try:
+        json.JSONDecoder().raw_decode(text, min(starts))
+        return False
+    except json.JSONDecodeError as e:
+        return e.pos >= len(text) or e.msg.startswith("Unterminated string")
+
 def extract_json_from_response(response_content: str, allow_partial: bool = False) -> List[Dict[str, Any]]:
     """
     Extract and parse JSON data from API response content.
@@ -16,44 +92,26 @@ def extract_json_from_response(response_content: str, allow_partial: bool = Fals
         response_content: The response content to parse
         allow_partial: If True, attempt to parse partial/incomplete responses by extracting complete objects
     """
-    # First try to find a complete JSON array
-    json_match = re.search(r'\[\s*{[^]]*}\s*\]', response_content, re.DOTALL)
-    if json_match:
-        try:
-            return json.loads(json_match.group())
-        except json.JSONDecodeError:
-            logger.error("Failed to parse extracted JSON")
-            if not allow_partial:
-                return []
+    # First try to find a complete JSON array (bare or inside a ```json fence)
+    result = find_json_value(response_content, '[', is_card_array)
+    if result is not None:
+        return result
     
     # Only attempt partial parsing if explicitly allowed
     if allow_partial:
         # Try to find as many complete objects as possible
-        objects = re.findall(r'{[^{}]*}(?=\s*,|\s*\])', response_content)
+        objects = decode_complete_objects(response_content)
         if objects:
-            try:
-                # Reconstruct a valid JSON array from the complete objects
-                reconstructed_json = f"[{','.join(objects)}]"
-                logger.warning("Response appears to be truncated, attempting to parse complete objects")
-                return json.loads(reconstructed_json)
-            except json.JSONDecodeError:
-                logger.error("Failed to parse reconstructed JSON from partial response")
-                return []
+            logger.warning("Response appears to be truncated, using its complete objects")
+            return objects
     
     logger.error("No valid JSON data found in the text")
     return []
 
 def get_api_key_from_config() -> str:
-    """Read the OpenRouter API key from the addon's config."""
+    """Read the OpenRouter API key from the in-memory config snapshot (no disk access)."""
     try:
-        config = load_config()
-        # If its loading from config.json, the API key is a direct key
-        if isinstance(config, dict) and 'openrouter_api_key' in config:
-            return config['openrouter_api_key']
-        # The config from meta.json has the API key under the 'config' key
-        if isinstance(config, dict) and 'config' in config:
-            config = config['config']
-        api_key = config.get('openrouter_api_key')
+        api_key = get_config().get('openrouter_api_key')
         if not api_key:
             raise ValueError("OpenRouter API key not found in config")
         return api_key
@@ -118,9 +176,21 @@ def validate_step_config(step_config: Dict[str, Any], step_index: int, stage_con
         'output_name': step_config.get('output', 'flashcards'),
         'output_fields': step_config.get('output_fields', []),
         'attach_format_reminder': step_config.get('attach_format_reminder', False),
+        'structured_output': step_config.get('structured_output', 'auto'),
+        'repair_attempts': DEFAULT_REPAIR_ATTEMPTS,
+        'cache': bool(step_config.get('cache', True)),
         'chunk_size': 4000  # Default chunk size
     }
     
+    if validated['structured_output'] not in (True, False, 'auto'):
+        logger.warning(f"Invalid structured_output '{validated['structured_output']}' in config, using 'auto'")
+        validated['structured_output'] = 'auto'
+    
+    try:
+        validated['repair_attempts'] = max(0, int(step_config.get('repair_attempts', DEFAULT_REPAIR_ATTEMPTS)))
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid repair_attempts in config, using default of {DEFAULT_REPAIR_ATTEMPTS}: {str(e)}")
+    
     try:
         validated['chunk_size'] = int(step_config.get('chunk_size', 4000))
     except (ValueError, TypeError) as e:
@@ -146,6 +216,43 @@ def prepare_step_input(input_keys: List[str], stage_data: Dict[str, Any], conten
     step_input[content_key] = chunk
     return step_input
 
+def split_valid_cards(items: List[Any], output_fields: List[str]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """Split parsed items into cards that have every output field and items that don't."""
+    valid, invalid = [], []
+    for item in items:
+        if isinstance(item, dict) and all(field in item for field in output_fields):
+            valid.append(item)
+        else:
+            invalid.append(item)
+    return valid, invalid
+
+def find_unprocessed_tail(chunk: str, cards: List[Dict[str, Any]]) -> str:
+    """
+    Guess the part of a chunk that a truncated response never reached.
+
+    Each card is matched to the paragraph (or line) sharing the most words with it; the text after
+    the last matched block is returned. Without any match, the second half of the blocks is returned.
+    """
+    separator = r'\n\s*\n' if re.search(r'\n\s*\n', chunk) else r'\n'
+    starts = [0] + [match.end() for match in re.finditer(separator, chunk)]
+    if len(starts) < 2:
+        return ""
+    words = lambda text: set(re.findall(r'\w{4,}', text.lower()))
+    block_words = [words(chunk[start:end]) for start, end in zip(starts, starts[1:] + [len(chunk)])]
+
+    last_block = None
+    for card in cards:
+        card_words = words(" ".join(str(value) for value in card.values())) if isinstance(card, dict) else set()
+        overlaps = [len(card_words & block) for block in block_words]
+        best = max(range(len(overlaps)), key=lambda index: (overlaps[index], index))
+        if overlaps[best] >= 2:
+            last_block = best if last_block is None else max(last_block, best)
+    if last_block is None:
+        last_block = len(starts) // 2 - 1
+    if last_block + 1 >= len(starts):
+        return ""
+    return chunk[starts[last_block + 1]:].strip()
+
 def validate_output(result: List[Dict[str, Any]], output_fields: List[str]) -> None:
     """Validate the structure of step output."""
     if not output_fields:
@@ -229,29 +336,120 @@ def get_content_key_from_previous_step(current_step_index: int, stage_config: Li
     
     return content_key, 'process_step'
 
-def call_openrouter_api(prompt: str, model: str, input_data: Dict[str, Any], is_final_step: bool, output_fields: List[str] = None) -> Union[str, List[Dict[str, Any]]]:
+def get_openrouter_models() -> Dict[str, Dict[str, Any]]:
+    """
+    Return OpenRouter's public model list (pricing, supported parameters) keyed by model ID.
+
+    The list is fetched once per session; if it cannot be fetched, an empty dict is cached.
+    """
+    global _openrouter_models
+    with _openrouter_models_lock:
+        if _openrouter_models is None:
+            try:
+                response = requests.get(MODELS_URL, timeout=10)
+                response.raise_for_status()
+                _openrouter_models = {entry['id']: entry for entry in response.json().get('data', [])}
+            except Exception as e:
+                logger.warning(f"Could not fetch the OpenRouter model list: {str(e)}")
+                _openrouter_models = {}
+        return _openrouter_models
+
+def supports_structured_output(model: str, setting: Any = 'auto') -> bool:
+    """Decide whether to send a JSON schema for a model: always, never, or 'auto' from its supported parameters."""
+    if setting is True or setting is False:
+        return setting
+    if model in _schema_rejected_models:
+        return False
+    return 'structured_outputs' in (get_openrouter_models().get(model, {}).get('supported_parameters') or [])
+
+def build_response_format(output_fields: List[str]) -> Dict[str, Any]:
+    """JSON schema for the final step: an object holding the card list (schemas need an object at the root)."""
+    card_schema = {
+        "type": "object",
+        "properties": {field: {"type": "string"} for field in output_fields},
+        "required": list(output_fields),
+        "additionalProperties": False
+    }
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "flashcards",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": {STRUCTURED_OUTPUT_KEY: {"type": "array", "items": card_schema}},
+                "required": [STRUCTURED_OUTPUT_KEY],
+                "additionalProperties": False
+            }
+        }
+    }
+
+def parse_final_output(response_content: str) -> Tuple[List[Any], bool]:
+    """
+    Parse a final-step response, either a structured {"cards": [...]} object or text containing a JSON array.
+
+    Returns the parsed items and whether the response was complete. Only a reply whose JSON runs
+    into the end of the text counts as cut off; its complete objects are returned. Other malformed
+    replies return no items, so they are repaired as a whole.
+    """
+    structured = find_json_value(response_content, '{',
+                                 lambda value: isinstance(value, dict) and isinstance(value.get(STRUCTURED_OUTPUT_KEY), list))
+    if structured is not None:
+        return structured[STRUCTURED_OUTPUT_KEY], True
+    items = extract_json_from_response(response_content)
+    if items:
+        return items, True
+    if ends_inside_json(response_content):
+        return extract_json_from_response(response_content, allow_partial=True), False
+    return [], True
+
+def build_repair_prompt(broken_output: str, output_fields: List[str], error: str) -> str:
+    """Short request that fixes malformed final-step output (or only its invalid items) instead of regenerating it from the chunk."""
+    fields = ", ".join(output_fields) if output_fields else "the requested fields"
+    return (
+        f"The following output should be a JSON array of objects, each with exactly these string fields: {fields}.\n"
+        f"It could not be used: {error}\n"
+        "Return only the corrected JSON array. Keep the content of every item, fill in missing fields, fix the structure, and do not add commentary.\n\n"
+        f"Output to repair:\n{broken_output}"
+    )
+
+def call_openrouter_api(prompt: str, model: str, input_data: Dict[str, Any], is_final_step: bool, output_fields: List[str] = None,
+                        cancel_token: Optional[CancellationToken] = None, structured_output: Any = 'auto',
+                        repair_attempts: int = DEFAULT_REPAIR_ATTEMPTS) -> Union[str, List[Dict[str, Any]]]:
     """
     Send a request to the OpenRouter API for processing notes with retry logic.
     
+    For the final step, a JSON schema built from output_fields is sent as response_format when the
+    model supports structured outputs. Valid cards of a final-step response are kept as they are;
+    only the invalid items (or the whole output, if it can't be parsed) are sent back in a short
+    repair request with the expected fields, up to repair_attempts times. Items that still fail
+    are dropped if other cards are valid, otherwise the whole prompt is regenerated. Only failed
+    requests wait before retrying.
+    
     Args:
         prompt (str): The prompt template to use
         model (str): The model to use
         input_data (Dict[str, Any]): The input data for formatting the prompt
         is_final_step (bool): Whether this is the final step in the workflow
         output_fields (List[str], optional): Expected fields in the output JSON for final step
+        cancel_token (CancellationToken, optional): Stops waiting for the request or retry delay when cancelled
+        structured_output: True, False or 'auto' (use a JSON schema if the model supports it)
+        repair_attempts (int): Repair requests allowed for malformed final-step output
         
     Returns:
         Union[str, List[Dict[str, Any]]]: For intermediate steps, returns the raw response content.
-                                         For the final step, returns the parsed JSON list.
+                                         For the final step, returns a CardList of the valid cards,
+                                         with truncated set if the response was cut off.
         
     Raises:
         ValueError: If there's an error formatting the prompt or processing the response
         RuntimeError: If all retry attempts fail
+        CancelledError: If the run is cancelled while waiting
     """
-    import time
     import uuid
     from datetime import datetime
     
+    progress = current_progress()
     url = "https://openrouter.ai/api/v1/chat/completions"
     max_retries = 5
     retry_delay = 10  # initial retry delay is 10 seconds and then additional 2 seconds for each failed attempt
@@ -279,15 +477,24 @@ def call_openrouter_api(prompt: str, model: str, input_data: Dict[str, Any], is_
         "Pragma": "no-cache"
     }
 
+    use_schema = bool(is_final_step and output_fields) and supports_structured_output(model, structured_output)
     last_error = None
+    broken_output = None  # Malformed final-step output to repair instead of regenerating
+    cards = CardList()  # Valid final-step cards collected so far
+    repairs_left = repair_attempts
     for attempt in range(max_retries):
-        # Add a unique suffix to the prompt for each retry attempt
-        retry_suffix = "" if attempt == 0 else (
-            f"\n\nRetry attempt {attempt} at {datetime.utcnow().isoformat()} "
-            f"with nonce {uuid.uuid4()} "
-            f"(Previous error: {last_error})"
-        )
-        formatted_prompt = base_prompt + retry_suffix
+        if broken_output is not None:
+            purpose = 'repair'
+            formatted_prompt = build_repair_prompt(broken_output, output_fields, last_error)
+        else:
+            purpose = 'generate' if attempt == 0 else 'regenerate'
+            # Add a unique suffix to the prompt for each retry attempt
+            retry_suffix = "" if attempt == 0 else (
+                f"\n\nRetry attempt {attempt} at {datetime.utcnow().isoformat()} "
+                f"with nonce {uuid.uuid4()} "
+                f"(Previous error: {last_error})"
+            )
+            formatted_prompt = base_prompt + retry_suffix
         
         logger.info("\nFormatted prompt being sent to API:\n" + "-"*80 + "\n" + formatted_prompt + "\n" + "-"*80)
         
@@ -307,63 +514,113 @@ def call_openrouter_api(prompt: str, model: str, input_data: Dict[str, Any], is_
             "repetition_penalty": 1,
             "top_k": 0,
         }
+        if use_schema:
+            data["response_format"] = build_response_format(output_fields)
+        response_content = None
         try:
-            # Send the request to the API
-            response = requests.post(
-                url=url,
-                headers=headers,
-                data=json.dumps(data)
-            )
-            response.raise_for_status()
-            
-            # Parse the response
-            result = response.json()
-            
-            # Check if the response has the expected structure
-            if 'choices' not in result or not result['choices']:
-                raise KeyError("Response missing 'choices' key or empty choices")
-                
-            if 'message' not in result['choices'][0]:
-                raise KeyError("Response missing 'message' key in first choice")
-                
-            if 'content' not in result['choices'][0]['message']:
-                raise KeyError("Response missing 'content' key in message")
-            
-            # Extract and log the response content
-            response_content = result['choices'][0]['message']['content'].strip()
-            logger.info("\nAPI Response:\n" + "-"*80 + "\n" + response_content + "\n" + "-"*80)
-            
-            if is_final_step:
-                # Extract JSON from response for final step
-                # Only allow partial parsing on the final retry attempt
-                allow_partial = (attempt == max_retries - 1)
-                parsed_result = extract_json_from_response(response_content, allow_partial)
-                
-                # Validate the parsed result
-                if not parsed_result or not isinstance(parsed_result, list):
-                    raise ValueError("Failed to parse JSON from final step response")
-                
-                # Validate output fields if specified
-                if output_fields:
-                    validate_output(parsed_result, output_fields)
-                
-                return parsed_result
-            else:
-                # Return raw content for intermediate steps
-                return response_content
-            
+            with span(f"attempt {attempt + 1}", 'llm', model=model, attempt=attempt + 1, purpose=purpose,
+                      structured=use_schema) as attempt_span:
+                # Send the request to the API
+                payload = json.dumps(data)
+                attempt_span.set(request_bytes=len(payload.encode('utf-8')))
+                if progress:
+                    progress.request_started()
+                try:
+                    response = run_cancellable(
+                        cancel_token,
+                        requests.post,
+                        url=url,
+                        headers=headers,
+                        data=payload,
+                        timeout=COMPLETION_TIMEOUT
+                    )
+                finally:
+                    if progress:
+                        progress.request_finished()
+                attempt_span.set(status=response.status_code, response_bytes=len(response.content or b''))
+                if use_schema and response.status_code in (400, 422):
+                    # The provider rejected the schema: send the plain prompt from now on
+                    logger.warning(f"Model {model} rejected structured output, retrying without a JSON schema")
+                    _schema_rejected_models.add(model)
+                    use_schema = False
+                    raise StructuredOutputRejected(f"Structured output rejected with status {response.status_code}")
+                response.raise_for_status()
+
+                # Parse the response
+                result = response.json()
+                usage = result.get('usage') or {}
+                attempt_span.set(prompt_tokens=usage.get('prompt_tokens'), completion_tokens=usage.get('completion_tokens'))
+                if progress:
+                    progress.tokens_received(usage.get('completion_tokens'))
+
+                # Check if the response has the expected structure
+                if 'choices' not in result or not result['choices']:
+                    raise KeyError("Response missing 'choices' key or empty choices")
+
+                if 'message' not in result['choices'][0]:
+                    raise KeyError("Response missing 'message' key in first choice")
+
+                if 'content' not in result['choices'][0]['message']:
+                    raise KeyError("Response missing 'content' key in message")
+
+                # Extract and log the response content
+                response_content = result['choices'][0]['message']['content'].strip()
+                logger.info("\nAPI Response:\n" + "-"*80 + "\n" + response_content + "\n" + "-"*80)
+
+                if is_final_step:
+                    items, complete = parse_final_output(response_content)
+                    if not items:
+                        raise ValueError("Failed to parse JSON from final step response")
+
+                    # Keep every valid card right away; only the invalid items are asked for again
+                    valid, invalid = split_valid_cards(items, output_fields or [])
+                    cards.extend(valid)
+                    finish_reason = result['choices'][0].get('finish_reason')
+                    if purpose != 'repair' and (not complete or finish_reason == 'length'):
+                        cards.truncated = True
+                    attempt_span.set(valid_cards=len(valid), invalid_cards=len(invalid), truncated=cards.truncated)
+                    if invalid:
+                        raise InvalidCards(invalid, f"{len(invalid)} of {len(items)} items are not valid cards. "
+                                                    f"Expected fields: {output_fields}")
+                    return cards
+                else:
+                    # Return raw content for intermediate steps
+                    return response_content
+
+        except StructuredOutputRejected as e:
+            last_error = str(e)
+            continue
         except (requests.exceptions.RequestException, KeyError, ValueError, json.JSONDecodeError) as e:
             last_error = str(e)
             logger.warning(f"Attempt {attempt + 1}/{max_retries} failed: {last_error}")
             
             # If this wasn't our last attempt, wait before retrying
             if attempt < max_retries - 1:
+                if progress:
+                    progress.retry()
+                if is_final_step and response_content:
+                    # The model answered but (part of) the output is malformed: repair only that part right away
+                    if repairs_left > 0:
+                        repairs_left -= 1
+                        broken_output = json.dumps(e.items, ensure_ascii=False) if isinstance(e, InvalidCards) else response_content
+                        logger.info(f"Requesting a repair of the malformed output ({repairs_left} repairs left)")
+                        continue
+                    if cards:
+                        logger.warning(f"Keeping {len(cards)} valid cards and dropping the items that could not be repaired")
+                        return cards
+                    broken_output = None
+                # A repair request that got no answer is sent again after the delay; anything else is regenerated
                 logger.info(f"For attempt {attempt + 1}/{max_retries} waiting {retry_delay} seconds...")
-                time.sleep(retry_delay)
+                with span("retry wait", 'wait', seconds=retry_delay):
+                    sleep_cancellable(cancel_token, retry_delay)
                 logger.info((f"Wait for attempt {attempt + 1}/{max_retries} is over. Proceeding again."))
                 retry_delay+=2 # increase wait by 2 seconds
                 continue
             
+            if cards:
+                logger.warning(f"Keeping {len(cards)} valid cards and dropping the items that could not be repaired")
+                return cards
+
             # If this was our last attempt, raise a comprehensive error
             error_msg = (
                 f"All {max_retries} attempts failed. Last error: {last_error}\n\n"
@@ -0,0 +1,201 @@
+"""
+Typed, throttled progress events for workflow runs.
+
+A RunProgress collects counters while a run is going (chunks done/total, current step,
+requests in flight, cards generated/committed, tokens, retries) and hands ProgressSnapshot
+events to a listener, at most once per min_interval. Like the tracing spans, the tracker of
+the current run lives in a context variable, so processing code reports to it without
+having it passed along; threads started with tracing.in_context report to the same run.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from .logger import get_logger
+
+logger = get_logger()
+
+DEFAULT_MIN_INTERVAL = 0.25  # Seconds between events, so fast updates don't flood the Qt event loop
+PREVIEW_SIZE = 5  # Most recent cards kept for the preview
+PREVIEW_LENGTH = 80  # Characters of each card shown in the preview
+
+
+class ProgressSnapshot:
+    """One progress event: the state of the run when it was emitted."""
+
+    __slots__ = ('chunks_done', 'chunks_total', 'step', 'model', 'in_flight', 'cards_generated', 'cards_committed',
+                 'completion_tokens', 'tokens_per_second', 'retries', 'elapsed', 'eta_seconds', 'preview', 'final')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def card_preview(card: Any) -> str:
+    """Short one-line text of a generated card, from its first fields."""
+    if isinstance(card, dict):
+        text = " | ".join(str(value) for value in list(card.values())[:2])
+    else:
+        text = str(card)
+    text = " ".join(text.split())
+    return text if len(text) <= PREVIEW_LENGTH else text[:PREVIEW_LENGTH - 1] + "…"
+
+
+class RunProgress:
+    """Thread-safe progress counters of one run, emitted as throttled ProgressSnapshot events."""
+
+    def __init__(self, listener: Optional[Callable[[ProgressSnapshot], None]] = None,
+                 min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.listener = listener
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.processing_started = None  # Time the first chunk was planned, the base for ETA and throughput
+        self.chunks_done = 0
+        self.chunks_total = 0
+        self.step = None
+        self.model = None
+        self.in_flight = 0
+        self.cards_generated = 0
+        self.cards_committed = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.preview: "deque[str]" = deque(maxlen=PREVIEW_SIZE)
+        self.last_emit = 0.0
+        self.timer: Optional[threading.Timer] = None
+        self.finished = False
+
+    def add_chunks(self, count: int) -> None:
+        with self.lock:
+            if self.processing_started is None:
+                self.processing_started = time.perf_counter()
+            self.chunks_total += count
+        self.changed()
+
+    def chunk_done(self, cards: List[Any]) -> None:
+        with self.lock:
+            self.chunks_done += 1
+            self.cards_generated += len(cards)
+            self.preview.extend(card_preview(card) for card in cards[-PREVIEW_SIZE:])
+        self.changed()
+
+    def step_started(self, step: str, model: str) -> None:
+        with self.lock:
+            self.step, self.model = step, model
+        self.changed()
+
+    def request_started(self) -> None:
+        with self.lock:
+            self.in_flight += 1
+        self.changed()
+
+    def request_finished(self) -> None:
+        with self.lock:
+            self.in_flight -= 1
+        self.changed()
+
+    def tokens_received(self, completion_tokens: Optional[int]) -> None:
+        with self.lock:
+            self.completion_tokens += completion_tokens or 0
+        self.changed()
+
+    def retry(self) -> None:
+        with self.lock:
+            self.retries += 1
+        self.changed()
+
+    def cards_added(self, count: int) -> None:
+        with self.lock:
+            self.cards_committed += count
+        self.changed()
+
+    def snapshot(self, final: bool = False) -> ProgressSnapshot:
+        with self.lock:
+            now = time.perf_counter()
+            processing_time = now - self.processing_started if self.processing_started is not None else 0.0
+            eta_seconds = None
+            if self.chunks_done and self.chunks_total:
+                # Chains that have not started yet are not in chunks_total, so this is a lower bound
+                eta_seconds = processing_time / self.chunks_done * (self.chunks_total - self.chunks_done)
+            return ProgressSnapshot(
+                chunks_done=self.chunks_done,
+                chunks_total=self.chunks_total,
+                step=self.step,
+                model=self.model,
+                in_flight=self.in_flight,
+                cards_generated=self.cards_generated,
+                cards_committed=self.cards_committed,
+                completion_tokens=self.completion_tokens,
+                tokens_per_second=self.completion_tokens / processing_time if processing_time > 0 else 0.0,
+                retries=self.retries,
+                elapsed=now - self.started,
+                eta_seconds=eta_seconds,
+                preview=list(self.preview),
+                final=final
+            )
+
+    def changed(self) -> None:
+        """Emit now if the last event is old enough, otherwise once the interval has passed."""
+        if self.listener is None:
+            return
+        with self.lock:
+            if self.finished or self.timer is not None:
+                return
+            wait = self.last_emit + self.min_interval - time.perf_counter()
+            if wait > 0:
+                self.timer = threading.Timer(wait, self.emit_pending)
+                self.timer.daemon = True
+                self.timer.start()
+                return
+            self.last_emit = time.perf_counter()
+        self.emit(self.snapshot())
+
+    def emit_pending(self) -> None:
+        with self.lock:
+            self.timer = None
+            if self.finished:
+                return
+            self.last_emit = time.perf_counter()
+        self.emit(self.snapshot())
+
+    def emit(self, snapshot: ProgressSnapshot) -> None:
+        try:
+            self.listener(snapshot)
+        except Exception as e:
+            # A broken listener must not stop the run
+            logger.warning(f"Progress listener failed: {str(e)}")
+
+    def finish(self) -> None:
+        """Cancel a pending event and emit the final state."""
+        with self.lock:
+            self.finished = True
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if self.listener is not None:
+            self.emit(self.snapshot(final=True))
+
+
+_current_progress: contextvars.ContextVar = contextvars.ContextVar('notes2flash_progress', default=None)
+
+
+@contextmanager
+def progress_run(listener: Optional[Callable[[ProgressSnapshot], None]] = None,
+                 min_interval: float = DEFAULT_MIN_INTERVAL):
+    """Track the progress of everything run inside this block and emit the final state at the end."""
+    progress = RunProgress(listener, min_interval)
+    token = _current_progress.set(progress)
+    try:
+        yield progress
+    finally:
+        _current_progress.reset(token)
+        progress.finish()
+
+
+def current_progress() -> Optional[RunProgress]:
+    return _current_progress.get()
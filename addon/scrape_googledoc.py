@@ -3,9 +3,9 @@ import logging
 import requests
 from .scrape_utils import (
     SERVICE_ACCOUNT_FILE,
-    extract_text_from_doc,
     logger
 )
+from .document_model import document_from_text, document_from_google_doc
 
 def is_service_account_available():
     """Check if service account credentials are available."""
@@ -32,17 +32,10 @@ def fetch_public_doc_content(doc_id):
     """Fetches content from a public Google Doc using HTTP requests."""
     try:
         url = f"https://docs.google.com/document/d/{doc_id}/export?format=txt"
-        response = requests.get(url)
+        response = requests.get(url, timeout=30)
         response.raise_for_status()
         
-        content = response.text
-        return {
-            'body': {
-                'content': [{'paragraph': {'elements': [{'textRun': {'content': line}}]}} 
-                          for line in content.split('\n')]
-            },
-            'revisionId': None
-        }
+        return document_from_text(response.text, paragraph_per_line=True)
     except requests.exceptions.RequestException as e:
         logger.error(f"Failed to fetch public document: {str(e)}")
         raise ValueError(f"Failed to fetch public document. Ensure the document is publicly accessible: {str(e)}")
@@ -54,7 +47,7 @@ def fetch_google_doc_content(doc_id):
     if service:
         logger.info("Using authenticated access via service account")
         try:
-            return service.documents().get(documentId=doc_id).execute()
+            return document_from_google_doc(service.documents().get(documentId=doc_id).execute())
         except Exception as e:
             logger.error(f"API access failed: {str(e)}")
             raise ValueError(f"Failed to fetch document via API: {str(e)}")
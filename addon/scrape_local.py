@@ -0,0 +1,154 @@
+"""Scrape notes from a local Markdown vault (e.g. an Obsidian vault directory)."""
+import hashlib
+import json
+import mmap
+import os
+from typing import Dict, List, Optional, Tuple
+from .document_model import Document, document_from_text
+from .logger import get_logger
+
+logger = get_logger()
+
+current_dir = os.path.dirname(__file__)
+VAULT_INDEX_FILE = os.path.join(current_dir, "vault_index.json")
+
+NOTE_EXTENSIONS = ('.md', '.markdown', '.txt')
+IGNORED_DIRECTORIES = {'.obsidian', '.git', '.trash'}
+MMAP_THRESHOLD = 1024 * 1024  # Files at least this large are memory-mapped instead of read
+
+
+def load_vault_index(vault_path: str) -> Dict[str, Dict[str, int]]:
+    """Load the persisted (mtime, size, content hash) index for a vault."""
+    if os.path.exists(VAULT_INDEX_FILE):
+        with open(VAULT_INDEX_FILE, 'r') as f:
+            return json.load(f).get(vault_path, {})
+    return {}
+
+
+def save_vault_index(vault_path: str, entries: Dict[str, Dict[str, int]]) -> None:
+    """Atomically persist the index for a vault."""
+    indexes = {}
+    if os.path.exists(VAULT_INDEX_FILE):
+        with open(VAULT_INDEX_FILE, 'r') as f:
+            indexes = json.load(f)
+    indexes[vault_path] = entries
+
+    temp_file = VAULT_INDEX_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(indexes, f)
+    os.replace(temp_file, VAULT_INDEX_FILE)
+    logger.info(f"Vault index saved for {vault_path} ({len(entries)} files)")
+
+
+def iter_vault_files(vault_path: str):
+    """Yield (relative_path, stat_result) for every note file in the vault."""
+    for root, dirs, files in os.walk(vault_path):
+        # Prune hidden and tool directories in place so os.walk skips them
+        dirs[:] = [d for d in dirs if d not in IGNORED_DIRECTORIES and not d.startswith('.')]
+        for filename in files:
+            if filename.lower().endswith(NOTE_EXTENSIONS):
+                file_path = os.path.join(root, filename)
+                try:
+                    yield os.path.relpath(file_path, vault_path), os.stat(file_path)
+                except OSError as e:
+                    logger.warning(f"Could not stat {file_path}: {e}")
+
+
+def read_note_file(file_path: str, size: int, known_hash: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    Hash a note file and decode it only if its content changed.
+
+    Args:
+        file_path: Absolute path of the note file
+        size: File size from the directory scan
+        known_hash: Content hash recorded in the index, if any
+
+    Returns:
+        Tuple of (content_hash, text) where text is None when the hash matches known_hash
+    """
+    with open(file_path, 'rb') as f:
+        if size >= MMAP_THRESHOLD:
+            # Hash straight from the mapping so unchanged large files are never copied or decoded
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content_hash = hashlib.blake2b(mapped, digest_size=16).hexdigest()
+                if content_hash == known_hash:
+                    return content_hash, None
+                return content_hash, mapped[:].decode('utf-8', errors='replace')
+
+        data = f.read()
+        content_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if content_hash == known_hash:
+            return content_hash, None
+        return content_hash, data.decode('utf-8', errors='replace')
+
+
+def is_note_path(rel_path: str) -> bool:
+    """Check whether a path relative to the vault is a note file outside ignored directories."""
+    parts = rel_path.split(os.sep)
+    if any(part in IGNORED_DIRECTORIES or part.startswith('.') for part in parts[:-1]):
+        return False
+    return parts[-1].lower().endswith(NOTE_EXTENSIONS)
+
+
+def iter_changed_files(vault_path: str, changed_paths: List[str]):
+    """Yield (relative_path, stat_result) for the given paths, skipping ones that no longer exist."""
+    for file_path in changed_paths:
+        rel_path = os.path.relpath(os.path.abspath(file_path), vault_path)
+        if rel_path.startswith(os.pardir) or not is_note_path(rel_path):
+            continue
+        try:
+            yield rel_path, os.stat(os.path.join(vault_path, rel_path))
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"Could not stat {file_path}: {e}")
+
+
+def scan_vault(vault_path: str, changed_paths: Optional[List[str]] = None) -> Tuple[Dict[str, Document], Dict[str, Dict[str, int]], List[str]]:
+    """
+    Find the note files that changed since the last recorded scan.
+
+    Files whose mtime and size match the index are skipped without being opened.
+    Files that were touched but whose content hash is unchanged are not reported.
+
+    Args:
+        vault_path: Absolute path of the vault directory
+        changed_paths: If given, only these files are checked instead of walking the whole vault
+
+    Returns:
+        Tuple of (changed documents keyed by absolute file path, updated index entries, removed relative paths)
+    """
+    previous_index = load_vault_index(vault_path)
+    changed_documents = {}
+
+    if changed_paths is None:
+        candidates = iter_vault_files(vault_path)
+        updated_index = {}
+    else:
+        candidates = iter_changed_files(vault_path, changed_paths)
+        updated_index = dict(previous_index)
+        for file_path in changed_paths:
+            rel_path = os.path.relpath(os.path.abspath(file_path), vault_path)
+            if rel_path in updated_index and not os.path.exists(os.path.join(vault_path, rel_path)):
+                del updated_index[rel_path]
+
+    for rel_path, stat in candidates:
+        previous = previous_index.get(rel_path)
+        if previous and previous['mtime_ns'] == stat.st_mtime_ns and previous['size'] == stat.st_size:
+            updated_index[rel_path] = previous
+            continue
+
+        file_path = os.path.join(vault_path, rel_path)
+        try:
+            content_hash, text = read_note_file(file_path, stat.st_size, previous and previous['hash'])
+        except OSError as e:
+            logger.warning(f"Could not read {file_path}: {e}")
+            continue
+
+        updated_index[rel_path] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash}
+        if text is not None:
+            changed_documents[file_path] = document_from_text(text, revision_id=content_hash)
+
+    removed = [rel_path for rel_path in previous_index if rel_path not in updated_index]
+    logger.info(f"Scanned vault {vault_path}: {len(updated_index)} files, {len(changed_documents)} changed, {len(removed)} removed")
+    return changed_documents, updated_index, removed
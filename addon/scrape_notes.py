@@ -1,21 +1,137 @@
+import os
 from .logger import get_logger
 from .scrape_utils import (
     parse_url,
     get_document_state,
     update_document_state,
-    compare_document_versions,
-    extract_text_from_doc,
+    find_documents_with_pending_changes,
+    delete_documents,
     mark_document_as_processed,  # Re-export this
     logger
 )
 from .scrape_googledoc import fetch_google_doc_content
 from .scrape_notion import scrape_notion_page
 from .scrape_obsidian import fetch_obsius_content
+from .scrape_local import scan_vault, save_vault_index
+from .tracing import span
+from .cancellation import run_cancellable
+from .block_fingerprints import (
+    split_into_blocks,
+    compare_block_fingerprints,
+    blocks_not_in_line_hashes,
+    block_id_for_text
+)
 
 # Re-export utility functions that other modules depend on
 __all__ = ['scrape_notes', 'mark_document_as_processed', 'get_document_state', 'update_document_state']
 
-def scrape_notes(stage_config):
+def collect_document_changes(doc_id, document, url, source_type, dry_run=False):
+    """
+    Compare a scraped document with its tracked state and return the block texts that need processing.
+
+    Documents are compared by paragraph-sized blocks fingerprinted on their normalized text,
+    so moving a paragraph or changing its whitespace does not count as a change.
+    With dry_run, the tracked state is left untouched.
+    """
+    current_version = document.revision_id
+    with span("fingerprint blocks", 'diff', doc_id=doc_id) as fingerprint_span:
+        blocks = split_into_blocks(document)
+        fingerprint_span.set(blocks=len(blocks))
+    current_fingerprints = [block.fingerprint for block in blocks]
+
+    # Get previous state
+    prev_state = get_document_state(doc_id)
+    prev_fingerprints = prev_state.get('block_fingerprints', [])
+    prev_line_hashes = prev_state.get('line_hashes', [])
+    pending_changes = prev_state.get('pending_changes', [])
+
+    if prev_fingerprints:
+        with span("compare fingerprints", 'diff', doc_id=doc_id) as compare_span:
+            changes = compare_block_fingerprints(prev_fingerprints, blocks)
+            changed_blocks = changes['added'] + changes['modified']
+            compare_span.set(changed_blocks=len(changed_blocks))
+    elif prev_line_hashes:
+        # Tracked before block fingerprints existed: only blocks with lines the old hashes don't cover are new
+        logger.info(f"Converting line tracking of document {doc_id} to block fingerprints")
+        changed_blocks = blocks_not_in_line_hashes(prev_line_hashes, blocks)
+    else:
+        # For new documents or first-time processing
+        logger.info(f"New document detected. Initializing tracking for document ID: {doc_id}")
+        texts = [block.text for block in blocks]
+        if not dry_run:
+            update_document_state(doc_id, current_fingerprints, current_version, False, texts, url, source_type)
+        return texts
+
+    # If there are new changes, process them
+    if changed_blocks:
+        logger.info(f"Found {len(changed_blocks)} changed blocks in document {doc_id}")
+        texts = [block.text for block in changed_blocks]
+        if not dry_run:
+            update_document_state(doc_id, current_fingerprints, current_version, False, texts, url, source_type)
+        return texts
+
+    # Keep the stored fingerprints current (e.g. after moves) without touching pending changes
+    if prev_fingerprints != current_fingerprints and not dry_run:
+        update_document_state(doc_id, current_fingerprints, current_version, prev_state.get('successfully_added_to_anki', False),
+                              pending_changes, url, source_type)
+
+    # If there are pending changes from a previous failed attempt, process only those
+    if pending_changes:
+        logger.info(f"Processing {len(pending_changes)} pending changes from previous attempt")
+        return pending_changes
+
+    logger.info(f"No changes detected in document {doc_id}")
+    return []
+
+def scrape_local_vault(vault_path, changed_paths=None, dry_run=False):
+    """
+    Collect changed lines from every modified note in a local vault.
+
+    Each note file is tracked as its own document, keyed by its absolute path.
+    If changed_paths is given (e.g. by watch mode), only those files are checked.
+    Deleted files have their stored state dropped.
+    With dry_run, neither the document states nor the vault index are updated.
+
+    Returns:
+        Tuple of (lines to process, tracked document IDs that contributed lines)
+    """
+    changed_documents, index_entries, removed_paths = scan_vault(vault_path, changed_paths)
+
+    lines_to_process = []
+    tracked_doc_ids = []
+    for file_path, document in changed_documents.items():
+        file_lines = collect_document_changes(file_path, document, file_path, 'local_vault', dry_run)
+        if file_lines:
+            lines_to_process.extend(file_lines)
+            tracked_doc_ids.append(file_path)
+
+    # Deleted files must not resurface their pending changes on every later run
+    if removed_paths and not dry_run:
+        forgotten = delete_documents([os.path.join(vault_path, rel_path) for rel_path in removed_paths])
+        logger.info(f"Dropped the stored state of {forgotten} deleted notes in {vault_path}")
+
+    # Unchanged files may still hold pending changes from a previous failed attempt
+    vault_prefix = vault_path.rstrip(os.sep) + os.sep
+    for doc_id, pending_changes in find_documents_with_pending_changes(vault_prefix).items():
+        if doc_id not in changed_documents:
+            logger.info(f"Processing {len(pending_changes)} pending changes from previous attempt in {doc_id}")
+            lines_to_process.extend(pending_changes)
+            tracked_doc_ids.append(doc_id)
+
+    # Changed lines are now recorded as pending changes, so the index can move forward
+    if not dry_run:
+        save_vault_index(vault_path, index_entries)
+    return lines_to_process, tracked_doc_ids
+
+def scrape_notes(stage_config, changed_paths=None, allow_empty=False, cancel_token=None, dry_run=False):
+    """
+    Scrape the configured source and return its changed content.
+
+    Raises ValueError when nothing changed, unless allow_empty is set (workflows with several
+    sources), in which case the output is an empty string. Online sources are fetched through
+    cancel_token, so a cancelled run stops waiting for them. With dry_run, changes are detected
+    without recording them, so a later real run still sees them.
+    """
     if isinstance(stage_config, list):
         if len(stage_config) == 0:
             raise ValueError("Invalid stage_config. Expected a non-empty list or a dictionary.")
@@ -36,54 +152,40 @@ def scrape_notes(stage_config):
         source_info = parse_url(url)
         source_type = source_info['type']
         source_id = source_info['id']
-        
-        # Fetch content based on source type
-        if source_type == 'google_docs':
-            doc_content = fetch_google_doc_content(source_id)
-        elif source_type == 'notion':
-            doc_content = scrape_notion_page(url)
-        elif source_type == 'obsius':
-            doc_content = fetch_obsius_content(url)
+
+        # Local vaults track each note file separately
+        if source_type == 'local_vault':
+            lines_to_process, tracked_doc_ids = scrape_local_vault(source_id, changed_paths, dry_run)
         else:
-            raise ValueError(f"Unsupported source type: {source_type}")
-        
-        current_version = doc_content.get('revisionId')
-        current_lines = extract_text_from_doc(doc_content)
-
-        # Get previous state
-        prev_state = get_document_state(source_id)
-        prev_lines = prev_state['lines']
-        prev_version = prev_state['version']
-        prev_processed = prev_state.get('successfully_added_to_anki', False)
-        pending_changes = prev_state.get('pending_changes', [])
+            # Fetch content based on source type
+            if source_type == 'google_docs':
+                doc_content = run_cancellable(cancel_token, fetch_google_doc_content, source_id)
+            elif source_type == 'notion':
+                doc_content = run_cancellable(cancel_token, scrape_notion_page, url)
+            elif source_type == 'obsius':
+                doc_content = run_cancellable(cancel_token, fetch_obsius_content, url)
+            else:
+                raise ValueError(f"Unsupported source type: {source_type}")
+            # The document state is only written once the fetch has completed
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
 
-        # For new documents or first-time processing
-        if not prev_lines:
-            logger.info(f"New document detected. Initializing tracking for document ID: {source_id}")
-            content_str = '\n\n'.join(current_lines)
-            update_document_state(source_id, current_lines, current_version, False, current_lines, url, source_type)
-            return {output_key: content_str}
-
-        # Compare versions and get changes
-        changes = compare_document_versions(prev_lines, current_lines)
-        
-        # If there are new changes, process them
-        if changes['total_changes'] > 0:
-            logger.info(f"Found {changes['total_changes']} changes in document {source_id}")
-            lines_to_process = changes['added'] + changes['modified']
-            content_str = '\n\n'.join(lines_to_process)
-            update_document_state(source_id, current_lines, current_version, False, lines_to_process, url, source_type)
-            return {output_key: content_str}
-        
-        # If there are pending changes from a previous failed attempt, process only those
-        if pending_changes:
-            logger.info(f"Processing {len(pending_changes)} pending changes from previous attempt")
-            content_str = '\n\n'.join(pending_changes)
-            return {output_key: content_str}
+            if doc_content is None:
+                raise ValueError(f"Failed to fetch content from {url}")
+
+            lines_to_process = collect_document_changes(source_id, doc_content, url, source_type, dry_run)
+            tracked_doc_ids = [source_id]
 
         # No changes and no pending changes
-        logger.info(f"No changes detected in document {source_id}")
-        raise ValueError("No changes detected in document. Skipping further processing.")
+        if not lines_to_process and not allow_empty:
+            raise ValueError("No changes detected in document. Skipping further processing.")
+
+        content_str = '\n\n'.join(lines_to_process)
+        return {
+            output_key: content_str,
+            'tracked_doc_ids': tracked_doc_ids,
+            'changed_block_ids': [block_id_for_text(text) for text in lines_to_process]
+        }
 
     except Exception as e:
         logger.error(f"An error occurred while scraping notes: {str(e)}")
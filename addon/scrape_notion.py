@@ -1,9 +1,9 @@
 from .logger import get_logger
-from .scrape_utils import (
-    load_config,
-    extract_text_from_doc,
-    logger
-)
+from .scrape_utils import logger
+from .config_service import get_config
+from .document_model import Document, PARAGRAPH, HEADING, LIST_ITEM, CODE, QUOTE
+
+NOTION_HEADING_LEVELS = {'heading_1': 1, 'heading_2': 2, 'heading_3': 3}
 
 def scrape_notion_page(url):
     """Fetch content from a Notion page using the Notion API."""
@@ -11,8 +11,7 @@ def scrape_notion_page(url):
         from notion_client import Client
         
         # Load Notion API key from config
-        config = load_config()
-        notion_api_key = config.get('notion_api_key')
+        notion_api_key = get_config().get('notion_api_key')
         
         if not notion_api_key:
             raise ValueError("Notion API key not found in configuration. Please add your integration token through Anki's addon configuration.")
@@ -29,7 +28,7 @@ def scrape_notion_page(url):
         page = notion.pages.retrieve(page_id)
         blocks = notion.blocks.children.list(page_id)
         
-        content = []
+        document = Document(revision_id=page.get('last_edited_time'))  # Use last_edited_time as revision ID
         
         # Process blocks recursively
         def process_blocks(blocks):
@@ -42,70 +41,38 @@ def scrape_notion_page(url):
                 if not block_content:
                     continue
                 
-                # Handle different block types
-                if block_type == 'paragraph':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(text)
-                
-                elif block_type == 'heading_1':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"\n# {text}\n")
-                
-                elif block_type == 'heading_2':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"\n## {text}\n")
-                
-                elif block_type == 'heading_3':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"\n### {text}\n")
+                block_id = block.get('id')
+                text = ''.join(t.get('text', {}).get('content', '') 
+                               for t in block_content.get('rich_text', []))
                 
-                elif block_type == 'bulleted_list_item':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"• {text}")
-                
-                elif block_type == 'numbered_list_item':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"- {text}")
-                
-                elif block_type == 'code':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"```\n{text}\n```")
-                
-                elif block_type == 'quote':
-                    text = ''.join(t.get('text', {}).get('content', '') 
-                                 for t in block_content.get('rich_text', []))
-                    if text:
-                        content.append(f"> {text}")
+                # Handle different block types
+                if text:
+                    if block_type == 'paragraph':
+                        document.append(text, PARAGRAPH, 0, block_id)
+                    
+                    elif block_type in NOTION_HEADING_LEVELS:
+                        level = NOTION_HEADING_LEVELS[block_type]
+                        document.append(f"{'#' * level} {text}", HEADING, level, block_id)
+                    
+                    elif block_type == 'bulleted_list_item':
+                        document.append(f"• {text}", LIST_ITEM, 0, block_id)
+                    
+                    elif block_type == 'numbered_list_item':
+                        document.append(f"- {text}", LIST_ITEM, 0, block_id)
+                    
+                    elif block_type == 'code':
+                        document.append(f"```\n{text}\n```", CODE, 0, block_id)
+                    
+                    elif block_type == 'quote':
+                        document.append(f"> {text}", QUOTE, 0, block_id)
                 
                 # Handle nested blocks
                 if block.get('has_children'):
-                    child_blocks = notion.blocks.children.list(block.get('id'))
+                    child_blocks = notion.blocks.children.list(block_id)
                     process_blocks(child_blocks)
         
         process_blocks(blocks)
-        
-        # Format content in a way compatible with Google Docs structure
-        return {
-            'body': {
-                'content': [{'paragraph': {'elements': [{'textRun': {'content': line}}]}} 
-                          for line in content if line.strip()]
-            },
-            'revisionId': page.get('last_edited_time')  # Use last_edited_time as revision ID
-        }
+        return document
     
     except ImportError:
         logger.error("notion-client is required for accessing Notion pages. Please install notion-client package.")
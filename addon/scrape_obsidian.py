@@ -1,12 +1,13 @@
 import requests
 import json
-from typing import Optional, Dict, Any
+from typing import Optional
 from urllib.parse import urlparse
 from .logger import get_logger
+from .document_model import Document, document_from_text
 
 logger = get_logger()
 
-def fetch_obsius_content(url: str) -> Optional[Dict[str, Any]]:
+def fetch_obsius_content(url: str) -> Optional[Document]:
     """
     Fetch content from an Obsius URL.
     
@@ -14,11 +15,11 @@ def fetch_obsius_content(url: str) -> Optional[Dict[str, Any]]:
         url: The Obsius URL to fetch content from
         
     Returns:
-        Optional[Dict[str, Any]]: The note content if successful, None otherwise
+        Optional[Document]: The note content if successful, None otherwise
     """
     try:
         # Make the request
-        response = requests.get(url)
+        response = requests.get(url, timeout=30)
         response.raise_for_status()
         
         # Parse JSON response
@@ -28,14 +29,8 @@ def fetch_obsius_content(url: str) -> Optional[Dict[str, Any]]:
             if not content:
                 raise ValueError("No content found in response")
             
-            # Split content into lines and format for extract_text_from_doc
-            return {
-                'body': {
-                    'content': [{'paragraph': {'elements': [{'textRun': {'content': line}}]}} 
-                              for line in content.split('\n')]
-                },
-                'revisionId': None  # Obsius doesn't provide revision info
-            }
+            # Obsius doesn't provide revision info
+            return document_from_text(content)
             
         else:
             raise ValueError("Unexpected content type; expected application/json")
@@ -1,11 +1,12 @@
 import os
 import sys
 import json
-from datetime import datetime
 from urllib.parse import urlparse, parse_qs
-import difflib
-from aqt import mw
 from .logger import get_logger
+from .document_model import Document, document_from_google_doc
+from .change_detection import compare_document_versions, compare_line_hashes  # Re-exported for backwards compatibility
+from .document_store import load_document, save_document, set_document_processed
+from .document_store import find_documents_with_pending_changes, delete_documents  # Re-exported for scrape_notes
 
 # Add the path to the `libs` directory where extra packages are bundled
 addon_folder = os.path.dirname(__file__)
@@ -16,19 +17,54 @@ if libs_path not in sys.path:
 # Get logger instance
 logger = get_logger()
 
-# Path to config and tracked docs files
+# Path to config files (tracked document state lives in document_store)
 current_dir = os.path.dirname(__file__)
 SERVICE_ACCOUNT_FILE = os.path.join(current_dir, "service_account.json")
-TRACKED_DOCS_FILE = os.path.join(current_dir, "tracked_docs.json")
 CONFIG_FILE = os.path.join(current_dir, "config.json")
 
+LOCAL_VAULT_PREFIXES = ('file://', 'local:')  # A notes_url naming a local folder must start with one of these
+
+# Outside Anki, config is read from this file (default: config.json) and these variables override it
+CONFIG_FILE_ENV_VAR = "NOTES2FLASH_CONFIG"
+CONFIG_ENV_VARS = {
+    'openrouter_api_key': "OPENROUTER_API_KEY",
+    'notion_api_key': "NOTION_API_KEY",
+}
+
 def get_addon_id():
     """Get the addon ID (directory name) for this addon."""
     return os.path.basename(current_dir)
 
+def get_main_window():
+    """Return Anki's main window, or None when running outside Anki (e.g. from the command line)."""
+    if 'aqt' not in sys.modules:
+        # Anki imports aqt before loading add-ons; importing it here would only pull in Qt
+        return None
+    from aqt import mw
+    return mw
+
+def load_config_from_environment():
+    """Load configuration for runs outside Anki from a JSON file and environment variables."""
+    config_file = os.environ.get(CONFIG_FILE_ENV_VAR) or CONFIG_FILE
+    config = {}
+    if os.path.exists(config_file):
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+        # Accept a meta.json-style file as well
+        if isinstance(config, dict) and 'config' in config:
+            config = config['config']
+    for key, env_var in CONFIG_ENV_VARS.items():
+        if os.environ.get(env_var):
+            config[key] = os.environ[env_var]
+    return config
+
 def load_config():
     """Load configuration from Anki's addon manager or config.json."""
     try:
+        mw = get_main_window()
+        if mw is None:
+            return load_config_from_environment()
+
         addon_id = get_addon_id()
         
         # First try to get config from Anki's addon manager
@@ -40,9 +76,7 @@ def load_config():
                 config = meta_config['config']
             else:
                 config = meta_config
-            # Sync to config.json
-            with open(CONFIG_FILE, 'w') as f:
-                json.dump(config, f, indent=4)
+            # meta.json is the source of truth; config.json keeps only the defaults, without keys
             return config
         
         # If no config in addon manager, try loading from config.json
@@ -87,6 +121,14 @@ def looks_like_notion_id(text):
 
 def parse_url(url):
     """Parse URL to determine source type and extract relevant ID."""
+    # Handle local Markdown vaults, which must be named explicitly with file:// or local:
+    prefix = next((prefix for prefix in LOCAL_VAULT_PREFIXES if url.startswith(prefix)), None)
+    if prefix is not None:
+        local_path = os.path.expanduser(url[len(prefix):])
+        if not os.path.isdir(local_path):
+            raise ValueError(f"Local vault folder not found: {local_path}")
+        return {'type': 'local_vault', 'id': os.path.normpath(os.path.abspath(local_path))}
+
     parsed = urlparse(url)
     
     # Handle Google Docs URLs
@@ -137,135 +179,47 @@ def parse_url(url):
     
     raise ValueError(f"Unsupported URL format: {url}")
 
-def load_tracked_documents():
-    """Load tracked documents from JSON file."""
-    if os.path.exists(TRACKED_DOCS_FILE):
-        with open(TRACKED_DOCS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
-
-def save_tracked_documents(tracked_docs):
-    """Save tracked documents to JSON file."""
-    with open(TRACKED_DOCS_FILE, 'w') as f:
-        json.dump(tracked_docs, f, indent=4)
-    logger.info(f"Tracked documents saved to {TRACKED_DOCS_FILE}")
-
 def get_document_state(doc_id):
     """Get previously stored state for a document."""
-    tracked_docs = load_tracked_documents()
-    return tracked_docs.get(doc_id, {
-        'lines': [],
-        'last_updated': None,
-        'version': None,
-        'successfully_added_to_anki': False,
-        'pending_changes': [],
-        'source_url': None,
-        'source_type': None
-    })
+    state = load_document(doc_id)
+    if state is None:
+        return {
+            'block_fingerprints': [],
+            'line_hashes': [],
+            'last_updated': None,
+            'version': None,
+            'successfully_added_to_anki': False,
+            'pending_changes': [],
+            'source_url': None,
+            'source_type': None
+        }
+    return state
 
-def update_document_state(doc_id, lines, version=None, successfully_added_to_anki=False, pending_changes=None, source_url=None, source_type=None):
-    """Update the stored state for a document."""
-    tracked_docs = load_tracked_documents()
-    current_state = tracked_docs.get(doc_id, {})
-    
-    tracked_docs[doc_id] = {
-        'lines': lines,
-        'last_updated': datetime.now().isoformat(),
+def update_document_state(doc_id, block_fingerprints, version=None, successfully_added_to_anki=False, pending_changes=None, source_url=None, source_type=None):
+    """
+    Update the stored state for a document.
+
+    Only block fingerprints are stored, not the text. Pass block_fingerprints=None to keep the
+    stored fingerprints and update the status fields only.
+    """
+    save_document(doc_id, block_fingerprints, {
         'version': version,
         'successfully_added_to_anki': successfully_added_to_anki,
         'pending_changes': pending_changes if pending_changes is not None else [],
-        'source_url': source_url if source_url is not None else current_state.get('source_url'),
-        'source_type': source_type if source_type is not None else current_state.get('source_type')
-    }
-    save_tracked_documents(tracked_docs)
+        'source_url': source_url,
+        'source_type': source_type
+    })
     logger.info(f"Updated state for document {doc_id}")
 
 def mark_document_as_processed(doc_id):
     """Mark a document as successfully processed."""
-    tracked_docs = load_tracked_documents()
-    if doc_id in tracked_docs:
-        # Preserve source_url and source_type while updating status
-        tracked_docs[doc_id].update({
-            'successfully_added_to_anki': True,
-            'pending_changes': []
-        })
-        save_tracked_documents(tracked_docs)
+    if set_document_processed(doc_id):
         logger.info(f"Document {doc_id} marked as successfully processed")
     else:
         logger.warning(f"Attempted to mark non-existent document {doc_id} as processed")
 
-def compare_document_versions(old_lines, new_lines):
-    """Compare two versions of document content and return changes."""
-    # Create sets for efficient comparison
-    old_set = set(old_lines)
-    new_set = set(new_lines)
-    
-    # Find added lines (including those at the beginning)
-    added_lines = list(new_set - old_set)
-    
-    # Find modified lines using difflib for more accurate comparison
-    differ = difflib.Differ()
-    diff = list(differ.compare(old_lines, new_lines))
-    
-    modified_lines = []
-    for i, line in enumerate(diff):
-        if line.startswith('- '):
-            old_text = line[2:]
-            # Look ahead for potential modifications
-            for j in range(i + 1, min(i + 3, len(diff))):
-                if diff[j].startswith('+ '):
-                    new_text = diff[j][2:]
-                    # Check if the lines are similar but not identical
-                    similarity = difflib.SequenceMatcher(None, old_text, new_text).ratio()
-                    if 0.5 < similarity < 1.0:
-                        modified_lines.append(new_text)
-                        break
-    
-    # Remove any modified lines from added lines to avoid duplicates
-    added_lines = [line for line in added_lines if line not in modified_lines]
-    
-    return {
-        'added': added_lines,
-        'modified': modified_lines,
-        'total_changes': len(added_lines) + len(modified_lines)
-    }
-
 def extract_text_from_doc(doc):
-    """Extracts text from a Google Docs JSON response with improved formatting handling."""
-    content = doc.get('body', {}).get('content', [])
-    text_lines = []
-    current_line = []
-    
-    def process_element(element):
-        if 'paragraph' in element:
-            paragraph = element['paragraph']
-            
-            # Handle paragraph style
-            style = paragraph.get('paragraphStyle', {})
-            if style.get('namedStyleType') in ['HEADING_1', 'HEADING_2', 'HEADING_3']:
-                current_line.append('\n')  # Add extra line break for headings
-            
-            # Process text elements
-            for elem in paragraph.get('elements', []):
-                if 'textRun' in elem:
-                    text = elem['textRun'].get('content', '')
-                    if text.strip():  # Only add non-empty text
-                        current_line.append(text)
-            
-            # Handle end of paragraph
-            line_text = ''.join(current_line).strip()
-            if line_text:
-                text_lines.append(line_text)
-            current_line.clear()
-            
-        elif 'table' in element:
-            # Handle tables (simplified)
-            text_lines.append('\n[Table Content]\n')
-        
-        elif 'sectionBreak' in element:
-            text_lines.append('\n')
-    
-    for element in content:
-        process_element(element)
-    
-    return [line for line in text_lines if line.strip()]
+    """Extract the text lines from a scraped Document or a Google Docs JSON response."""
+    if not isinstance(doc, Document):
+        doc = document_from_google_doc(doc)
+    return doc.texts()
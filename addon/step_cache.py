@@ -0,0 +1,74 @@
+"""
+Memoized outputs of processing steps, stored in notes2flash.db.
+
+A step's output is keyed by a hash of the chunk, the parts of the step config that shape its
+output, its formatted inputs and the outputs of the earlier steps for the same chunk. Editing
+a step therefore changes its key and, through its new output, the keys of the steps after it,
+while the steps before it are answered from the cache.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, Optional
+from .document_store import get_connection, transaction
+from .logger import get_logger
+
+logger = get_logger()
+
+STEP_CACHE_VERSION = 2  # Part of every key; bumped when stored outputs change meaning, so older entries miss
+MAX_STEP_CACHE_ENTRIES = 20000  # Least recently used outputs beyond this are deleted
+# Step settings that change what the model is asked; names, chunk_size and retry settings don't
+KEYED_SETTINGS = ('model', 'prompt', 'output_name', 'output_fields', 'structured_output')
+
+
+def step_cache_key(chunk: str, validated_config: Dict[str, Any], step_input: Dict[str, Any],
+                   upstream_outputs: Dict[str, Any]) -> str:
+    """Hash the chunk, the step settings, the step's inputs and the earlier steps' outputs."""
+    material = json.dumps({
+        'version': STEP_CACHE_VERSION,
+        'chunk': chunk,
+        'step': {name: validated_config.get(name) for name in KEYED_SETTINGS},
+        'input': step_input,
+        'upstream': upstream_outputs
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(material.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_step_output(key: str, touch: bool = True) -> Optional[Dict[str, Any]]:
+    """Return {'value': ..., 'truncated': bool} stored for a key, or None. touch=False leaves its last use as is."""
+    connection = get_connection()
+    row = connection.execute("SELECT output, truncated FROM step_cache WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    if touch:
+        connection.execute(
+            "UPDATE step_cache SET last_used = ? WHERE key = ?", (datetime.now().isoformat(), key))
+    return {'value': json.loads(row[0]), 'truncated': bool(row[1])}
+
+
+def save_step_output(key: str, step_name: str, model: str, value: Any, truncated: bool = False) -> None:
+    now = datetime.now().isoformat()
+    with transaction() as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO step_cache (key, step, model, output, truncated, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, step_name, model, json.dumps(value, ensure_ascii=False), 1 if truncated else 0, now, now)
+        )
+
+
+def prune_step_cache(max_entries: int = MAX_STEP_CACHE_ENTRIES) -> None:
+    """Delete the least recently used outputs beyond max_entries."""
+    with transaction() as connection:
+        deleted = connection.execute(
+            "DELETE FROM step_cache WHERE key NOT IN "
+            "(SELECT key FROM step_cache ORDER BY last_used DESC LIMIT ?)",
+            (max_entries,)
+        ).rowcount
+    if deleted:
+        logger.info(f"Pruned {deleted} old entries from the step cache")
+
+
+def clear_step_cache() -> int:
+    """Delete every memoized step output and return how many there were."""
+    with transaction() as connection:
+        return connection.execute("DELETE FROM step_cache").rowcount
@@ -0,0 +1,268 @@
+"""
+Nested timing spans for workflow runs (workflow -> stage -> chunk -> step -> attempt).
+
+Each run is exported as a Chrome trace JSON file in traces/, which can be opened in
+chrome://tracing or https://ui.perfetto.dev. Spans carry attributes such as model, token
+usage, bytes sent and received, retries and cards produced; a per-category and per-model
+summary is stored in the file's otherData.
+"""
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from .logger import get_logger
+
+logger = get_logger()
+
+current_dir = os.path.dirname(__file__)
+TRACES_DIR = os.path.join(current_dir, "traces")
+MAX_TRACE_FILES = 20  # Older trace files (and their profiles) are deleted
+
+# Attributes that are summed per category and per model in the trace summary
+SUMMED_ATTRIBUTES = ('prompt_tokens', 'completion_tokens', 'request_bytes', 'response_bytes', 'cards')
+
+
+class Span:
+    """One timed operation. Attributes can be set while it is open."""
+
+    __slots__ = ('name', 'category', 'start', 'end', 'attributes', 'thread_id', 'thread_name')
+
+    def __init__(self, name: str, category: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end = None
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: float = 1) -> None:
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class Trace:
+    """Collects the finished spans of one workflow run."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.started_at = datetime.now()
+        self.run_id = uuid.uuid4().hex[:8]  # Keeps runs started in the same second from sharing a file
+        self.spans: List[Span] = []
+        self.metadata: Dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        with self.lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregate span counts, durations and attributes by category and by model."""
+        categories: Dict[str, Dict[str, Any]] = {}
+        models: Dict[str, Dict[str, Any]] = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = categories.setdefault(span.category, {'count': 0, 'total_ms': 0.0})
+            entry['count'] += 1
+            entry['total_ms'] += span.duration * 1000
+            for name in SUMMED_ATTRIBUTES:
+                if isinstance(span.attributes.get(name), (int, float)):
+                    entry[name] = entry.get(name, 0) + span.attributes[name]
+
+            if span.category == 'llm' and span.attributes.get('model'):
+                stats = models.setdefault(span.attributes['model'], {'attempts': 0, 'failed': 0, 'total_ms': 0.0})
+                stats['attempts'] += 1
+                stats['failed'] += 1 if span.attributes.get('error') else 0
+                stats['total_ms'] += span.duration * 1000
+                for name in ('prompt_tokens', 'completion_tokens'):
+                    if isinstance(span.attributes.get(name), int):
+                        stats[name] = stats.get(name, 0) + span.attributes[name]
+                if span.attributes.get('purpose', 'generate') != 'generate':
+                    # Regenerations and repairs: what failed outputs cost on top of the first request
+                    stats['retry_attempts'] = stats.get('retry_attempts', 0) + 1
+                    stats['retry_ms'] = stats.get('retry_ms', 0.0) + span.duration * 1000
+                    for name in ('prompt_tokens', 'completion_tokens'):
+                        if isinstance(span.attributes.get(name), int):
+                            stats[f'retry_{name}'] = stats.get(f'retry_{name}', 0) + span.attributes[name]
+
+        for stats in models.values():
+            stats['retry_rate'] = round(stats['failed'] / stats['attempts'], 3)
+            stats['mean_ms'] = round(stats['total_ms'] / stats['attempts'], 1)
+            if 'retry_ms' in stats:
+                stats['retry_ms'] = round(stats['retry_ms'], 1)
+        for entry in list(categories.values()) + list(models.values()):
+            entry['total_ms'] = round(entry['total_ms'], 1)
+        return {'categories': categories, 'models': models}
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Return the trace in the Chrome trace event format (complete "X" events in microseconds)."""
+        with self.lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        events = []
+        thread_names = {}
+        for span in spans:
+            thread_names[span.thread_id] = span.thread_name
+            events.append({
+                'name': span.name,
+                'cat': span.category,
+                'ph': 'X',
+                'ts': round((span.start - self.origin) * 1e6, 1),
+                'dur': round(span.duration * 1e6, 1),
+                'pid': pid,
+                'tid': span.thread_id,
+                'args': span.attributes
+            })
+        for thread_id, thread_name in thread_names.items():
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': thread_name}})
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'otherData': dict(self.metadata, workflow=self.name, started_at=self.started_at.isoformat(),
+                              summary=self.summary())
+        }
+
+    def file_stem(self) -> str:
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', self.name)[:60]
+        return os.path.join(TRACES_DIR, f"{self.started_at.strftime('%Y%m%d-%H%M%S')}-{self.run_id}-{safe_name}")
+
+    def export(self) -> str:
+        """Write the trace to traces/ and return the file path."""
+        os.makedirs(TRACES_DIR, exist_ok=True)
+        path = self.file_stem() + ".json"
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+        prune_traces()
+        return path
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar('notes2flash_trace', default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar('notes2flash_span', default=None)
+
+
+def prune_traces(keep: int = MAX_TRACE_FILES) -> None:
+    """Delete all but the newest trace files (and their profile/memory reports)."""
+    try:
+        names = sorted(name for name in os.listdir(TRACES_DIR) if name.endswith('.json'))
+    except FileNotFoundError:
+        return
+    for name in names[:-keep] if keep else names:
+        stem = os.path.join(TRACES_DIR, name[:-len('.json')])
+        for path in (stem + '.json', stem + '.prof', stem + '.memory.txt'):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+@contextmanager
+def trace_run(name: str):
+    """Collect the spans of everything run inside this block (including threads started with in_context)."""
+    trace = Trace(name)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, category: str, **attributes):
+    """
+    Time a block as a child of the current span.
+
+    Outside a traced run the span is still returned (so callers can set attributes) but not recorded.
+    """
+    current = Span(name, category, attributes)
+    parent = _current_span.get()
+    if parent is not None:
+        current.attributes.setdefault('parent', parent.name)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes['error'] = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.record(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def in_context(func: Callable) -> Callable:
+    """Bind func to a copy of the caller's trace context, for running it in another thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+class RunProfiler:
+    """
+    cProfile and tracemalloc capture for a debug-mode run.
+
+    Stage functions are profiled per thread with profile(); the merged statistics and the
+    top memory allocations are written next to the trace file.
+    """
+
+    def __init__(self):
+        self.stats: Optional[pstats.Stats] = None
+        self.lock = threading.Lock()
+        self.started_tracemalloc = not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start()
+
+    def profile(self, func: Callable, *args, **kwargs):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ allows only one active profiler; run this stage unprofiled
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+
+    def finish(self, trace: Trace, top: int = 25) -> None:
+        """Stop tracemalloc, record peak memory in the trace and write the .prof and .memory.txt reports."""
+        os.makedirs(TRACES_DIR, exist_ok=True)
+        stem = trace.file_stem()
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            trace.metadata['memory_peak_bytes'] = peak
+            snapshot = tracemalloc.take_snapshot()
+            with open(stem + ".memory.txt", 'w', encoding='utf-8') as f:
+                f.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB\n\n")
+                for statistic in snapshot.statistics('lineno')[:top]:
+                    f.write(f"{statistic}\n")
+            if self.started_tracemalloc:
+                tracemalloc.stop()
+        if self.stats is not None:
+            self.stats.dump_stats(stem + ".prof")
+            trace.metadata['profile'] = stem + ".prof"
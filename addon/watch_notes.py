@@ -0,0 +1,262 @@
+"""Watch local note folders and batch bursts of changes into single workflow runs."""
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from .scrape_local import iter_vault_files, is_note_path
+from .logger import get_logger
+
+logger = get_logger()
+
+DEBOUNCE_SECONDS = 2.0  # A batch is delivered once no new event arrived for this long
+MAX_BATCH_DELAY_SECONDS = 30.0  # Upper bound on how long a continuous burst can delay a batch
+MAX_PENDING_EVENTS = 10000  # Bounded event queue; overflowing it falls back to a full rescan
+POLL_INTERVAL_SECONDS = 2.0  # Used when inotify is not available
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+FULL_RESCAN = None  # Queue marker meaning "events were lost, rescan everything"
+
+
+def load_libc():
+    """Load libc with inotify support, or return None on platforms without it."""
+    libc_name = ctypes.util.find_library('c')
+    if not libc_name:
+        return None
+    try:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        libc.inotify_init1  # Raises AttributeError where inotify is unavailable
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class InotifySource:
+    """Recursive inotify watch on a directory tree (Linux only)."""
+
+    def __init__(self, root: str, libc):
+        self.root = root
+        self.libc = libc
+        self.watch_dirs: Dict[int, str] = {}
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_watch(self, directory: str) -> None:
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watch_dirs[wd] = directory
+
+    def add_tree(self, directory: str) -> None:
+        for root, dirs, _ in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            self.add_watch(root)
+
+    def read_events(self, timeout: float) -> List[Optional[str]]:
+        """Wait up to timeout seconds and return changed paths (FULL_RESCAN on kernel queue overflow)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        paths = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+            name = buffer[offset:offset + name_length].rstrip(b'\0')
+            offset += name_length
+
+            if mask & IN_Q_OVERFLOW:
+                paths.append(FULL_RESCAN)
+                continue
+            if mask & IN_IGNORED:
+                self.watch_dirs.pop(wd, None)
+                continue
+
+            directory = self.watch_dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not os.path.basename(path).startswith('.'):
+                    # New folders need their own watches; their files count as changed
+                    try:
+                        self.add_tree(path)
+                    except OSError as e:
+                        logger.warning(f"Could not watch new folder {path}: {e}")
+                    paths.append(FULL_RESCAN)
+                continue
+            paths.append(path)
+        return paths
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingSource:
+    """Portable fallback that compares (mtime, size) snapshots of the folder."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self) -> Dict[str, Tuple[int, int]]:
+        return {rel_path: (stat.st_mtime_ns, stat.st_size) for rel_path, stat in iter_vault_files(self.root)}
+
+    def read_events(self, timeout: float) -> List[Optional[str]]:
+        time.sleep(timeout)
+        snapshot = self.take_snapshot()
+        changed = [rel_path for rel_path, signature in snapshot.items() if self.snapshot.get(rel_path) != signature]
+        changed.extend(rel_path for rel_path in self.snapshot if rel_path not in snapshot)
+        self.snapshot = snapshot
+        return [os.path.join(self.root, rel_path) for rel_path in changed]
+
+    def close(self) -> None:
+        pass
+
+
+class NoteWatcher:
+    """
+    Watch a local vault and call on_batch(changed_paths, full_rescan) once per burst of changes.
+
+    Events flow through a bounded queue. Duplicate paths within a burst are coalesced, and a burst
+    that overflows the queue is delivered as a single full rescan. on_batch runs on the watcher's
+    dispatch thread; events arriving while it runs are collected into the next batch.
+    """
+
+    def __init__(self, vault_path: str, on_batch: Callable[[List[str], bool], None],
+                 debounce_seconds: float = DEBOUNCE_SECONDS, max_batch_delay: float = MAX_BATCH_DELAY_SECONDS,
+                 max_pending_events: int = MAX_PENDING_EVENTS):
+        self.vault_path = vault_path
+        self.on_batch = on_batch
+        self.debounce_seconds = debounce_seconds
+        self.max_batch_delay = max_batch_delay
+        self.events = queue.Queue(maxsize=max_pending_events)
+        self.overflowed = threading.Event()
+        self.stopped = threading.Event()
+        self.source = None
+        self.threads = []
+
+    def start(self) -> None:
+        libc = load_libc()
+        if libc is not None:
+            try:
+                self.source = InotifySource(self.vault_path, libc)
+                logger.info(f"Watching {self.vault_path} with inotify ({len(self.source.watch_dirs)} folders)")
+            except OSError as e:
+                logger.warning(f"inotify unavailable ({e}), falling back to polling")
+        if self.source is None:
+            self.source = PollingSource(self.vault_path)
+            logger.info(f"Watching {self.vault_path} by polling every {POLL_INTERVAL_SECONDS}s")
+
+        self.threads = [
+            threading.Thread(target=self.read_loop, name="notes2flash-watch-reader", daemon=True),
+            threading.Thread(target=self.dispatch_loop, name="notes2flash-watch-dispatch", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=POLL_INTERVAL_SECONDS + 1)
+        if self.source is not None:
+            self.source.close()
+        logger.info(f"Stopped watching {self.vault_path}")
+
+    def read_loop(self) -> None:
+        timeout = 0.5 if isinstance(self.source, InotifySource) else POLL_INTERVAL_SECONDS
+        while not self.stopped.is_set():
+            try:
+                paths = self.source.read_events(timeout)
+            except OSError as e:
+                logger.error(f"Error reading file events: {e}")
+                self.stopped.wait(timeout)
+                continue
+
+            for path in paths:
+                if path is FULL_RESCAN:
+                    self.overflowed.set()
+                elif self.is_relevant(path):
+                    try:
+                        self.events.put_nowait(path)
+                    except queue.Full:
+                        self.overflowed.set()
+            if self.overflowed.is_set() and self.events.empty():
+                # Wake the dispatcher even though no individual path was queued
+                try:
+                    self.events.put_nowait(FULL_RESCAN)
+                except queue.Full:
+                    pass
+
+    def is_relevant(self, path: str) -> bool:
+        rel_path = os.path.relpath(path, self.vault_path)
+        return not rel_path.startswith(os.pardir) and is_note_path(rel_path)
+
+    def collect_batch(self) -> Optional[Tuple[List[str], bool]]:
+        """Block until a burst of events has settled and return (changed paths, full_rescan)."""
+        try:
+            first = self.events.get(timeout=0.5)
+        except queue.Empty:
+            return None
+
+        changed = {first} if first is not FULL_RESCAN else set()
+        burst_started = time.monotonic()
+        while not self.stopped.is_set():
+            remaining = self.max_batch_delay - (time.monotonic() - burst_started)
+            if remaining <= 0:
+                break
+            try:
+                path = self.events.get(timeout=min(self.debounce_seconds, remaining))
+            except queue.Empty:
+                break
+            if path is not FULL_RESCAN:
+                changed.add(path)
+
+        full_rescan = self.overflowed.is_set()
+        self.overflowed.clear()
+        return sorted(changed), full_rescan
+
+    def dispatch_loop(self) -> None:
+        while not self.stopped.is_set():
+            batch = self.collect_batch()
+            if batch is None or self.stopped.is_set():
+                continue
+            changed_paths, full_rescan = batch
+            logger.info(f"Watch batch ready: {len(changed_paths)} changed files" + (" (full rescan)" if full_rescan else ""))
+            try:
+                self.on_batch(changed_paths, full_rescan)
+            except Exception as e:
+                logger.error(f"Error handling watch batch: {str(e)}")
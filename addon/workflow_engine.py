@@ -5,26 +5,57 @@ libs_path = os.path.join(addon_folder, "libs")
 if libs_path not in sys.path:
     sys.path.insert(0, libs_path)
 
+import threading
+import time
 import yaml
 from .scrape_notes import scrape_notes, mark_document_as_processed, get_document_state, update_document_state
 from .process_notes_to_cards import process_notes_to_cards
-from .add_cards_to_anki import add_cards_to_anki
+from .anki_output import uses_headless_output, write_cards_to_output
+from .workflow_graph import (
+    SCRAPE, PROCESS, ADD, DEFAULT_MAX_PARALLEL_NODES,
+    build_workflow_graph, count_consumers, node_dependencies, run_workflow_graph, topological_order
+)
 from .scrape_utils import parse_url
-from .logger import get_logger, reinitialize_logger
+from .config_service import get_config
+from .dry_run import format_plan, load_model_history, load_model_prices, plan_chain, add_costs
+from .tracing import RunProfiler, span, trace_run
+from .progress import current_progress, progress_run
+from .cancellation import CancellationToken, CancelledError
+from .cassette import run_scope
+from .note_type_templates import reload_templates
+from .logger import get_logger, run_logging
 
 # Get logger instance
 logger = get_logger()
 
 class WorkflowEngine:
-    def __init__(self, workflow_config, user_inputs, debug=False):
+    def __init__(self, workflow_config, user_inputs, debug=False, changed_paths=None, before_stage=None, cancel_token=None,
+                 progress_listener=None, cassette=None):
         self.workflow_config = workflow_config
         self.user_inputs = user_inputs
+        self.changed_paths = changed_paths  # Files reported by watch mode, limits local vault scans
+        self.before_stage = before_stage  # Called with each node before it runs, e.g. to wait for an LLM slot
+        self.cancel_token = cancel_token or CancellationToken()
+        # Only a token a caller can cancel is worth a thread per blocking call; without one they run inline
+        self.call_token = cancel_token
+        self.progress_listener = progress_listener  # Receives throttled ProgressSnapshot events
+        self.cassette = cassette  # Records or replays the run's HTTP exchanges (see cassette.py)
         self.stage_data = {}
+        self.data_lock = threading.Lock()  # Nodes of independent branches update stage_data concurrently
+        self.card_streams = {}  # Add node name -> stream adding its cards while processing is still running
+        self.consumers = {}  # Data key -> number of nodes that still need it
+        self.produced_keys = set()
+        self.nodes = []
+        self.completed_nodes = set()
+        self.streamed_add_nodes = set()
+        self.process_contents = {}  # Processing node name -> the content it split into chunks
+        self.completed_chunks = {}  # Processing node name -> chunks finished before a cancel
+        self.partial_results = {}  # Processing node name -> merged results of those chunks
+        self.scrape_count = 0
+        self.empty_sources = 0
+        self.start_time = None
+        self.profiler = None  # cProfile/tracemalloc capture in debug mode
         self.debug = debug
-        if self.debug:
-            logger = reinitialize_logger(debug=True)
-        else:
-            logger = reinitialize_logger(debug=False)
 
     @staticmethod
     def load_workflow_config(config_path):
@@ -50,11 +81,11 @@ class WorkflowEngine:
         if not isinstance(config['scrape_notes'], list) and not isinstance(config['scrape_notes'], dict):
             raise ValueError("'scrape_notes' must be a list or a dictionary")
 
-        if not isinstance(config['process_notes_to_cards'], list):
-            raise ValueError("'process_notes_to_cards' must be a list")
+        if not isinstance(config['process_notes_to_cards'], (list, dict)):
+            raise ValueError("'process_notes_to_cards' must be a list of steps or a dictionary of named step lists")
 
-        if not isinstance(config['add_cards_to_anki'], dict):
-            raise ValueError("'add_cards_to_anki' must be a dictionary")
+        if not isinstance(config['add_cards_to_anki'], (dict, list)):
+            raise ValueError("'add_cards_to_anki' must be a dictionary or a list of dictionaries")
 
     def replace_placeholders(self, config, data, stage_name=None):
         """Replace placeholders in the config with values from the user inputs."""
@@ -77,47 +108,29 @@ class WorkflowEngine:
         else:
             return config
 
-    def execute_workflow_stage(self, stage_name, stage_config, progress_callback=None):
+    def execute_workflow_stage(self, node, progress_callback=None):
+        stage_name = node.name
         logger.info(f"Starting stage: {stage_name}")
         if progress_callback:
             progress_callback(f"Starting stage: {stage_name}")
 
         try:
+            # Work on a snapshot so parallel branches don't see each other's partial updates
+            with self.data_lock:
+                data = dict(self.stage_data)
+
             # Replace placeholders in the stage config using user_inputs and previous stage data
-            stage_config = self.replace_placeholders(stage_config, self.stage_data, stage_name)
+            stage_config = self.replace_placeholders(node.config, data, node.kind)
             logger.debug(f"Stage config for {stage_name}: {stage_config}")
 
-            if stage_name == "scrape_notes":
-                result = scrape_notes(stage_config)
-                output_name = stage_config[0].get('output', 'scraped_notes_output') if isinstance(stage_config, list) else stage_config.get('output', 'scraped_notes_output')
-                self.stage_data[output_name] = result[output_name]
-                
-                # Parse URL to get doc_id and source type
-                url = stage_config[0].get('url') if isinstance(stage_config, list) else stage_config.get('url')
-                if url:
-                    source_info = parse_url(url)
-                    self.stage_data['doc_id'] = source_info['id']
-                    self.stage_data['source_type'] = source_info['type']
-                    self.stage_data['source_url'] = url
-            elif stage_name == "process_notes_to_cards":
-                if not isinstance(stage_config, list) or len(stage_config) == 0:
-                    raise ValueError("Invalid stage_config for process_notes_to_cards. Expected a non-empty list.")
-                logger.debug(f"Input data for process_notes_to_cards: {self.stage_data}")
-                result = process_notes_to_cards(self.stage_data, stage_config, self.workflow_config)
-                logger.debug(f"Output from process_notes_to_cards: {result}")
-                self.stage_data.update(result)  # This will add the 'flashcards' key to stage_data
-            elif stage_name == "add_cards_to_anki":
-                if not isinstance(stage_config, dict):
-                    raise ValueError("Invalid stage_config for add_cards_to_anki. Expected a dictionary.")
-                result = add_cards_to_anki(self.stage_data, stage_config)
-                # Check for actual errors, but don't treat duplicates as errors
-                if result.get('errors'):
-                    error_msg = f"Failed to add some cards to Anki: {result.get('errors')}"
-                    logger.error(error_msg)
-                    raise ValueError(error_msg)
-                # Log duplicates as info, not as errors
-                if result.get('duplicates', 0) > 0:
-                    logger.info(f"Found {result['duplicates']} duplicate cards in deck")
+            if node.kind == SCRAPE:
+                result = self.run_scrape_stage(node, stage_config)
+            elif node.kind == PROCESS:
+                logger.debug(f"Input data for {stage_name}: {data}")
+                result = self.run_process_stage(node, stage_config, data)
+                logger.debug(f"Output from {stage_name}: {result}")
+            elif node.kind == ADD:
+                result = self.run_add_stage(node, stage_config, data)
             else:
                 raise ValueError(f"Unknown stage: {stage_name}")
 
@@ -130,51 +143,280 @@ class WorkflowEngine:
             logger.error(f"Error in stage {stage_name}: {str(e)}")
             
             # If there's an error in a stage after scrape_notes, preserve the pending changes
-            if stage_name != "scrape_notes":
-                doc_id = self.stage_data.get('doc_id')
-                if doc_id:
-                    doc_state = get_document_state(doc_id)
-                    # Keep the pending changes but mark as not processed
-                    update_document_state(
-                        doc_id,
-                        doc_state['lines'],
-                        doc_state['version'],
-                        False,
-                        doc_state.get('pending_changes', []),
-                        self.stage_data.get('source_url'),
-                        self.stage_data.get('source_type')
-                    )
+            if node.kind != SCRAPE:
+                self.preserve_pending_changes()
             
             raise
 
+    def run_scrape_stage(self, node, stage_config):
+        # With several sources, one without changes must not stop the others
+        result = scrape_notes(stage_config, self.changed_paths, allow_empty=self.scrape_count > 1,
+                              cancel_token=self.call_token)
+        output_name = node.outputs[0]
+
+        with self.data_lock:
+            # Parse URL to get doc_id and source type
+            url = stage_config.get('url')
+            if url:
+                source_info = parse_url(url)
+                self.stage_data['doc_id'] = source_info['id']
+                self.stage_data['source_type'] = source_info['type']
+                self.stage_data['source_url'] = url
+            # Local vaults track one document per changed note file
+            self.stage_data.setdefault('tracked_doc_ids', []).extend(result.get('tracked_doc_ids', []))
+            # Stable IDs of the changed content blocks, in the order they appear in the output
+            self.stage_data.setdefault('changed_block_ids', []).extend(result.get('changed_block_ids', []))
+
+            if not result[output_name]:
+                self.empty_sources += 1
+                if self.empty_sources == self.scrape_count:
+                    raise ValueError("No changes detected in document. Skipping further processing.")
+
+        return {output_name: result[output_name]}
+
+    def run_process_stage(self, node, steps, data):
+        if node.content_key in data and not data[node.content_key]:
+            # A source without changes: its branch produces nothing
+            logger.info(f"Skipping {node.name}: no new content in '{node.content_key}'")
+            return {output: [] if index == len(steps) - 1 else "" for index, output in enumerate(node.outputs)}
+
+        streams = [stream for stream in self.card_streams.values() if stream.flashcards_key in node.outputs]
+
+        def on_chunk_results(chunk_results):
+            for stream in streams:
+                stream.submit(chunk_results)
+
+        content = data.get(node.content_key, "")
+        with self.data_lock:
+            self.process_contents[node.name] = content
+        try:
+            result = process_notes_to_cards(data, steps, self.workflow_config,
+                                            on_chunk_results if streams else None, node.content_key, self.call_token)
+        except CancelledError as e:
+            with self.data_lock:
+                self.completed_chunks[node.name] = getattr(e, 'completed_chunks', [])
+                self.partial_results[node.name] = getattr(e, 'partial_results', {})
+            raise
+        with self.data_lock:
+            self.completed_chunks[node.name] = [content]
+        return result
+
+    def run_add_stage(self, node, stage_config, data):
+        with self.data_lock:
+            card_stream = self.card_streams.pop(node.name, None)
+        if card_stream:
+            # Cards were already committed chunk by chunk; wait for the last batches
+            result = card_stream.finish()
+        elif uses_headless_output(stage_config):
+            result = write_cards_to_output(data, stage_config)
+        else:
+            # Imported here so runs that write to a file work without the anki library
+            from .add_cards_to_anki import add_cards_to_anki
+            result = add_cards_to_anki(data, stage_config, cancel_token=self.cancel_token)
+        if not card_stream and current_progress():
+            flashcards = data.get(stage_config.get('flashcards_data', 'flashcards'))
+            current_progress().cards_added(len(flashcards) if isinstance(flashcards, list) else 0)
+        # Check for actual errors, but don't treat duplicates as errors
+        if result.get('errors'):
+            error_msg = f"Failed to add some cards to Anki: {result.get('errors')}"
+            logger.error(error_msg)
+            raise ValueError(error_msg)
+        # Log duplicates as info, not as errors
+        if result.get('duplicates', 0) > 0:
+            logger.info(f"Found {result['duplicates']} duplicate cards in deck")
+        return result
+
+    def merge_stage_result(self, node, stage_result):
+        """Store a node's outputs and release inputs that no remaining node needs."""
+        with self.data_lock:
+            if isinstance(stage_result, dict):
+                if node.kind == ADD:
+                    # Several add stages each report their own counts
+                    stage_result = dict(stage_result)
+                    for key in ('cards_added', 'duplicates'):
+                        self.stage_data[key] = self.stage_data.get(key, 0) + stage_result.pop(key, 0)
+                elif node.kind == PROCESS:
+                    # Intermediate step outputs only matter if another stage reads them
+                    stage_result = {key: value for key, value in stage_result.items()
+                                    if self.consumers.get(key, 0) > 0 or key == node.outputs[-1]}
+                self.stage_data.update(stage_result)
+            elif stage_result is not None:
+                self.stage_data[node.name] = stage_result
+
+            for key in node.inputs:
+                self.consumers[key] -= 1
+                if self.consumers[key] == 0 and key in self.produced_keys:
+                    self.stage_data.pop(key, None)
+                    logger.debug(f"Released '{key}' after {node.name}")
+
+    def preserve_pending_changes(self):
+        with self.data_lock:
+            tracked_doc_ids = list(self.stage_data.get('tracked_doc_ids', []))
+        for doc_id in tracked_doc_ids:
+            doc_state = get_document_state(doc_id)
+            # Keep the stored fingerprints and pending changes but mark as not processed
+            update_document_state(
+                doc_id,
+                None,
+                doc_state['version'],
+                False,
+                doc_state.get('pending_changes', []),
+                doc_state.get('source_url'),
+                doc_state.get('source_type')
+            )
+
+    def start_card_streams(self, nodes, progress_callback=None):
+        """Start streaming cards into Anki for each add stage, unless it sets stream_cards: false or writes to a file."""
+        for node in nodes:
+            if node.kind != ADD or not node.config.get('stream_cards', True) or uses_headless_output(node.config):
+                continue
+            from .card_stream import CardInsertionStream
+            add_config = self.replace_placeholders(node.config, self.stage_data, ADD)
+            self.card_streams[node.name] = CardInsertionStream(add_config, progress_callback, self.start_time,
+                                                                 self.cancel_token)
+            self.streamed_add_nodes.add(node.name)
+
+    def finish_card_streams(self):
+        """Wait for the streams of add stages that did not run and return the number of cards they added."""
+        with self.data_lock:
+            card_streams, self.card_streams = self.card_streams, {}
+        return sum(card_stream.finish().get('cards_added', 0) for card_stream in card_streams.values())
+
+    def keep_cancelled_work(self, streamed_cards):
+        """
+        Keep what a cancelled run finished and return a summary message.
+
+        Cards of finished chunks that were not streamed are committed unless the add stage sets
+        commit_on_cancel: false. Changed blocks whose chunks were all processed and kept are then
+        removed from the documents' pending changes, so the next run only processes the rest.
+        """
+        cards_kept = self.stage_data.get('cards_added', 0) + streamed_cards
+        with self.data_lock:
+            data = dict(self.stage_data)
+            for results in self.partial_results.values():
+                data.update(results)
+
+        kept_keys = set()
+        for node in self.nodes:
+            if node.kind != ADD:
+                continue
+            key = node.inputs[0]
+            if node.name in self.completed_nodes or node.name in self.streamed_add_nodes:
+                kept_keys.add(key)
+            elif node.config.get('commit_on_cancel', True) and data.get(key):
+                try:
+                    result = self.run_add_stage(node, self.replace_placeholders(node.config, data, ADD), data)
+                except Exception as e:
+                    logger.error(f"Could not add the cards of finished chunks for {node.name}: {str(e)}")
+                    continue
+                cards_kept += result.get('cards_added', 0)
+                kept_keys.add(key)
+
+        # Processing chains that read the same content all have to finish a block before it is done
+        chains = []
+        for node in self.nodes:
+            if node.kind != PROCESS:
+                continue
+            content = self.process_contents.get(node.name, data.get(node.content_key) or "")
+            chunks = self.completed_chunks.get(node.name, []) if node.outputs[-1] in kept_keys else []
+            chains.append((content, chunks))
+
+        def is_done(text):
+            return all(any(text in chunk for chunk in chunks) for content, chunks in chains if text in content)
+
+        with self.data_lock:
+            tracked_doc_ids = list(self.stage_data.get('tracked_doc_ids', []))
+        remaining_blocks = 0
+        for doc_id in tracked_doc_ids:
+            doc_state = get_document_state(doc_id)
+            remaining = [text for text in doc_state.get('pending_changes', []) if not is_done(text)]
+            remaining_blocks += len(remaining)
+            update_document_state(doc_id, None, doc_state['version'], False, remaining,
+                                  doc_state.get('source_url'), doc_state.get('source_type'))
+
+        self.stage_data['cards_added'] = cards_kept
+        return f"Cancelled: kept {cards_kept} cards, {remaining_blocks} changed blocks left for the next run"
+
+    def run_stage_node(self, node, progress_callback=None):
+        self.cancel_token.raise_if_cancelled()
+        logger.info(f"Preparing stage: {node.name}")
+        if progress_callback:
+            progress_callback(f"Preparing stage: {node.name}")
+        if self.before_stage:
+            self.before_stage(node)
+            self.cancel_token.raise_if_cancelled()
+        with span(node.name, 'stage', kind=node.kind):
+            if self.profiler:
+                stage_result = self.profiler.profile(self.execute_workflow_stage, node, progress_callback)
+            else:
+                stage_result = self.execute_workflow_stage(node, progress_callback)
+        self.merge_stage_result(node, stage_result)
+        with self.data_lock:
+            self.completed_nodes.add(node.name)
+
     def run_workflow(self, progress_callback=None):
+        """
+        Run the workflow inside a trace, which is written to traces/ whether the run succeeds or not.
+
+        With a cassette, the run's HTTP exchanges are recorded to it or replayed from it.
+        """
+        workflow_name = self.workflow_config.get('workflow_name', 'workflow')
+        self.profiler = RunProfiler() if self.debug else None
+        with run_logging(self.debug), trace_run(workflow_name) as trace, progress_run(self.progress_listener), \
+                run_scope(self.cassette):
+            reload_templates()
+            if self.cassette:
+                trace.metadata['cassette'] = {'path': self.cassette.path, 'mode': self.cassette.mode,
+                                              'speed': self.cassette.speed}
+            try:
+                with span(workflow_name, 'workflow'):
+                    return self.run_workflow_stages(progress_callback)
+            finally:
+                self.export_trace(trace)
+
+    def export_trace(self, trace):
+        try:
+            if self.profiler:
+                self.profiler.finish(trace)
+            trace.metadata['cards_added'] = self.stage_data.get('cards_added', 0)
+            trace_file = trace.export()
+        except Exception as e:
+            logger.warning(f"Could not write trace: {str(e)}")
+            return
+        self.stage_data['trace_file'] = trace_file
+        summary = trace.summary()
+        logger.info(f"Trace written to {trace_file}")
+        logger.info("Time by category: " + ", ".join(
+            f"{category} {entry['count']}x {entry['total_ms']:.0f} ms" for category, entry in summary['categories'].items()))
+        for model, stats in summary['models'].items():
+            logger.info(f"Model {model}: {stats['attempts']} attempts, retry rate {stats['retry_rate']:.0%}, "
+                        f"mean {stats['mean_ms']:.0f} ms")
+
+    def run_workflow_stages(self, progress_callback=None):
         try:
+            self.start_time = time.perf_counter()
             self.stage_data.update(self.user_inputs)
             logger.debug(f"Initial stage data: {self.stage_data}")
 
-            stages = ['scrape_notes', 'process_notes_to_cards', 'add_cards_to_anki']
-            for stage in stages:
-                logger.info(f"Preparing stage: {stage}")
-                if progress_callback:
-                    progress_callback(f"Preparing stage: {stage}")
-
-                stage_config = self.workflow_config.get(stage, {})
-                stage_result = self.execute_workflow_stage(stage, stage_config, progress_callback)
-
-                if isinstance(stage_result, dict):
-                    self.stage_data.update(stage_result)
-                elif stage_result is not None:
-                    self.stage_data[stage] = stage_result
+            nodes = build_workflow_graph(self.workflow_config)
+            self.nodes = nodes
+            self.scrape_count = sum(1 for node in nodes if node.kind == SCRAPE)
+            self.consumers = count_consumers(nodes)
+            self.produced_keys = {key for node in nodes for key in node.outputs}
+            logger.debug(f"Workflow graph: {nodes}")
 
-                logger.debug(f"Stage data after {stage}: {self.stage_data}")
+            self.start_card_streams(nodes, progress_callback)
+            max_parallel = int(self.workflow_config.get('max_parallel_stages', DEFAULT_MAX_PARALLEL_NODES))
+            run_workflow_graph(nodes, lambda node: self.run_stage_node(node, progress_callback), max_parallel)
+            logger.debug(f"Stage data after workflow: {self.stage_data}")
 
             # After successful completion of all stages, mark the document as successfully processed
-            doc_id = self.stage_data.get('doc_id')
-            logger.debug(f"Document ID for marking as processed: {doc_id}")
-            if doc_id:
-                # Consider the document processed if we either added cards or found duplicates
-                cards_added = self.stage_data.get('cards_added', 0)
-                duplicates = self.stage_data.get('duplicates', 0)
+            tracked_doc_ids = self.stage_data.get('tracked_doc_ids', [])
+            logger.debug(f"Document IDs for marking as processed: {tracked_doc_ids}")
+            # Consider the documents processed if we either added cards or found duplicates
+            cards_added = self.stage_data.get('cards_added', 0)
+            duplicates = self.stage_data.get('duplicates', 0)
+            for doc_id in tracked_doc_ids:
                 if cards_added > 0 or duplicates > 0:
                     mark_document_as_processed(doc_id)  # This will also clear pending changes
                     logger.info(f"Marked document {doc_id} as successfully processed: {cards_added} cards added, {duplicates} duplicates found")
@@ -187,11 +429,90 @@ class WorkflowEngine:
 
             return True
         except Exception as e:
+            # Commit the cards of chunks that completed before the failure
+            streamed_cards = self.finish_card_streams()
+            if self.cancel_token.shutting_down:
+                # Anki is closing: commit nothing and leave every pending change for the re-queued job
+                self.preserve_pending_changes()
+                message = "Stopped because Anki is closing; pending changes are kept for the next run"
+                logger.info(message)
+                raise CancelledError(message) from e
+            if self.cancel_token.cancelled:
+                message = self.keep_cancelled_work(streamed_cards)
+                logger.info(message)
+                if progress_callback:
+                    progress_callback(message)
+                raise CancelledError(message) from e
             error_message = f"Error in workflow execution: {str(e)}"
             logger.error(error_message)
             if progress_callback:
                 progress_callback(error_message)
             raise RuntimeError(error_message)
 
+    def plan_workflow(self, progress_callback=None, fetch_prices=True):
+        """
+        Dry run: scrape and diff the sources without recording anything, then plan the processing.
+
+        Content is chunked as a real run would chunk it, and each chain is planned with dry_run.plan_chain.
+        Returns a plan with the expected API calls, tokens, cost and wall time (see dry_run.py).
+        No completions are requested and no document state, vault index or cards are written.
+        """
+        with run_logging(self.debug):
+            return self.plan_workflow_stages(progress_callback, fetch_prices)
+
+    def plan_workflow_stages(self, progress_callback=None, fetch_prices=True):
+        self.stage_data.update(self.user_inputs)
+        nodes = build_workflow_graph(self.workflow_config)
+        history = load_model_history()
+        data = dict(self.stage_data)
+        durations = {}
+        chains = []
+        changed_blocks = 0
+        documents = set()
+
+        for node in topological_order(nodes):
+            if node.kind == SCRAPE:
+                if progress_callback:
+                    progress_callback(f"Checking for changes: {node.name}")
+                started = time.perf_counter()
+                stage_config = self.replace_placeholders(node.config, data, SCRAPE)
+                result = scrape_notes(stage_config, self.changed_paths, allow_empty=True,
+                                      cancel_token=self.call_token, dry_run=True)
+                durations[node.name] = time.perf_counter() - started
+                data[node.outputs[0]] = result[node.outputs[0]]
+                changed_blocks += len(result.get('changed_block_ids', []))
+                documents.update(result.get('tracked_doc_ids', []))
+            elif node.kind == PROCESS:
+                steps = self.replace_placeholders(node.config, data, PROCESS)
+                chain = plan_chain(steps, data, self.workflow_config, node.content_key, history)
+                chain['name'] = node.name
+                # Later chains are planned from the estimated length of this chain's outputs
+                data.update(chain.pop('outputs'))
+                durations[node.name] = chain['seconds']
+                chains.append(chain)
+
+        # Independent branches run in parallel, so the wall time follows the longest path through the graph
+        finish_times = {}
+        dependencies = node_dependencies(nodes)
+        for node in topological_order(nodes):
+            start = max((finish_times[dep] for dep in dependencies[node.name]), default=0.0)
+            finish_times[node.name] = start + durations.get(node.name, 0.0)
+
+        step_plans = [step_plan for chain in chains for step_plan in chain['steps']]
+        plan = {
+            'workflow': self.workflow_config.get('workflow_name', 'workflow'),
+            'changed_blocks': changed_blocks,
+            'documents': len(documents),
+            'chains': chains,
+            'calls': sum(step_plan['calls'] for step_plan in step_plans),
+            'prompt_tokens': sum(step_plan['prompt_tokens'] for step_plan in step_plans),
+            'completion_tokens': sum(step_plan['completion_tokens'] for step_plan in step_plans),
+            'seconds': round(max(finish_times.values(), default=0.0), 1)
+        }
+        models = list(dict.fromkeys(step_plan['model'] for step_plan in step_plans if step_plan['calls']))
+        add_costs(plan, load_model_prices(models, get_config(), fetch=fetch_prices))
+        logger.info(format_plan(plan))
+        return plan
+
     def get_final_result(self):
         return self.stage_data
@@ -0,0 +1,206 @@
+"""Turns a workflow config into a DAG of stage nodes and runs independent nodes in parallel."""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+from .tracing import in_context
+from .logger import get_logger
+
+logger = get_logger()
+
+SCRAPE = 'scrape_notes'
+PROCESS = 'process_notes_to_cards'
+ADD = 'add_cards_to_anki'
+
+DEFAULT_MAX_PARALLEL_NODES = 4
+DEFAULT_SCRAPE_OUTPUT = 'scraped_notes_output'
+DEFAULT_STEP_OUTPUT = 'flashcards'
+
+
+class WorkflowNode:
+    """One unit of work in the workflow graph, with the data keys it reads and writes."""
+
+    __slots__ = ('name', 'kind', 'config', 'inputs', 'outputs', 'content_key')
+
+    def __init__(self, name: str, kind: str, config: Any, inputs: List[str], outputs: List[str],
+                 content_key: Optional[str] = None):
+        self.name = name
+        self.kind = kind
+        self.config = config
+        self.inputs = inputs
+        self.outputs = outputs
+        self.content_key = content_key  # For processing chains: the key that is split into chunks
+
+    def __repr__(self):
+        return f"WorkflowNode({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+
+def root_key(key: str) -> str:
+    """Return the top-level data key of a possibly nested input such as 'notes.summary'."""
+    return key.split('.')[0]
+
+
+def as_list(stage_config: Any) -> List[Any]:
+    return stage_config if isinstance(stage_config, list) else [stage_config]
+
+
+def build_scrape_nodes(stage_config: Any) -> List[WorkflowNode]:
+    sources = as_list(stage_config)
+    return [
+        WorkflowNode(SCRAPE if len(sources) == 1 else f"{SCRAPE}[{index}]", SCRAPE, source, [],
+                     [source.get('output', DEFAULT_SCRAPE_OUTPUT)])
+        for index, source in enumerate(sources)
+    ]
+
+
+def build_process_nodes(stage_config: Any, default_content_key: Optional[str]) -> List[WorkflowNode]:
+    """
+    Build one node per processing chain.
+
+    A list of steps is a single chain fed by the first scrape output (the original format).
+    A mapping of branch name to steps defines independent chains, each fed by the first
+    input of its first step.
+    """
+    if isinstance(stage_config, dict):
+        branches = [(f"{PROCESS}.{name}", steps) for name, steps in stage_config.items()]
+    else:
+        branches = [(PROCESS, stage_config)]
+
+    nodes = []
+    for name, steps in branches:
+        if not isinstance(steps, list) or not steps:
+            raise ValueError(f"Processing chain '{name}' must be a non-empty list of steps")
+        if isinstance(stage_config, dict):
+            first_inputs = steps[0].get('input') or []
+            if not first_inputs:
+                raise ValueError(f"The first step of '{name}' must declare an input to process")
+            content_key = first_inputs[0]
+        else:
+            content_key = default_content_key
+
+        outputs = [step.get('output', DEFAULT_STEP_OUTPUT) for step in steps]
+        inputs = [content_key] + [root_key(key) for step in steps for key in step.get('input') or []]
+        # Keys produced inside the chain are passed between steps per chunk, not through the graph
+        external_inputs = list(dict.fromkeys(key for key in inputs if key not in outputs))
+        nodes.append(WorkflowNode(name, PROCESS, steps, external_inputs, outputs, content_key))
+    return nodes
+
+
+def build_add_nodes(stage_config: Any) -> List[WorkflowNode]:
+    targets = as_list(stage_config)
+    return [
+        WorkflowNode(ADD if len(targets) == 1 else f"{ADD}[{index}]", ADD, target,
+                     [target.get('flashcards_data', DEFAULT_STEP_OUTPUT)], [])
+        for index, target in enumerate(targets)
+    ]
+
+
+def build_workflow_graph(workflow_config: Dict[str, Any]) -> List[WorkflowNode]:
+    """
+    Build the workflow nodes from a config and check the outputs and dependencies.
+
+    The original three-stage configs become a simple chain: scrape -> process -> add.
+    """
+    scrape_nodes = build_scrape_nodes(workflow_config[SCRAPE])
+    process_nodes = build_process_nodes(workflow_config[PROCESS], scrape_nodes[0].outputs[0])
+    nodes = scrape_nodes + process_nodes + build_add_nodes(workflow_config[ADD])
+
+    producers = {}
+    for node in nodes:
+        for key in node.outputs:
+            if key in producers and producers[key] is not node:
+                raise ValueError(f"Output '{key}' is produced by both '{producers[key].name}' and '{node.name}'")
+            producers[key] = node
+
+    available = set(workflow_config.get('user_inputs', []))
+    for node in nodes:
+        for key in node.inputs:
+            if key not in producers and key not in available:
+                logger.warning(f"Input '{key}' of '{node.name}' is not produced by any stage or user input")
+
+    topological_order(nodes)  # Raises on cycles
+    return nodes
+
+
+def node_dependencies(nodes: List[WorkflowNode]) -> Dict[str, List[str]]:
+    """Return {node name: names of the nodes producing its inputs}."""
+    producers = {key: node.name for node in nodes for key in node.outputs}
+    return {
+        node.name: list(dict.fromkeys(producers[key] for key in node.inputs if key in producers and producers[key] != node.name))
+        for node in nodes
+    }
+
+
+def dependency_counts(nodes: List[WorkflowNode]):
+    """Return ({node name: number of unfinished producers}, {node name: names of nodes reading its outputs})."""
+    dependencies = node_dependencies(nodes)
+    dependents: Dict[str, List[str]] = {node.name: [] for node in nodes}
+    for name, deps in dependencies.items():
+        for dep in deps:
+            dependents[dep].append(name)
+    return {name: len(deps) for name, deps in dependencies.items()}, dependents
+
+
+def topological_order(nodes: List[WorkflowNode]) -> List[WorkflowNode]:
+    remaining, dependents = dependency_counts(nodes)
+    by_name = {node.name: node for node in nodes}
+    ready = [node.name for node in nodes if remaining[node.name] == 0]
+    order = []
+    while ready:
+        name = ready.pop(0)
+        order.append(by_name[name])
+        for dependent in dependents[name]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    if len(order) != len(nodes):
+        cycle = [name for name, count in remaining.items() if count > 0]
+        raise ValueError(f"Workflow stages depend on each other in a cycle: {', '.join(cycle)}")
+    return order
+
+
+def count_consumers(nodes: List[WorkflowNode]) -> Dict[str, int]:
+    """Return how many nodes read each data key, used to release keys nobody needs anymore."""
+    consumers: Dict[str, int] = {}
+    for node in nodes:
+        for key in node.inputs:
+            consumers[key] = consumers.get(key, 0) + 1
+    return consumers
+
+
+def run_workflow_graph(nodes: List[WorkflowNode], run_node: Callable[[WorkflowNode], None],
+                       max_workers: int = DEFAULT_MAX_PARALLEL_NODES) -> None:
+    """
+    Run every node once its producers have finished, with independent nodes in parallel.
+
+    If a node fails, no new nodes are started; nodes already running are allowed to finish
+    and the first error is raised.
+    """
+    remaining, dependents = dependency_counts(nodes)
+    by_name = {node.name: node for node in nodes}
+
+    ready = [node for node in nodes if remaining[node.name] == 0]
+    error = None
+    with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="notes2flash-node") as pool:
+        running = {}
+        while ready or running:
+            if error is None:
+                for node in ready:
+                    # Each node runs in a copy of the caller's context so its spans join the run's trace
+                    running[pool.submit(in_context(run_node), node)] = node
+            ready = []
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                exception = future.exception()
+                if exception is not None:
+                    error = error or exception
+                    continue
+                for dependent in dependents[node.name]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        ready.append(by_name[dependent])
+
+    if error is not None:
+        raise error
@@ -0,0 +1,66 @@
+"""
+Measure what loading the add-on costs during Anki startup.
+
+Each measurement imports modules in a fresh interpreter, so nothing is cached in
+sys.modules. "At startup" is the package __init__ that Anki imports when it loads
+add-ons. "Deferred" is the pipeline the dialog needs (engine, scrapers, processing,
+job queue, watch mode), which __init__ used to import through gui.py at startup and
+now only imports when Notes2Flash is first opened. aqt itself is not imported; Anki has
+already loaded it by the time add-ons load.
+
+Usage: python benchmarks/bench_addon_import.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import json, sys, time
+sys.path.insert(0, {repo_dir!r})
+before = set(sys.modules)
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": len(set(sys.modules) - before)}}))
+"""
+
+SCENARIOS = [
+    ("at startup (package __init__)", ["addon"]),
+    ("deferred (pipeline used by the dialog)", ["addon", "addon.notes2flash", "addon.job_queue", "addon.watch_notes"]),
+]
+
+
+def measure(modules, runs):
+    timings = []
+    module_count = 0
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", MEASURE.format(repo_dir=REPO_DIR, modules=modules)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output)
+        timings.append(result["ms"])
+        module_count = result["modules"]
+    return statistics.median(timings), module_count
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"Cold import time, median of {runs} fresh interpreters")
+    for label, modules in SCENARIOS:
+        try:
+            median_ms, module_count = measure(modules, runs)
+        except subprocess.CalledProcessError as e:
+            print(f"  {label:40s} failed: {e.stderr.strip().splitlines()[-1]}")
+            continue
+        print(f"  {label:40s} {median_ms:8.1f} ms  {module_count:4d} modules")
+    print("The deferred row is what every Anki startup paid before; now it is paid on first use.")
+
+
+if __name__ == "__main__":
+    main()
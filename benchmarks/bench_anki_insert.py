@@ -0,0 +1,74 @@
+"""
+Compare per-card note insertion with a single bulk add_notes call on a throwaway collection.
+
+Requires the standalone `anki` package (pip install anki).
+
+Usage: python benchmarks/bench_anki_insert.py [card_count]
+"""
+import os
+import sys
+import tempfile
+import time
+
+try:
+    from anki.collection import AddNoteRequest, Collection
+    from anki.notes import Note
+except ImportError:
+    sys.exit("This benchmark needs the standalone anki package: pip install anki")
+
+DECK_NAME = "Notes2Flash Benchmark"
+
+
+def make_cards(card_count, prefix):
+    return [{'Front': f"{prefix} question {i}", 'Back': f"answer {i}"} for i in range(card_count)]
+
+
+def exists_in_deck(col, fields):
+    query = [f'deck:"{DECK_NAME}"'] + [f'"{name}:{value}"' for name, value in fields.items()]
+    return bool(col.find_notes(" AND ".join(query)))
+
+
+def per_card_insert(col, cards):
+    """The previous add_note_to_deck flow: everything is resolved again for each card."""
+    for fields in cards:
+        deck_id = col.decks.id(DECK_NAME)
+        col.decks.select(deck_id)
+        note_type = col.models.by_name("Basic")
+        note = Note(col, note_type)
+        note.fields[0], note.fields[1] = fields['Front'], fields['Back']
+        note.note_type()['did'] = deck_id
+        if not exists_in_deck(col, fields):
+            col.addNote(note)
+
+
+def bulk_insert(col, cards):
+    """The add_notes_in_bulk flow: resolve once, build all notes, add them in one operation."""
+    deck_id = col.decks.id(DECK_NAME)
+    note_type = col.models.by_name("Basic")
+    notes = []
+    for fields in cards:
+        if exists_in_deck(col, fields):
+            continue
+        note = Note(col, note_type)
+        note.fields[0], note.fields[1] = fields['Front'], fields['Back']
+        notes.append(note)
+    undo_entry = col.add_custom_undo_entry("Notes2Flash: Add Cards")
+    col.add_notes([AddNoteRequest(note=note, deck_id=deck_id) for note in notes])
+    col.merge_undo_entries(undo_entry)
+
+
+def main():
+    card_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, insert in (("per-card", per_card_insert), ("bulk", bulk_insert)):
+            col = Collection(os.path.join(tmp, f"{name}.anki2"))
+            start = time.perf_counter()
+            insert(col, make_cards(card_count, name))
+            elapsed = time.perf_counter() - start
+            print(f"{name:>9}: {card_count} cards in {elapsed * 1000:8.1f} ms "
+                  f"({elapsed * 1000 / card_count:.2f} ms per card), {col.note_count()} notes")
+            col.close()
+
+
+if __name__ == "__main__":
+    main()
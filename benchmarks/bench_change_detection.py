@@ -0,0 +1,120 @@
+"""
+Benchmark the hash-based change detector against the previous difflib implementation.
+
+Usage: python benchmarks/bench_change_detection.py [--skip-legacy]
+"""
+import difflib
+import random
+import sys
+import time
+
+from _addon_loader import load_addon_module
+
+change_detection = load_addon_module("change_detection")
+
+SIZES = [10_000, 50_000, 100_000, 200_000]
+LEGACY_MAX_SIZE = 20_000  # The old implementation takes minutes beyond this
+
+
+def legacy_compare_document_versions(old_lines, new_lines):
+    """The difflib-based implementation this benchmark replaces."""
+    old_set = set(old_lines)
+    new_set = set(new_lines)
+    added_lines = list(new_set - old_set)
+    differ = difflib.Differ()
+    diff = list(differ.compare(old_lines, new_lines))
+    modified_lines = []
+    for i, line in enumerate(diff):
+        if line.startswith('- '):
+            old_text = line[2:]
+            for j in range(i + 1, min(i + 3, len(diff))):
+                if diff[j].startswith('+ '):
+                    new_text = diff[j][2:]
+                    similarity = difflib.SequenceMatcher(None, old_text, new_text).ratio()
+                    if 0.5 < similarity < 1.0:
+                        modified_lines.append(new_text)
+                        break
+    added_lines = [line for line in added_lines if line not in modified_lines]
+    return {'added': added_lines, 'modified': modified_lines,
+            'total_changes': len(added_lines) + len(modified_lines)}
+
+
+def make_document(size, rng):
+    lines = []
+    for i in range(size):
+        if i % 40 == 0:
+            lines.append(f"## Section {i // 40}")
+        elif i % 7 == 0:
+            lines.append("---")  # Repeated separator lines
+        else:
+            lines.append(f"Note {i}: fact number {rng.randint(0, 10**9)} about topic {i % 113}")
+    return lines
+
+
+def append_edit(lines, rng):
+    return lines + [f"New note {i} at the end" for i in range(len(lines) // 100)]
+
+
+def scattered_edits(lines, rng):
+    edited = list(lines)
+    for _ in range(len(lines) // 100):
+        index = rng.randrange(len(edited))
+        edited[index] = edited[index] + " (edited)"
+    return edited
+
+
+def inserted_paragraphs(lines, rng):
+    edited = list(lines)
+    for n in range(20):
+        index = rng.randrange(len(edited))
+        edited[index:index] = [f"Inserted paragraph {n} line {k}" for k in range(5)]
+    return edited
+
+
+def rewritten_section(lines, rng):
+    start = len(lines) // 2
+    length = max(200, len(lines) // 50)
+    rewritten = [f"Rewritten note {k}: fact {rng.randint(0, 10**9)} about topic {k % 113}" for k in range(length)]
+    return lines[:start] + rewritten + lines[start + length:]
+
+
+def moved_block(lines, rng):
+    start = len(lines) // 3
+    block = lines[start:start + len(lines) // 20]
+    remaining = lines[:start] + lines[start + len(block):]
+    return remaining + block
+
+
+PATTERNS = [
+    ("append 1%", append_edit),
+    ("edit 1% of lines", scattered_edits),
+    ("insert 20 paragraphs", inserted_paragraphs),
+    ("rewrite 2% section", rewritten_section),
+    ("move 5% block", moved_block),
+]
+
+
+def time_call(func, old, new):
+    start = time.perf_counter()
+    result = func(old, new)
+    return time.perf_counter() - start, result['total_changes']
+
+
+def main():
+    skip_legacy = '--skip-legacy' in sys.argv
+    rng = random.Random(42)
+    print(f"{'lines':>8}  {'pattern':<22} {'hash diff':>12} {'legacy':>12}")
+    for size in SIZES:
+        old = make_document(size, rng)
+        for name, edit in PATTERNS:
+            new = edit(old, rng)
+            elapsed, changes = time_call(change_detection.compare_document_versions, old, new)
+            legacy = "-"
+            if not skip_legacy and size <= LEGACY_MAX_SIZE:
+                legacy_elapsed, _ = time_call(legacy_compare_document_versions, old, new)
+                legacy = f"{legacy_elapsed * 1000:.0f} ms"
+            print(f"{size:>8}  {name:<22} {elapsed * 1000:>9.0f} ms {legacy:>12}   ({changes} changed lines)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare the legacy Google-Docs-shaped scraper output with the native document model.
+
+Usage: python benchmarks/bench_document_model.py [line_count]
+"""
+import sys
+import time
+import tracemalloc
+
+from _addon_loader import load_addon_module
+
+document_model = load_addon_module("document_model")
+
+
+def make_text(line_count):
+    lines = []
+    for i in range(line_count):
+        if i % 50 == 0:
+            lines.append(f"## Section {i // 50}")
+        elif i % 10 == 0:
+            lines.append("")
+        else:
+            lines.append(f"Line {i}: some note text about topic {i % 97} with a few more words.")
+    return "\n".join(lines)
+
+
+def legacy_pipeline(text):
+    doc = {
+        'body': {
+            'content': [{'paragraph': {'elements': [{'textRun': {'content': line}}]}}
+                        for line in text.split('\n')]
+        },
+        'revisionId': None
+    }
+    return document_model.document_from_google_doc(doc).texts()
+
+
+def native_pipeline(text):
+    return document_model.document_from_text(text).texts()
+
+
+def measure(label, func, text):
+    start = time.perf_counter()
+    func(text)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{label:<8} time: {elapsed * 1000:8.1f} ms   peak allocations: {peak / 1024 / 1024:8.1f} MiB")
+    return elapsed, peak
+
+
+def main():
+    line_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    text = make_text(line_count)
+    assert legacy_pipeline(text) == native_pipeline(text)
+
+    print(f"{line_count} lines")
+    legacy_time, legacy_peak = measure("legacy", legacy_pipeline, text)
+    native_time, native_peak = measure("native", native_pipeline, text)
+    print(f"speedup: {legacy_time / native_time:.1f}x   peak memory reduction: {legacy_peak / native_peak:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
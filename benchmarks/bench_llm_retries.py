@@ -0,0 +1,182 @@
+"""
+Measure the tokens, latency and cards that malformed final-step outputs cost with:
+- before: the retry loop from before structured output and repairs, emulated here. Any
+  invalid reply regenerates the whole prompt after the retry delay.
+- salvage: invalid cards are dropped, with no repair requests (repair_attempts: 0).
+- repair: invalid cards are sent back in repair requests.
+- after: structured output plus repair requests.
+
+The OpenRouter API is simulated: each response is malformed at the given rate, less often
+when a JSON schema is sent, and latency is accounted per token instead of slept, so the
+benchmark runs in a moment and needs no API key.
+
+Usage: python benchmarks/bench_llm_retries.py [chunk_count] [malformed_rate] [structured_malformed_rate] [seed]
+"""
+import json
+import random
+import sys
+
+from _addon_loader import load_addon_module
+
+processing_utils = load_addon_module("processing_utils")
+cancellation = load_addon_module("cancellation")
+
+MODEL = "bench/model"
+OUTPUT_FIELDS = ["Front", "Back"]
+CARDS_PER_CHUNK = 8
+CHUNK_CHARS = 4000
+MS_PER_CALL = 400
+MS_PER_COMPLETION_TOKEN = 20
+REPAIR_SUCCESS_RATE = 0.9
+PROMPT = "Turn these notes into flashcards with the fields Front and Back:\n{notes}"
+
+
+class SimulatedClock(cancellation.CancellationToken):
+    """Runs calls directly and adds retry delays to a simulated clock instead of sleeping."""
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = 0.0
+        self.waited = 0.0
+
+    def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def sleep(self, seconds):
+        self.seconds += seconds
+        self.waited += seconds
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.status_code = 200
+        self.body = body
+        self.content = json.dumps(body).encode("utf-8")
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class FakeApi:
+    """Stands in for requests.post and records what every request costs."""
+
+    def __init__(self, clock, rng, malformed_rate, structured_malformed_rate):
+        self.clock = clock
+        self.rng = rng
+        self.malformed_rate = malformed_rate
+        self.structured_malformed_rate = structured_malformed_rate
+        self.calls = []
+
+    def post(self, url, headers, data, timeout=None):
+        request = json.loads(data)
+        prompt = request["messages"][-1]["content"]
+        structured = "response_format" in request
+        repair = prompt.startswith("The following output should be")
+        # A repair request only carries the invalid items, here always one card
+        cards = [{"Front": f"question {i}", "Back": f"answer {i}"} for i in range(1 if repair else CARDS_PER_CHUNK)]
+        if repair:
+            broken = self.rng.random() > REPAIR_SUCCESS_RATE
+        else:
+            broken = self.rng.random() < (self.structured_malformed_rate if structured else self.malformed_rate)
+        if structured and not broken:
+            content = json.dumps({processing_utils.STRUCTURED_OUTPUT_KEY: cards})
+        elif not broken:
+            content = "Here are your flashcards:\n" + json.dumps(cards)
+        else:
+            # A typical failure: a card is missing a field
+            cards[-1] = {"Front": cards[-1]["Front"]}
+            content = json.dumps(cards)
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self.clock.seconds += (MS_PER_CALL + completion_tokens * MS_PER_COMPLETION_TOKEN) / 1000
+        self.calls.append((prompt_tokens, completion_tokens))
+        return FakeResponse({
+            "choices": [{"message": {"content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+        })
+
+
+def legacy_call(notes, clock):
+    """The pre-repair retry loop: regenerate the full prompt after a growing delay until every card is valid."""
+    max_retries, retry_delay = 5, 10
+    prompt = processing_utils.format_prompt_safely(PROMPT, {"notes": notes})
+    for attempt in range(max_retries):
+        suffix = "" if attempt == 0 else f"\n\nRetry attempt {attempt}"
+        data = json.dumps({"model": MODEL, "messages": [{"role": "user", "content": prompt + suffix}]})
+        content = processing_utils.requests.post(url=None, headers=None, data=data).json()["choices"][0]["message"]["content"]
+        cards = processing_utils.extract_json_from_response(content, allow_partial=(attempt == max_retries - 1))
+        if cards and all(all(field in card for field in OUTPUT_FIELDS) for card in cards):
+            return cards
+        if attempt < max_retries - 1:
+            clock.sleep(retry_delay)
+            retry_delay += 2
+    raise RuntimeError("All attempts failed")
+
+
+def run(chunk_count, rates, seed, structured_output, repair_attempts, legacy=False):
+    clock = SimulatedClock()
+    api = FakeApi(clock, random.Random(seed), *rates)
+    processing_utils.requests.post = api.post
+    processing_utils._schema_rejected_models.clear()
+    retry_prompt = retry_completion = 0
+    first_seconds = 0.0
+    failed_chunks = 0
+    cards_kept = 0
+    for chunk_index in range(chunk_count):
+        notes = f"chunk {chunk_index} " + "x" * CHUNK_CHARS
+        calls_before = len(api.calls)
+        try:
+            if legacy:
+                cards_kept += len(legacy_call(notes, clock))
+            else:
+                cards_kept += len(processing_utils.call_openrouter_api(PROMPT, MODEL, {"notes": notes}, True, OUTPUT_FIELDS,
+                                                                       clock, structured_output, repair_attempts))
+        except RuntimeError:
+            failed_chunks += 1
+        first_call = api.calls[calls_before]
+        first_seconds += (MS_PER_CALL + first_call[1] * MS_PER_COMPLETION_TOKEN) / 1000
+        for prompt_tokens, completion_tokens in api.calls[calls_before + 1:]:
+            retry_prompt += prompt_tokens
+            retry_completion += completion_tokens
+    return {
+        "calls": len(api.calls),
+        "retry_calls": len(api.calls) - chunk_count,
+        "retry_prompt_tokens": retry_prompt,
+        "retry_completion_tokens": retry_completion,
+        "retry_seconds": clock.seconds - first_seconds,
+        "waited": clock.waited,
+        "seconds": clock.seconds,
+        "failed_chunks": failed_chunks,
+        "cards_lost": chunk_count * CARDS_PER_CHUNK - cards_kept
+    }
+
+
+def main():
+    chunk_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    malformed_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    structured_malformed_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    processing_utils.get_api_key_from_config = lambda: "benchmark"
+    processing_utils.logger.disabled = True
+    processing_utils._openrouter_models = {MODEL: {"supported_parameters": ["structured_outputs"]}}
+
+    print(f"{chunk_count} chunks, malformed rate {malformed_rate:.0%} "
+          f"({structured_malformed_rate:.0%} with a JSON schema), seed {seed}")
+    rates = (malformed_rate, structured_malformed_rate)
+    for name, structured_output, repair_attempts, legacy in (("before", False, 0, True), ("salvage", False, 0, False),
+                                                             ("repair", False, 2, False), ("after", "auto", 2, False)):
+        result = run(chunk_count, rates, seed, structured_output, repair_attempts, legacy)
+        print(f"{name:>7}: {result['calls']} calls ({result['retry_calls']} retries), "
+              f"retry tokens {result['retry_prompt_tokens']:,} prompt + {result['retry_completion_tokens']:,} completion, "
+              f"retry time {result['retry_seconds']:.0f} s ({result['waited']:.0f} s waiting), "
+              f"total {result['seconds']:.0f} s, {result['failed_chunks']} chunks failed")
+        print(f"{'':>7}  cards lost: {result['cards_lost']}")
+
+
+if __name__ == "__main__":
+    main()
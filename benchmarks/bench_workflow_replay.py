@@ -0,0 +1,83 @@
+"""
+Time WorkflowEngine.run_workflow offline by replaying a recorded cassette of its HTTP traffic.
+
+Every run starts from empty document tracking, step cache and vault index (the cassette
+isolates them, see cassette.py), so each run does the same work and timings compare across
+code changes. Traces and cards go to a temporary directory. Record
+the cassette once with --record (this calls the real APIs), then replay it as often as needed.
+With --speed 0, recorded latency is left out and only the pipeline's own time is measured.
+
+Usage: python benchmarks/bench_workflow_replay.py CASSETTE WORKFLOW [--input NAME=VALUE ...]
+       [--record] [--runs N] [--speed FACTOR]
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from _addon_loader import load_addon_module
+
+cli = load_addon_module("cli")
+cassette_module = load_addon_module("cassette")
+tracing = load_addon_module("tracing")
+workflow_engine = load_addon_module("workflow_engine")
+
+
+def run_once(workflow_path, user_inputs, cassette, tmp):
+    """Run the workflow with its traces and cards in tmp and return (seconds, trace summary)."""
+    tracing.TRACES_DIR = os.path.join(tmp, "traces")
+    workflow_config = workflow_engine.WorkflowEngine.load_workflow_config(workflow_path)
+    cli.apply_output(workflow_config, 'output_json', os.path.join(tmp, "cards.jsonl"))
+
+    engine = workflow_engine.WorkflowEngine(workflow_config, user_inputs, cassette=cassette)
+    start = time.perf_counter()
+    engine.run_workflow()
+    elapsed = time.perf_counter() - start
+    with open(engine.stage_data['trace_file'], 'r', encoding='utf-8') as f:
+        summary = json.load(f)['otherData']['summary']
+    return elapsed, summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("cassette")
+    parser.add_argument("workflow")
+    parser.add_argument("-i", "--input", action="append", default=[], metavar="NAME=VALUE")
+    parser.add_argument("--record", action="store_true", help="Record the cassette from a live run first")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--speed", type=float, default=0.0, help="Replay speed (1 = recorded latency, 0 = none)")
+    args = parser.parse_args()
+
+    workflow_path = cli.resolve_workflow_path(args.workflow)
+    user_inputs = cli.parse_inputs(args.input)
+
+    if args.record:
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed, _ = run_once(workflow_path, user_inputs, cassette_module.Cassette(args.cassette, cassette_module.RECORD), tmp)
+        print(f"recorded {args.cassette} in {elapsed:.2f} s")
+
+    # Replayed runs need no real keys, but the pipeline still checks that they are configured
+    os.environ.setdefault("OPENROUTER_API_KEY", "replay")
+    os.environ.setdefault("NOTION_API_KEY", "replay")
+
+    timings = []
+    categories = {}
+    for run in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            cassette = cassette_module.Cassette(args.cassette, cassette_module.REPLAY, args.speed)
+            elapsed, summary = run_once(workflow_path, user_inputs, cassette, tmp)
+        timings.append(elapsed)
+        for category, entry in summary['categories'].items():
+            categories.setdefault(category, []).append(entry['total_ms'])
+        print(f"run {run + 1}: {elapsed * 1000:8.1f} ms")
+
+    print(f"median {statistics.median(timings) * 1000:.1f} ms, min {min(timings) * 1000:.1f} ms "
+          f"over {args.runs} replays at speed {args.speed:g}")
+    for category, values in sorted(categories.items(), key=lambda item: -statistics.median(item[1])):
+        print(f"  {category:>10}: median {statistics.median(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
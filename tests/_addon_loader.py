@@ -0,0 +1,17 @@
+"""Import individual add-on modules without running the Anki-only package __init__."""
+import importlib
+import os
+import sys
+import types
+
+ADDON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "addon")
+PACKAGE_NAME = "notes2flash_tests"
+
+
+def load_addon_module(name):
+    """Import `addon/<name>.py` as part of a bare package so relative imports keep working."""
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [ADDON_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(f"{PACKAGE_NAME}.{name}")
@@ -0,0 +1,14 @@
+"""Shared fixtures for the add-on tests."""
+import pytest
+
+from _addon_loader import load_addon_module
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Point the document store at an empty database in a temporary directory."""
+    document_store = load_addon_module("document_store")
+    monkeypatch.setattr(document_store, "STORE_FILE", str(tmp_path / "notes2flash.db"))
+    monkeypatch.setattr(document_store, "LEGACY_TRACKED_DOCS_FILE", str(tmp_path / "tracked_docs.json"))
+    yield document_store
+    document_store.close_connection()
@@ -0,0 +1,102 @@
+"""Cassette request matching and what a recording keeps out of the saved file."""
+import json
+import uuid
+from datetime import datetime
+
+import pytest
+
+from _addon_loader import load_addon_module
+
+cassette = load_addon_module("cassette")
+
+API_KEY = "AIzaSy-secret-api-key"
+ACCESS_TOKEN = "ya29.secret-access-token"
+REFRESH_TOKEN = "1//secret-refresh-token"
+
+
+def completion_body(prompt):
+    """A completion request with the per-request values call_openrouter_api adds."""
+    return json.dumps({
+        "messages": [
+            {"role": "system", "content": f"Request ID: {datetime.utcnow().isoformat()}-{uuid.uuid4()}-attempt0"},
+            {"role": "user", "content": f"{prompt}\n\nRetry attempt 1 at {datetime.utcnow().isoformat()} with nonce {uuid.uuid4()}"}
+        ],
+        "unique_token": str(uuid.uuid4()),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+
+def test_fingerprint_masks_request_ids_nonces_and_timestamps():
+    url = "https://openrouter.ai/api/v1/chat/completions"
+
+    assert (cassette.request_fingerprint("POST", url, completion_body("Make cards"))
+            == cassette.request_fingerprint("post", url, completion_body("Make cards")))
+    assert (cassette.request_fingerprint("POST", url, completion_body("Make cards"))
+            != cassette.request_fingerprint("POST", url, completion_body("Make other cards")))
+
+
+def test_fingerprint_ignores_api_keys_in_urls():
+    assert (cassette.request_fingerprint("GET", f"https://docs.example.com/d/1?key={API_KEY}&alt=json", None)
+            == cassette.request_fingerprint("GET", "https://docs.example.com/d/1?key=other-key&alt=json", None))
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """Answer requests sent through requests' HTTPAdapter without touching the network."""
+    requests = pytest.importorskip("requests")
+    from requests.adapters import HTTPAdapter
+
+    def send(adapter, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        if "token" in request.url:
+            payload = {"access_token": ACCESS_TOKEN, "refresh_token": REFRESH_TOKEN, "expires_in": 3599}
+        else:
+            payload = {"choices": [{"message": {"content": "cards"}}], "echo": json.loads(request.body or "null")}
+        response._content = json.dumps(payload).encode("utf-8")
+        response.url = request.url
+        response.request = request
+        return response
+
+    monkeypatch.setattr(HTTPAdapter, "send", send)
+    return requests
+
+
+def test_recorded_cassette_contains_no_credentials(fake_server, tmp_path):
+    path = str(tmp_path / "run.json")
+    with cassette.Cassette(path, cassette.RECORD, speed=0):
+        fake_server.get(f"https://docs.example.com/d/1/export?key={API_KEY}")
+        fake_server.post(f"https://oauth2.example.com/token?access_token={ACCESS_TOKEN}", data={"grant_type": "refresh"})
+
+    with open(path, encoding="utf-8") as f:
+        saved = f.read()
+    for secret in (API_KEY, ACCESS_TOKEN, REFRESH_TOKEN):
+        assert secret not in saved
+    assert len(json.loads(saved)["exchanges"]) == 2
+
+
+def test_replay_matches_requests_with_fresh_nonces(fake_server, tmp_path):
+    path = str(tmp_path / "run.json")
+    url = "https://openrouter.ai/api/v1/chat/completions"
+    with cassette.Cassette(path, cassette.RECORD):
+        fake_server.post(url, data=completion_body("First chunk"))
+        fake_server.post(url, data=completion_body("Second chunk"))
+
+    with cassette.Cassette(path, cassette.REPLAY, speed=0) as replay:
+        second = fake_server.post(url, data=completion_body("Second chunk")).json()
+        first = fake_server.post(url, data=completion_body("First chunk")).json()
+
+    assert "Second chunk" in second["echo"]["messages"][1]["content"]
+    assert "First chunk" in first["echo"]["messages"][1]["content"]
+    assert len(replay.used) == 2
+
+
+def test_replay_fails_for_unrecorded_requests(fake_server, tmp_path):
+    path = str(tmp_path / "run.json")
+    with cassette.Cassette(path, cassette.RECORD):
+        fake_server.get("https://obsius.site/abc")
+
+    with pytest.raises(cassette.CassetteError):
+        with cassette.Cassette(path, cassette.REPLAY, speed=0):
+            fake_server.get("https://obsius.site/other")
@@ -0,0 +1,121 @@
+"""Line diffing and block fingerprints."""
+import difflib
+import random
+
+import pytest
+
+from _addon_loader import load_addon_module
+
+change_detection = load_addon_module("change_detection")
+block_fingerprints = load_addon_module("block_fingerprints")
+document_model = load_addon_module("document_model")
+
+
+def random_edits(rng, lines, edit_count, new_line):
+    """Apply random inserts, deletes and replacements to a copy of lines."""
+    lines = list(lines)
+    for _ in range(edit_count):
+        position = rng.randrange(len(lines) + 1)
+        kind = rng.choice(("insert", "delete", "replace"))
+        if kind == "insert" or position == len(lines):
+            lines.insert(position, new_line())
+        elif kind == "delete":
+            del lines[position]
+        else:
+            lines[position] = new_line()
+    return lines
+
+
+def apply_hunks(old, new, hunks):
+    """Rebuild new from old and the hunks, checking that the lines between hunks match."""
+    result = []
+    old_index = new_index = 0
+    for old_start, old_end, new_start, new_end in hunks:
+        assert old_start - old_index == new_start - new_index
+        assert old[old_index:old_start] == new[new_index:new_start]
+        result.extend(old[old_index:old_start])
+        result.extend(new[new_start:new_end])
+        old_index, new_index = old_end, new_end
+    assert old[old_index:] == new[new_index:]
+    result.extend(old[old_index:])
+    return result
+
+
+def matched_lines(old, new, hunks):
+    return len(new) - sum(new_end - new_start for _, _, new_start, new_end in hunks)
+
+
+def difflib_matched_lines(old, new):
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks())
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_diff_hashes_matches_difflib_on_unique_lines(seed):
+    rng = random.Random(seed)
+    counter = iter(range(10 ** 6, 10 ** 7))
+    old = rng.sample(range(10 ** 6), rng.randrange(0, 300))
+    new = random_edits(rng, old, rng.randrange(0, 20), lambda: next(counter))
+
+    hunks = change_detection.diff_hashes(old, new)
+
+    assert apply_hunks(old, new, hunks) == new
+    # Without repeated lines the longest common subsequence is unique in length
+    assert matched_lines(old, new, hunks) == difflib_matched_lines(old, new)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_diff_hashes_is_consistent_with_repeated_lines(seed):
+    rng = random.Random(seed)
+    old = [rng.randrange(8) for _ in range(rng.randrange(0, 200))]
+    new = random_edits(rng, old, rng.randrange(0, 30), lambda: rng.randrange(8))
+
+    hunks = change_detection.diff_hashes(old, new)
+
+    assert apply_hunks(old, new, hunks) == new
+    assert all(old_start < old_end or new_start < new_end for old_start, old_end, new_start, new_end in hunks)
+
+
+def test_diff_hashes_of_identical_sequences_is_empty():
+    lines = [1, 2, 2, 3, 1]
+    assert change_detection.diff_hashes(lines, list(lines)) == []
+
+
+PARAGRAPHS = [
+    "# Photosynthesis",
+    "Plants turn light, water and carbon dioxide into glucose and oxygen.",
+    "The light reactions happen in the thylakoid membranes\nand produce ATP and NADPH.",
+    "The Calvin cycle fixes carbon in the stroma.",
+]
+
+
+def fingerprints(text):
+    return [block.fingerprint for block in block_fingerprints.split_into_blocks(document_model.document_from_text(text))]
+
+
+def test_block_fingerprints_ignore_whitespace_edits():
+    original = "\n\n".join(PARAGRAPHS)
+    reflowed = "\n\n\n".join("  " + paragraph.replace("\n", " ").replace(" and", "\n   and") + "   "
+                             for paragraph in PARAGRAPHS)
+    assert fingerprints(reflowed) == fingerprints(original)
+
+
+def test_block_fingerprints_report_no_changes_for_moved_blocks():
+    old = fingerprints("\n\n".join(PARAGRAPHS))
+    moved = PARAGRAPHS[:1] + PARAGRAPHS[3:] + PARAGRAPHS[1:3]
+    blocks = block_fingerprints.split_into_blocks(document_model.document_from_text("\n\n".join(moved)))
+
+    changes = block_fingerprints.compare_block_fingerprints(old, blocks)
+
+    assert changes['total_changes'] == 0
+
+
+def test_block_fingerprints_report_an_edited_block():
+    old = fingerprints("\n\n".join(PARAGRAPHS))
+    edited = PARAGRAPHS[:3] + ["The Calvin cycle fixes carbon dioxide in the stroma."]
+    blocks = block_fingerprints.split_into_blocks(document_model.document_from_text("\n\n".join(edited)))
+
+    changes = block_fingerprints.compare_block_fingerprints(old, blocks)
+
+    assert [block.text for block in changes['modified']] == [edited[3]]
+    assert changes['added'] == []
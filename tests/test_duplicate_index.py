@@ -0,0 +1,114 @@
+"""Deterministic note GUIDs and the stored per-deck duplicate index."""
+import sqlite3
+
+import pytest
+
+from _addon_loader import load_addon_module
+
+duplicate_index = load_addon_module("duplicate_index")
+
+BASIC_MODEL_ID = 1
+BASIC_FIELDS = [{'name': 'Front'}, {'name': 'Back'}]
+
+
+class FakeDb:
+    """The parts of Anki's collection.db used by the index, backed by SQLite."""
+
+    def __init__(self):
+        self.connection = sqlite3.connect(":memory:")
+        self.connection.executescript(
+            "CREATE TABLE notes (id INTEGER PRIMARY KEY, guid TEXT, mid INTEGER, mod INTEGER, flds TEXT);"
+            "CREATE TABLE cards (id INTEGER PRIMARY KEY, nid INTEGER, did INTEGER, odid INTEGER DEFAULT 0);"
+        )
+        self.deck_reads = 0
+
+    def execute(self, sql, *args):
+        if sql == duplicate_index.DECK_NOTES_QUERY:
+            self.deck_reads += 1
+        return self.connection.execute(sql, args).fetchall()
+
+    def first(self, sql, *args):
+        return self.connection.execute(sql, args).fetchone()
+
+    def list(self, sql, *args):
+        return [row[0] for row in self.connection.execute(sql, args)]
+
+
+class FakeModels:
+    def get(self, model_id):
+        return {'flds': BASIC_FIELDS} if model_id == BASIC_MODEL_ID else None
+
+
+class FakeCollection:
+    def __init__(self, path):
+        self.path = path
+        self.db = FakeDb()
+        self.models = FakeModels()
+
+    def add_note(self, deck_id, fields, guid="random", mod=1):
+        cursor = self.db.connection.execute(
+            "INSERT INTO notes (guid, mid, mod, flds) VALUES (?, ?, ?, ?)",
+            (guid, BASIC_MODEL_ID, mod, duplicate_index.FIELD_SEPARATOR.join(fields[field['name']] for field in BASIC_FIELDS))
+        )
+        self.db.connection.execute("INSERT INTO cards (nid, did) VALUES (?, ?)", (cursor.lastrowid, deck_id))
+        return cursor.lastrowid
+
+
+@pytest.fixture
+def col(tmp_path):
+    return FakeCollection(str(tmp_path / "collection.anki2"))
+
+
+def test_note_guid_is_deterministic():
+    fields = {'Front': 'What do ribosomes make?', 'Back': 'Proteins'}
+
+    guid = duplicate_index.note_guid('Biology', 'Basic', fields)
+
+    assert guid == duplicate_index.note_guid('Biology', 'Basic', dict(reversed(list(fields.items()))))
+    assert guid == duplicate_index.note_guid('biology', 'BASIC', {'Front': ' What do  ribosomes make? ', 'Back': 'proteins'})
+    assert guid.startswith('n2f') and len(guid) == 19
+
+
+def test_note_guid_depends_on_deck_note_type_and_content():
+    fields = {'Front': 'What do ribosomes make?', 'Back': 'Proteins'}
+    guid = duplicate_index.note_guid('Biology', 'Basic', fields)
+
+    assert duplicate_index.note_guid('Chemistry', 'Basic', fields) != guid
+    assert duplicate_index.note_guid('Biology', 'Cloze', fields) != guid
+    assert duplicate_index.note_guid('Biology', 'Basic', dict(fields, Back='RNA')) != guid
+
+
+def test_available_note_guids_leaves_taken_guids_to_anki(col):
+    kept = {'Front': 'Q1', 'Back': 'A1'}
+    moved = {'Front': 'Q2', 'Back': 'A2'}
+    col.add_note(2, moved, guid=duplicate_index.note_guid('Biology', 'Basic', moved))
+
+    guids = duplicate_index.available_note_guids(col, 'Biology', 'Basic', [kept, moved])
+
+    assert guids == [duplicate_index.note_guid('Biology', 'Basic', kept), None]
+
+
+def test_deck_index_persists_across_runs(store, col):
+    col.add_note(1, {'Front': 'Q1', 'Back': 'A1'})
+    first_run = duplicate_index.load_deck_index(col, 1)
+    added = {'Front': 'Q2', 'Back': 'A2'}
+    col.add_note(1, added)
+    duplicate_index.record_added_notes(col, 1, [duplicate_index.content_hash(added)])
+    store.close_connection()
+
+    second_run = duplicate_index.load_deck_index(col, 1)
+
+    assert second_run == first_run | {duplicate_index.content_hash(added)}
+    assert col.db.deck_reads == 1
+
+
+def test_deck_index_is_rebuilt_after_notes_change_outside_the_addon(store, col):
+    note_id = col.add_note(1, {'Front': 'Q1', 'Back': 'A1'})
+    duplicate_index.load_deck_index(col, 1)
+    col.db.connection.execute("UPDATE notes SET flds = ?, mod = 2 WHERE id = ?",
+                              (duplicate_index.FIELD_SEPARATOR.join(['Q1', 'Edited']), note_id))
+
+    index = duplicate_index.load_deck_index(col, 1)
+
+    assert index == {duplicate_index.content_hash({'Front': 'Q1', 'Back': 'Edited'})}
+    assert col.db.deck_reads == 2
@@ -0,0 +1,118 @@
+"""Job queue ordering and state transitions against a temporary store."""
+import pytest
+
+from _addon_loader import load_addon_module
+
+job_queue = load_addon_module("job_queue")
+cancellation = load_addon_module("cancellation")
+
+
+@pytest.fixture(autouse=True)
+def empty_store(store):
+    return store
+
+
+def status_of(job_id):
+    return {job['id']: job['status'] for job in job_queue.list_jobs()}.get(job_id)
+
+
+def test_claim_next_job_takes_higher_priorities_first_then_the_oldest():
+    low = job_queue.enqueue_job("low.yml", {})
+    first_high = job_queue.enqueue_job("high.yml", {"n": 1}, priority=5)
+    second_high = job_queue.enqueue_job("high.yml", {"n": 2}, priority=5)
+    middle = job_queue.enqueue_job("middle.yml", {}, priority=1)
+
+    claimed = [job_queue.claim_next_job()['id'] for _ in range(4)]
+
+    assert claimed == [first_high, second_high, middle, low]
+    assert job_queue.claim_next_job() is None
+
+
+def test_claimed_jobs_are_running_with_their_inputs():
+    job_id = job_queue.enqueue_job("deck.yml", {"deck": "Biology"}, debug=True)
+
+    job = job_queue.claim_next_job()
+
+    assert (job['id'], job['status'], job['user_inputs'], job['debug']) == (job_id, job_queue.RUNNING, {"deck": "Biology"}, True)
+    assert status_of(job_id) == job_queue.RUNNING
+
+
+def test_requeue_interrupted_jobs_returns_running_jobs_to_the_queue():
+    interrupted = job_queue.enqueue_job("a.yml", {})
+    finished = job_queue.enqueue_job("b.yml", {})
+    job_queue.claim_next_job()
+    job_queue.claim_next_job()
+    job_queue.finish_job(finished, {"cards_added": 3})
+
+    assert job_queue.requeue_interrupted_jobs() == 1
+    assert status_of(interrupted) == job_queue.QUEUED
+    assert status_of(finished) == job_queue.DONE
+    assert job_queue.claim_next_job()['id'] == interrupted
+
+
+def test_only_failed_jobs_can_be_retried():
+    failed = job_queue.enqueue_job("a.yml", {})
+    done = job_queue.enqueue_job("b.yml", {})
+    job_queue.claim_next_job()
+    job_queue.claim_next_job()
+    job_queue.fail_job(failed, "API error")
+    job_queue.finish_job(done, {"cards_added": 1, "duplicates": 0, "cards": ["not stored"]})
+
+    assert job_queue.retry_job(failed)
+    assert not job_queue.retry_job(done)
+    jobs = {job['id']: job for job in job_queue.list_jobs()}
+    assert (jobs[failed]['status'], jobs[failed]['error']) == (job_queue.QUEUED, None)
+    assert jobs[done]['result'] == {"cards_added": 1, "duplicates": 0}
+
+
+def test_only_queued_jobs_can_be_cancelled():
+    running = job_queue.enqueue_job("a.yml", {}, priority=1)
+    queued = job_queue.enqueue_job("b.yml", {})
+    job_queue.claim_next_job()
+
+    assert not job_queue.cancel_job(running)
+    assert job_queue.cancel_job(queued)
+    assert [job['id'] for job in job_queue.list_jobs()] == [running]
+
+
+def test_clear_finished_jobs_keeps_unfinished_ones():
+    done, failed, queued = (job_queue.enqueue_job(f"{name}.yml", {}) for name in ("done", "failed", "queued"))
+    job_queue.claim_next_job()
+    job_queue.claim_next_job()
+    job_queue.finish_job(done, {})
+    job_queue.fail_job(failed, "error")
+
+    assert job_queue.clear_finished_jobs() == 2
+    assert [job['id'] for job in job_queue.list_jobs()] == [queued]
+    assert job_queue.has_unfinished_jobs()
+
+
+def run_one_job(run_job):
+    """Claim the next job and run it on this thread, as a runner's worker would."""
+    finished = []
+    runner = job_queue.JobRunner(run_job, on_job_finished=finished.append)
+    runner.execute(job_queue.claim_next_job())
+    return finished
+
+
+def test_runner_records_finished_and_failed_jobs():
+    succeeding = job_queue.enqueue_job("a.yml", {}, priority=1)
+    failing = job_queue.enqueue_job("b.yml", {})
+
+    run_one_job(lambda job, progress, before_stage, token: {"cards_added": 2})
+    finished = run_one_job(lambda job, progress, before_stage, token: 1 / 0)
+
+    assert status_of(succeeding) == job_queue.DONE
+    assert status_of(failing) == job_queue.FAILED
+    assert finished[0]['error'] == "division by zero"
+
+
+def test_runner_leaves_interrupted_jobs_to_be_requeued():
+    job_id = job_queue.enqueue_job("a.yml", {})
+
+    def interrupted(job, progress, before_stage, token):
+        raise cancellation.CancelledError()
+
+    assert run_one_job(interrupted) == []
+    assert status_of(job_id) == job_queue.RUNNING
+    assert job_queue.requeue_interrupted_jobs() == 1
@@ -0,0 +1,104 @@
+"""Step cache keys, stored outputs and how processing steps reuse them."""
+import pytest
+
+from _addon_loader import load_addon_module
+
+step_cache = load_addon_module("step_cache")
+
+CHUNK = "Ribosomes translate messenger RNA into proteins."
+SUMMARY_STEP = {'model': 'model-a', 'prompt': 'Summarize {notes}', 'output': 'summary'}
+CARDS_STEP = {'model': 'model-b', 'prompt': 'Make cards from {summary}', 'output': 'cards',
+              'output_fields': ['Front', 'Back']}
+
+
+def key_for(step, step_input, upstream):
+    return step_cache.step_cache_key(CHUNK, step, step_input, upstream)
+
+
+def test_editing_a_later_step_leaves_the_earlier_key_unchanged():
+    summary_key = key_for(SUMMARY_STEP, {'notes': CHUNK}, {})
+    edited_cards_step = dict(CARDS_STEP, prompt='Write cloze cards from {summary}')
+
+    assert key_for(SUMMARY_STEP, {'notes': CHUNK}, {}) == summary_key
+    assert (key_for(CARDS_STEP, {'summary': 'S'}, {'summary': 'S'})
+            != key_for(edited_cards_step, {'summary': 'S'}, {'summary': 'S'}))
+
+
+def test_a_changed_upstream_output_changes_the_downstream_key():
+    before = key_for(CARDS_STEP, {'summary': 'Ribosomes make proteins'}, {'summary': 'Ribosomes make proteins'})
+    after = key_for(CARDS_STEP, {'summary': 'Ribosomes read mRNA'}, {'summary': 'Ribosomes read mRNA'})
+
+    assert before != after
+
+
+def test_settings_outside_the_prompt_do_not_change_the_key():
+    renamed = dict(SUMMARY_STEP, step='Renamed step', chunk_size=1000, repair_attempts=5)
+
+    assert key_for(renamed, {'notes': CHUNK}, {}) == key_for(SUMMARY_STEP, {'notes': CHUNK}, {})
+
+
+def test_saved_outputs_round_trip_with_their_truncated_flag(store):
+    step_cache.save_step_output('complete', 'cards', 'model-b', [{'Front': 'Q', 'Back': 'A'}])
+    step_cache.save_step_output('cut-off', 'cards', 'model-b', [{'Front': 'Q', 'Back': 'A'}], truncated=True)
+
+    assert step_cache.load_step_output('complete') == {'value': [{'Front': 'Q', 'Back': 'A'}], 'truncated': False}
+    assert step_cache.load_step_output('cut-off') == {'value': [{'Front': 'Q', 'Back': 'A'}], 'truncated': True}
+    assert step_cache.load_step_output('missing') is None
+
+
+class FakeApi:
+    """Stands in for call_openrouter_api, recording which prompts were sent."""
+
+    def __init__(self, processing_utils):
+        self.processing_utils = processing_utils
+        self.prompts = []
+
+    def __call__(self, prompt, model, input_data, is_final_step, output_fields=None, *args):
+        self.prompts.append(prompt)
+        if not is_final_step:
+            return f"summary of {input_data['notes']}"
+        cards = self.processing_utils.CardList([{'Front': 'Q', 'Back': 'A'}])
+        cards.truncated = True
+        return cards
+
+
+@pytest.fixture
+def run_steps(store, monkeypatch):
+    """Run CHUNK through a list of steps with a fake API; returns the fake to inspect its calls."""
+    pytest.importorskip("requests")
+    processing_utils = load_addon_module("processing_utils")
+    process_notes_to_cards = load_addon_module("process_notes_to_cards")
+    api = FakeApi(processing_utils)
+    monkeypatch.setattr(process_notes_to_cards, "call_openrouter_api", api)
+    workflow_config = {'scrape_notes': [{'output': 'notes'}]}
+
+    def run(steps):
+        return process_notes_to_cards.process_chunk_through_steps(CHUNK, steps, {}, workflow_config)
+    run.api = api
+    return run
+
+
+def test_only_the_edited_step_and_the_steps_after_it_are_sent_again(run_steps):
+    run_steps([SUMMARY_STEP, CARDS_STEP])
+    edited_cards_step = dict(CARDS_STEP, prompt='Write cloze cards from {summary}')
+    output = run_steps([SUMMARY_STEP, edited_cards_step])
+
+    assert run_steps.api.prompts == [SUMMARY_STEP['prompt'], CARDS_STEP['prompt'], edited_cards_step['prompt']]
+    assert output['cards'] == [{'Front': 'Q', 'Back': 'A'}]
+
+
+def test_cached_final_output_keeps_its_truncated_flag(run_steps):
+    run_steps([SUMMARY_STEP, CARDS_STEP])
+    output = run_steps([SUMMARY_STEP, CARDS_STEP])
+
+    assert len(run_steps.api.prompts) == 2
+    assert output['cards'].truncated
+
+
+def test_steps_with_cache_disabled_are_always_sent(run_steps, store):
+    steps = [dict(SUMMARY_STEP, cache=False), dict(CARDS_STEP, cache=False)]
+    run_steps(steps)
+    run_steps(steps)
+
+    assert len(run_steps.api.prompts) == 4
+    assert store.get_connection().execute("SELECT COUNT(*) FROM step_cache").fetchone()[0] == 0
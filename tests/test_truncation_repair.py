@@ -0,0 +1,66 @@
+"""Parsing of cut-off replies and the tail guess for truncated responses."""
+import pytest
+
+pytest.importorskip("requests")
+
+from _addon_loader import load_addon_module
+
+processing_utils = load_addon_module("processing_utils")
+
+
+def test_parse_final_output_accepts_brackets_inside_card_values():
+    reply = '```json\n[{"Front": "What does [x] mean?", "Back": "A list [of one]"}]\n```'
+
+    items, complete = processing_utils.parse_final_output(reply)
+
+    assert items == [{"Front": "What does [x] mean?", "Back": "A list [of one]"}]
+    assert complete
+
+
+def test_parse_final_output_keeps_the_complete_cards_of_a_cut_off_reply():
+    reply = '[{"Front": "Q1", "Back": "A1"}, {"Front": "Q2", "Back": "A2"}, {"Front": "Q3", "Ba'
+
+    items, complete = processing_utils.parse_final_output(reply)
+
+    assert items == [{"Front": "Q1", "Back": "A1"}, {"Front": "Q2", "Back": "A2"}]
+    assert not complete
+
+
+def test_parse_final_output_does_not_treat_malformed_replies_as_truncated():
+    items, complete = processing_utils.parse_final_output('[{"Front": "Q1" "Back": "A1"}]')
+
+    assert items == []
+    assert complete
+
+
+def test_split_valid_cards_separates_items_missing_fields():
+    items = [{"Front": "Q1", "Back": "A1"}, {"Front": "Q2"}, "not a card"]
+
+    valid, invalid = processing_utils.split_valid_cards(items, ["Front", "Back"])
+
+    assert valid == [{"Front": "Q1", "Back": "A1"}]
+    assert invalid == [{"Front": "Q2"}, "not a card"]
+
+
+def test_find_unprocessed_tail_returns_the_blocks_after_the_last_card():
+    chunk = "\n\n".join([
+        "Mitochondria produce most of the cell's energy as ATP.",
+        "Ribosomes translate messenger RNA into proteins.",
+        "The Golgi apparatus packages proteins for secretion.",
+        "Lysosomes digest worn-out organelles and debris.",
+    ])
+    cards = [
+        {"Front": "What do mitochondria produce?", "Back": "Energy for the cell as ATP"},
+        {"Front": "What do ribosomes translate?", "Back": "Messenger RNA into proteins"},
+    ]
+
+    tail = processing_utils.find_unprocessed_tail(chunk, cards)
+
+    assert tail == "\n\n".join(chunk.split("\n\n")[2:])
+
+
+def test_find_unprocessed_tail_is_empty_when_the_last_block_was_reached():
+    chunk = "Ribosomes translate messenger RNA.\n\nLysosomes digest worn-out organelles."
+    cards = [{"Front": "What do lysosomes digest?", "Back": "Worn-out organelles"}]
+
+    assert processing_utils.find_unprocessed_tail(chunk, cards) == ""